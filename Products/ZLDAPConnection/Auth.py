@@ -0,0 +1,133 @@
+""" Verifying credentials: a small pool of connections used only for
+binding as users, and a short-lived memory of successful verifications
+"""
+import hashlib
+import hmac
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import ldap
+
+from .Cache import LRUCache
+from .DN import normalizeDN
+
+# Idle bind connections kept per server
+AUTH_POOL_SIZE = 4
+
+# Verified credentials remembered per server
+AUTH_CACHE_SIZE = 1000
+
+_pools = {}
+_verified = {}
+_lock = threading.Lock()
+
+
+class BindPool(object):
+    """ Connections to one server used to check passwords by binding with
+    them.  At most 'size' idle connections are kept; more are opened when
+    needed and closed after use. """
+
+    def __init__(self, initialize, size=AUTH_POOL_SIZE):
+        self.initialize = initialize
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        """ Yield a connection, returning it to the pool afterwards unless
+        it failed with something else than a refused bind """
+        with self._lock:
+            conn = self._idle and self._idle.pop() or None
+        if conn is None:
+            conn = self.initialize()
+        try:
+            yield conn
+        except (ldap.INVALID_CREDENTIALS, ldap.NO_SUCH_OBJECT,
+                ldap.UNWILLING_TO_PERFORM, ldap.INAPPROPRIATE_AUTH):
+            self._release(conn)
+            raise
+        except Exception:
+            self._discard(conn)
+            raise
+        else:
+            self._release(conn)
+
+    def _release(self, conn):
+        """ put conn back, or close it if the pool is full """
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        self._discard(conn)
+
+    def _discard(self, conn):
+        """ close conn """
+        try:
+            conn.unbind_s()
+        except Exception:
+            pass
+
+    def clear(self):
+        """ close the idle connections """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
+
+
+class VerifiedCredentials(object):
+    """ DN -> salted hash of the password it was last verified with and
+    the time that verification expires.  Passwords are never stored. """
+
+    def __init__(self, size=AUTH_CACHE_SIZE):
+        self._salt = os.urandom(16)
+        self._data = LRUCache(size)
+
+    def _digest(self, dn, password):
+        """ salted sha256 of dn and password """
+        if not isinstance(password, bytes):
+            password = password.encode('utf-8')
+        key = normalizeDN(dn).encode('utf-8')
+        return hashlib.sha256(self._salt + key + b'\0' + password).digest()
+
+    def verified(self, dn, password):
+        """ true if dn was verified with password and that has not
+        expired yet """
+        found = self._data.get(normalizeDN(dn))
+        return found is not None and found[1] > time.time() and \
+            hmac.compare_digest(found[0], self._digest(dn, password))
+
+    def remember(self, dn, password, ttl):
+        """ remember for ttl seconds that password is dn's """
+        self._data.set(normalizeDN(dn),
+                       (self._digest(dn, password), time.time() + ttl))
+
+    def forget(self, dn):
+        """ forget what was verified for dn (e.g. its password changed) """
+        self._data.pop(normalizeDN(dn))
+
+    def clear(self):
+        """ forget everything """
+        self._data.clear()
+
+
+def bindPool(key, initialize):
+    """ The BindPool for key (the server), creating it with initialize
+    (which returns a new unbound connection) the first time """
+    pool = _pools.get(key)
+    if pool is None:
+        with _lock:
+            pool = _pools.setdefault(key, BindPool(initialize))
+    return pool
+
+
+def verifiedCredentials(key):
+    """ The VerifiedCredentials for key (the server) """
+    verified = _verified.get(key)
+    if verified is None:
+        with _lock:
+            verified = _verified.setdefault(key, VerifiedCredentials())
+    return verified
@@ -0,0 +1,49 @@
+""" Backends
+
+Connections talk to the LDAP server at their host and port through
+python-ldap.  Another implementation of the LDAPObject API (see
+interfaces.ILDAPBackend), such as the in-memory directory of
+MemoryBackend, can be registered for a host and port instead.
+"""
+import threading
+
+import ldap
+
+_backends = {}
+_lock = threading.Lock()
+
+
+def registerBackend(host, port, factory):
+    """ Have connections to host:port get their LDAPObject by calling
+    factory() instead of ldap.initialize() """
+    with _lock:
+        _backends[(host, int(port))] = factory
+
+
+def unregisterBackend(host, port):
+    """ Talk to host:port through python-ldap again """
+    with _lock:
+        _backends.pop((host, int(port)), None)
+
+
+def backendFor(host, port):
+    """ The factory registered for host:port, or None """
+    try:
+        return _backends.get((host, int(port)))
+    except (TypeError, ValueError):
+        return None
+
+
+def initialize(host, port, make=ldap.initialize):
+    """ A new, unbound connection to host:port, made by make(uri): ldaps,
+    or plain ldap if the server does not speak it, unless another backend
+    is registered for host:port """
+    factory = backendFor(host, port)
+    if factory is not None:
+        return factory()
+    conn = make('ldaps://%s:%s' % (host, port))
+    try:
+        conn.whoami_s()
+    except ldap.SERVER_DOWN:
+        conn = make('ldap://%s:%s' % (host, port))
+    return conn
@@ -0,0 +1,162 @@
+""" Serving binary attribute values (photos, certificates, ...)
+"""
+import hashlib
+import threading
+import time
+
+from .Cache import ByteBudgetCache
+from .DN import normalizeDN
+
+# Bytes of binary values kept per server
+BINARY_CACHE_BUDGET = 32 * 1024 * 1024
+
+JPEG_SYNTAX = '1.3.6.1.4.1.1466.115.121.1.28'
+
+_MAGIC = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'%PDF-', 'application/pdf'),
+)
+
+# Seconds a cached value is served at most, as changes made by other
+# clients of the server are not seen
+BINARY_CACHE_TTL = 300
+
+_caches = {}
+_lock = threading.Lock()
+
+
+class BinaryCache(object):
+    """ The binary values read from a server, (values, version) per entry
+    and attribute, within a byte budget and for up to BINARY_CACHE_TTL
+    seconds.  Writes made through the connections invalidate the entries
+    they touch; what was read before an invalidation is not cached after
+    it: readers pass the generation() they started in. """
+
+    def __init__(self, budget=BINARY_CACHE_BUDGET, ttl=BINARY_CACHE_TTL):
+        self.ttl = ttl
+        self._data = ByteBudgetCache(budget)  # normalized DN -> values
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def generation(self):
+        """ changes with every invalidation """
+        return self._generation
+
+    def get(self, dn, attr):
+        """ the cached (values, version) of attr of dn, or None """
+        found = self._data.get(normalizeDN(dn), {}).get(attr.lower())
+        if found is not None and found[1] + self.ttl > time.time():
+            return found[0]
+        return None
+
+    def set(self, dn, attr, result, generation):
+        """ cache result, the (values, version) of attr of dn read in
+        generation """
+        key = normalizeDN(dn)
+        with self._lock:
+            if generation != self._generation:
+                return
+            attrs = dict(self._data.get(key, {}))
+            attrs[attr.lower()] = (result, time.time())
+            size = sum([len(v) for found in attrs.values()
+                        for v in found[0][0]])
+            self._data.set(key, attrs, size)
+
+    def invalidate(self, dn):
+        """ forget the values of dn """
+        with self._lock:
+            self._generation += 1
+            self._data.pop(normalizeDN(dn))
+
+    def clear(self):
+        """ forget everything """
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+
+def binaryCache(key):
+    """ The BinaryCache for key (the server) """
+    cache = _caches.get(key)
+    if cache is None:
+        with _lock:
+            cache = _caches.setdefault(key, BinaryCache())
+    return cache
+
+
+def contentType(info, data):
+    """ The content type of binary value data, of an attribute described
+    by the AttributeInfo info (which may be None) """
+    if info is not None and info.syntax == JPEG_SYNTAX:
+        return 'image/jpeg'
+    for magic, content_type in _MAGIC:
+        if data.startswith(magic):
+            return content_type
+    return 'application/octet-stream'
+
+
+def makeETag(version, attr, index):
+    """ An entity tag for value index of attr at the entry revision
+    version, or None if the revision is unknown """
+    if not version:
+        return None
+    tag = '%s\0%s\0%s' % (version, attr.lower(), index)
+    return '"%s"' % hashlib.md5(tag.encode('utf-8')).hexdigest()
+
+
+def parseRange(header, length):
+    """ (start, end) of a single 'bytes=' range header, None to send the
+    whole value, or False if the range cannot be satisfied """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _sep, last = header[6:].strip().partition('-')
+    try:
+        if not first:
+            # suffix range: the last N bytes
+            start, end = max(length - int(last), 0), length - 1
+        else:
+            start = int(first)
+            if last:
+                end = min(int(last), length - 1)
+            else:
+                end = length - 1
+    except ValueError:
+        return None
+    if start > end or start >= length:
+        return False
+    return start, end
+
+
+def serveBinary(REQUEST, RESPONSE, data, content_type, etag=None):
+    """ Publish data, honouring If-None-Match, Range and If-Range """
+    RESPONSE.setHeader('Content-Type', content_type)
+    RESPONSE.setHeader('Accept-Ranges', 'bytes')
+    if etag:
+        RESPONSE.setHeader('ETag', etag)
+        match = REQUEST.get_header('If-None-Match')
+        if match and (match.strip() == '*' or
+                      etag in [t.strip() for t in match.split(',')]):
+            RESPONSE.setStatus(304)
+            return b''
+
+    length = len(data)
+    byterange = parseRange(REQUEST.get_header('Range'), length)
+    if_range = REQUEST.get_header('If-Range')
+    if byterange is not None and if_range and if_range.strip() != etag:
+        byterange = None                # changed since: send it all
+    if byterange is False:
+        RESPONSE.setStatus(416)
+        RESPONSE.setHeader('Content-Range', 'bytes */%s' % length)
+        return b''
+    if byterange:
+        start, end = byterange
+        RESPONSE.setStatus(206)
+        RESPONSE.setHeader('Content-Range',
+                           'bytes %s-%s/%s' % (start, end, length))
+        RESPONSE.setHeader('Content-Length', str(end - start + 1))
+        return data[start:end + 1]
+    RESPONSE.setHeader('Content-Length', str(length))
+    return data
@@ -0,0 +1,216 @@
+""" Bulk LDIF import and subtree export
+"""
+import base64
+import collections
+import json
+import ldap
+import ldap.modlist
+import ldif
+
+from .DN import normalizeDN, parentDN
+
+DEFAULT_WINDOW = 32
+DEFAULT_PAGE_SIZE = 500
+
+
+def errorMessage(exc):
+    """ A readable message for an LDAP exception """
+    info = exc.args[0] if exc.args else None
+    if isinstance(info, dict):
+        desc = info.get('desc', '')
+        if info.get('info'):
+            desc = '%s (%s)' % (desc, info['info'])
+        return desc or exc.__class__.__name__
+    return str(exc) or exc.__class__.__name__
+
+
+class LDIFImporter(ldif.LDIFParser):
+    """ Streams the entry records of an LDIF file to the server.
+
+    Records are read one at a time and sent with the asynchronous
+    add_ext(), keeping at most 'window' operations in flight.  A record
+    whose parent is still in flight waits for it; a record whose parent
+    does not exist yet is parked until the parent shows up later in the
+    file.  Children of a failed record fail too.  With 'update' set,
+    records that already exist are replaced attribute by attribute.
+
+    After run(), 'added', 'modified' and 'failures' (a list of
+    (record number, dn, message) tuples) describe the outcome.
+
+    Requests go through 'call', called as call(op, dn, method, *args)
+    like ZLDAPConnection._call(), so that each add and modify is recorded
+    as an operation; by default the methods of ldapobj are called.
+    """
+
+    def __init__(self, ldapobj, input_file, window=DEFAULT_WINDOW,
+                 update=0, call=None):
+        ldif.LDIFParser.__init__(self, input_file)
+        self._ldap = ldapobj
+        self._call = call or self._direct
+        self.window = max(int(window or 1), 1)
+        self.update = update
+        self.added = 0
+        self.modified = 0
+        self.failures = []
+        self._inflight = collections.OrderedDict()  # msgid -> record
+        self._inflightKeys = {}     # key -> msgid
+        self._parked = {}           # parent key -> [record, ...]
+        self._failedKeys = set()
+        self._retry = collections.deque()
+
+    def run(self):
+        """ Import the whole file and return self """
+        try:
+            self.parse()
+        except ValueError as exc:
+            # malformed LDIF: stop reading, but settle what was sent
+            self._fail(self.records_read + 1, '', None, str(exc))
+        while self._inflight or self._retry:
+            while self._retry:
+                self._submit(self._retry.popleft())
+            if self._inflight:
+                self._drainOne()
+        for records in self._parked.values():
+            for recno, dn, _key, _entry, _op in records:
+                self._fail(recno, dn, None, 'parent entry does not exist')
+        self._parked = {}
+        return self
+
+    def _direct(self, op, dn, method, *args):
+        """ call method of our LDAPObject with args """
+        return getattr(self._ldap, method)(*args)
+
+    # LDIFParser callback
+    def handle(self, dn, entry):
+        """ Called by the parser for each entry record """
+        record = (self.records_read + 1, dn, normalizeDN(dn), entry, 'add')
+        self._submit(record)
+        while self._retry:
+            self._submit(self._retry.popleft())
+
+    def _submit(self, record):
+        """ Send record, once its parent is settled and there is room in
+        the window """
+        recno, dn, key, entry, op = record
+        parent = parentDN(key)
+        while parent in self._inflightKeys:
+            self._drainOne()
+        if parent in self._failedKeys:
+            self._fail(recno, dn, key, 'parent entry failed')
+            return
+        while len(self._inflight) >= self.window:
+            self._drainOne()
+        try:
+            if op == 'add':
+                msgid = self._call(None, dn, 'add_ext', dn,
+                                   ldap.modlist.addModlist(entry))
+            else:
+                modlist = [(ldap.MOD_REPLACE, attr, values)
+                           for attr, values in entry.items()]
+                msgid = self._call(None, dn, 'modify_ext', dn, modlist)
+        except ldap.LDAPError as exc:
+            self._fail(recno, dn, key, errorMessage(exc))
+            return
+        self._inflight[msgid] = record
+        self._inflightKeys[key] = msgid
+
+    def _drainOne(self):
+        """ Wait for the oldest operation in flight """
+        msgid, record = self._inflight.popitem(last=False)
+        recno, dn, key, entry, op = record
+        del self._inflightKeys[key]
+        try:
+            self._call(op, dn, 'result3', msgid)
+        except ldap.ALREADY_EXISTS as exc:
+            if self.update and op == 'add':
+                self._retry.append((recno, dn, key, entry, 'modify'))
+            else:
+                self._fail(recno, dn, key, errorMessage(exc))
+            return
+        except ldap.NO_SUCH_OBJECT as exc:
+            if op == 'add':
+                # the parent may still come later in the file
+                self._parked.setdefault(parentDN(key), []).append(record)
+            else:
+                self._fail(recno, dn, key, errorMessage(exc))
+            return
+        except ldap.LDAPError as exc:
+            self._fail(recno, dn, key, errorMessage(exc))
+            return
+
+        if op == 'add':
+            self.added += 1
+        else:
+            self.modified += 1
+        self._retry.extend(self._parked.pop(key, ()))
+
+    def _fail(self, recno, dn, key, message):
+        """ Record the failure of a record (and so of its children) """
+        self.failures.append((recno, dn, message))
+        if key is not None:
+            self._failedKeys.add(key)
+            for child in self._parked.pop(key, ()):
+                self._fail(child[0], child[1], child[2],
+                           'parent entry failed')
+
+
+# Export
+class ResponseWriter(object):
+    """ File-like adapter buffering text into utf-8 chunks of about
+    'chunksize' bytes for RESPONSE.write() """
+
+    def __init__(self, response, chunksize=65536):
+        self._response = response
+        self._chunksize = chunksize
+        self._buffer = []
+        self._size = 0
+
+    def write(self, data):
+        """write."""
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        self._buffer.append(data)
+        self._size += len(data)
+        if self._size >= self._chunksize:
+            self.flush()
+
+    def flush(self):
+        """flush."""
+        if self._buffer:
+            self._response.write(b''.join(self._buffer))
+            self._buffer = []
+            self._size = 0
+
+
+def writeLDIF(records, out):
+    """ Write (dn, attrs) records to out as LDIF, returning their count """
+    writer = ldif.LDIFWriter(out)
+    for dn, attrs in records:
+        writer.unparse(dn, attrs)
+    return writer.records_written
+
+
+def writeJSONLines(records, out):
+    """ Write (dn, attrs) records to out as one JSON object per line,
+    returning their count.  Values that are not valid UTF-8 are base64
+    encoded under the attribute name suffixed with ';base64'. """
+    count = 0
+    for dn, attrs in records:
+        data = {}
+        for attr, values in attrs.items():
+            try:
+                data[attr] = [v.decode('utf-8') if isinstance(v, bytes)
+                              else v for v in values]
+            except UnicodeDecodeError:
+                data[attr + ';base64'] = [
+                    base64.b64encode(v).decode('ascii') for v in values]
+        out.write(json.dumps({'dn': dn, 'attributes': data}) + '\n')
+        count += 1
+    return count
+
+
+EXPORT_FORMATS = {
+    # format: (writer, content type, file extension)
+    'ldif': (writeLDIF, 'text/plain; charset=utf-8', 'ldif'),
+    'jsonl': (writeJSONLines, 'application/x-ndjson', 'jsonl'),
+}
@@ -0,0 +1,99 @@
+""" Caches
+"""
+import threading
+from collections import OrderedDict
+
+_marker = object()
+
+
+class LRUCache(object):
+    """ A thread-safe mapping holding at most 'maxsize' items, dropping
+    the least recently used ones first """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """ Return the value for key, marking it as recently used """
+        with self._lock:
+            value = self._data.pop(key, _marker)
+            if value is _marker:
+                return default
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        """ Store value for key, evicting the oldest items if full """
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """ Remove key, returning its value """
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        """ Remove everything """
+        with self._lock:
+            self._data.clear()
+
+
+class ByteBudgetCache(object):
+    """ A thread-safe LRU mapping of byte strings (or sequences of them)
+    holding at most 'budget' bytes of values in total """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.size = 0
+        self._data = OrderedDict()      # key -> (value, size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """ Return the value for key, marking it as recently used """
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return default
+            self._data[key] = item
+            return item[0]
+
+    def set(self, key, value, size):
+        """ Store value, which takes size bytes, for key; values larger
+        than the whole budget are not kept """
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            if size > self.budget:
+                return
+            self._data[key] = (value, size)
+            self.size += size
+            while self.size > self.budget:
+                _key, (_value, oldsize) = self._data.popitem(last=False)
+                self.size -= oldsize
+
+    def pop(self, key, default=None):
+        """ Remove key, returning its value """
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return default
+            self.size -= item[1]
+            return item[0]
+
+    def clear(self):
+        """ Remove everything """
+        with self._lock:
+            self._data.clear()
+            self.size = 0
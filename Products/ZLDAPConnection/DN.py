@@ -0,0 +1,101 @@
+""" Distinguished Name helpers
+
+DNs are parsed once into DN objects, memoized in a process-wide LRU cache,
+and compared through their normalized 'key': attribute types and values
+are case-folded and insignificant whitespace is dropped, so that
+'CN=Bob,  ou=X' and 'cn=bob,ou=x' have the same key.
+
+This is a simplification of the server's DN matching: the equality rule
+of the naming attributes is not looked up in the schema, every value is
+compared as with caseIgnoreMatch.  That is what the usual naming
+attributes (cn, uid, ou, dc, ...) use; siblings whose RDN values differ
+only in case (a caseExactMatch naming attribute) would share one key.
+Keys do not depend on the server so that they stay the same before and
+after its schema is read.
+"""
+import ldap
+import ldap.dn
+
+from .Cache import LRUCache
+
+DN_CACHE_SIZE = 10000
+
+_parsed = LRUCache(DN_CACHE_SIZE)
+
+
+class DN(object):
+    """ A parsed DN; 'key' compares every RDN value ignoring case """
+
+    __slots__ = ('dn', 'key', 'id', 'parent')
+
+    def __init__(self, dn):
+        self.dn = dn
+        try:
+            rdns = ldap.dn.str2dn(dn)
+        except ldap.DECODING_ERROR:
+            # not a valid DN: treat it as an opaque, single RDN string
+            self.key = ' '.join(dn.lower().split())
+            self.id = dn.strip()
+            self.parent = ''
+            return
+        normalized = [
+            [(attr.lower(), ' '.join(value.lower().split()), flags)
+             for attr, value, flags in rdn]
+            for rdn in rdns
+        ]
+        self.key = ldap.dn.dn2str(normalized)
+        self.id = rdns and ldap.dn.dn2str(rdns[:1]) or ''
+        self.parent = ldap.dn.dn2str(normalized[1:])
+
+    def __repr__(self):
+        return '<DN %s>' % self.dn
+
+    def __eq__(self, other):
+        if isinstance(other, DN):
+            return self.key == other.key
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, DN):
+            return self.key != other.key
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.key)
+
+
+def parseDN(dn):
+    """ Return the (memoized) DN object for the string dn """
+    parsed = _parsed.get(dn)
+    if parsed is None:
+        parsed = DN(dn)
+        _parsed.set(dn, parsed)
+    return parsed
+
+
+def normalizeDN(dn):
+    """ Return the normalized key of dn """
+    return parseDN(dn).key
+
+
+def parentDN(dn):
+    """ Return the normalized key of dn's parent ('' for a single RDN) """
+    return parseDN(dn).parent
+
+
+def isBelow(dn, base):
+    """ Return true if dn is base or an entry below it (every DN is below
+    the empty base) """
+    basekey = normalizeDN(base)
+    key = normalizeDN(dn)
+    while key:
+        if key == basekey:
+            return True
+        key = parentDN(key)
+    return not basekey
+
+
+def splitRDN(rdn):
+    """ Split a single-valued RDN such as 'cn=Bob' into ('cn', 'Bob') """
+    attr, value, _flags = ldap.dn.str2dn(rdn.strip())[0][0]
+    return attr, value
@@ -2,21 +2,31 @@
 """
 # pylint: disable=too-many-instance-attributes,dangerous-default-value
 # pylint: disable=too-many-function-args
-import string
 from six.moves import filter
-from six.moves import map
 import six.moves.urllib.request
 import six.moves.urllib.parse
 import six.moves.urllib.error
-from transaction import commit
 import Acquisition
+from AccessControl.class_init import InitializeClass
 from OFS.SimpleItem import Item
 from App.Dialogs import MessageDialog
 from App.special_dtml import HTMLFile
+from zExceptions import Forbidden, NotFound
 import ldap
+import ldap.filter
+
+from .Binary import contentType, makeETag, serveBinary
+from .DN import parseDN, splitRDN
+from .Schema import isSecret
 
 ConnectionError = 'ZLDAP Connection Error'
 
+# Operational attributes identifying the revision of an entry, in order of
+# preference.  They are requested along with the user attributes and kept
+# out of _data.
+VERSION_ATTRS = ('entryCSN', 'modifyTimestamp')
+_VERSION_KEYS = dict([(a.lower(), a) for a in VERSION_ATTRS])
+
 
 def isNotBlank(s):
     '''test for non-blank strings'''
@@ -24,11 +34,49 @@ def isNotBlank(s):
         return 0
     return 1
 
-# class AttrWrap(UserList.UserList):
-#    """simple attr-wrapper for LDAP attributes"""
-#    import Userlist
-#    def __str__(self):
-#        return string.join(self.data,', ')
+
+def popVersion(attrs):
+    """ Remove the revision attributes (VERSION_ATTRS) from attrs and
+    return an assertion filter matching that revision, or None """
+    found = {}
+    for attr in list(attrs.keys()):
+        name = _VERSION_KEYS.get(attr.lower())
+        if name is not None:
+            found[name] = attrs.pop(attr)
+    for name in VERSION_ATTRS:
+        values = found.get(name)
+        if values:
+            value = values[0]
+            if isinstance(value, bytes):
+                value = value.decode('utf-8')
+            return '(%s=%s)' % (name, ldap.filter.escape_filter_chars(value))
+    return None
+
+
+class AttrWrap(tuple):
+    """ The values of an LDAP attribute.  Immutable, so they can be handed
+    out without copying; str() gives a comma separated list. """
+    __slots__ = ()
+    __allow_access_to_unprotected_subobjects__ = 1
+
+    def __str__(self):
+        return ', '.join([v.decode('utf-8', 'replace')
+                          if isinstance(v, bytes) else v for v in self])
+
+    @classmethod
+    def wrap(cls, value):
+        """ AttrWrap for value, a sequence or a single value """
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, (six.string_types, bytes)):
+            return cls((value,))
+        return cls(value)
+
+
+def wrapAttrs(attrs):
+    """ attrs with all values turned into AttrWraps """
+    return dict([(attr, AttrWrap.wrap(values))
+                 for attr, values in attrs.items()])
 
 
 class GenericEntry(Acquisition.Implicit):
@@ -37,7 +85,7 @@ class GenericEntry(Acquisition.Implicit):
     """
     __ac_permissions__ = (
         ('Access contents information',
-         ('get',), ('Anonymous',),),
+         ('get', 'getBinary'), ('Anonymous',),),
         ('Manage Entry information',
          ('set', 'setattrs', 'setAll', 'remove',),),
         ('Create New Entry Objects',
@@ -48,8 +96,12 @@ class GenericEntry(Acquisition.Implicit):
 
     __name__ = "GenericEntry"
 
+    _isNew = 0
+    _version = None                     # assertion filter for our revision
+    _items = None                       # cached attributesMap()
+
     def __init__(self, dn, attrs=None, connection=None, isNew=0):
-        self.id = ldap.explode_dn(dn)[0]  # Split the DN into a list.
+        self.id = parseDN(dn).id          # Our first RDN
         self.dn = dn                    # Our actually unique ID in tree
         self.__connection = None
 
@@ -60,7 +112,8 @@ class GenericEntry(Acquisition.Implicit):
         elif attrs and connection is not None:
             # Attributes were passed in, so we don't need to go to our
             # connection to retrieve them
-            self._data = attrs
+            self._version = popVersion(attrs)
+            self._data = wrapAttrs(attrs)
             self.__connection = connection
         else:
             # We're totally blank and disconnected
@@ -70,7 +123,7 @@ class GenericEntry(Acquisition.Implicit):
         if isNew:
             pass                        # X X X need to handle creation here
         self._isDeleted = 0             # Deletion flag
-        self.__subentries = {}          # subentries
+        self._clearSubentries()         # subentries
         self._mod_delete = []
 
     def _init(self, connection):
@@ -80,16 +133,23 @@ class GenericEntry(Acquisition.Implicit):
         """
         self.__connection = connection
         if not self._isNew:
-            self._data = connection.getAttributes(self.dn)
+            self._load()
         else:
             self._data = {}
 
+    def _load(self):
+        """ (Re)read our attributes and their revision from the server """
+        attrs = dict(self._connection().getRawEntry(self.dn)[1])
+        self._version = popVersion(attrs)
+        self._data = wrapAttrs(attrs)
+        self._items = None
+
     def _reset(self):
         """_reset."""
         if self._isNew:
             self._data = {}
         else:
-            self._data = self._connection().getAttributes(self.dn)
+            self._load()
 
     def __repr__(self):
         r = "<Entry instance at %s; %s>" % (id(self), self.dn)
@@ -98,10 +158,10 @@ class GenericEntry(Acquisition.Implicit):
     # Subentry and Attribute Access Machinery ##########
     def __getitem__(self, key):
         """getitem is used to get sub-entries, not attributes"""
-        if self.__subentries:
-            se = self._subentries()
-            if key in se:
-                return se[key]
+        if self.__subentries or self.__records is not None:
+            entry = self._subentry(key)
+            if entry is not None:
+                return entry
         key = '%s, %s' % (six.moves.urllib.parse.unquote(key), self.dn)
         conn = self._connection()
         if conn.hasEntry(key):
@@ -110,22 +170,42 @@ class GenericEntry(Acquisition.Implicit):
             raise IndexError(key)
 
     def __getattr__(self, attr):
+        if attr == '_data':
+            # dropped by a rollback, read it again on first use
+            self._load()
+            return self._data
         if attr in self._data:
-            return list(self._data[attr])
+            return self._data[attr]
+        elif not attr.startswith('_') and self._isBinary(attr):
+            return self._connection().getBinaryAttribute(self.dn, attr)[0]
         else:
             raise AttributeError(attr)
 
     # Direct access for setting/getting/unsetting attributes
     def get(self, attr):
-        """get.
-
-        :param attr:
-        """
+        """ The values of attr, as a (new) Python list """
         if attr in self._data:
-            return self._data[attr]
+            return list(self._data[attr])
+        elif self._isBinary(attr):
+            return self.getBinary(attr)
         else:
             raise AttributeError(attr)
 
+    def getBinary(self, attr):
+        """ The values of the binary attribute attr, as a Python list.
+        Binary attributes are not read along with the others; they are
+        fetched (and cached) when asked for. """
+        return list(self._connection().getBinaryAttribute(self.dn, attr)[0])
+
+    def _isBinary(self, attr):
+        """ true if attr is a binary attribute left on the server """
+        if self._isNew:
+            return False
+        try:
+            return self._connection().getSchema().isBinary(attr)
+        except Exception:
+            return False
+
     def set(self, key, value):
         """ Sets individual items """
         self.setattrs({key: value})
@@ -133,19 +213,21 @@ class GenericEntry(Acquisition.Implicit):
     def setattrs(self, kwdict={}, **kw):
         """ Sets one or more attributes on the entry object, taking in
         both a dictionary AND/OR keywork arguments """
-        kwdict.update(kw)
+        kwdict = dict(kwdict, **kw)
         data = self._data
         for attr, value in kwdict.items():
-            if isinstance(value, str):
-                value = [value]
-            data[attr] = value
+            data[attr] = kwdict[attr] = AttrWrap.wrap(value)
+        self._items = None
 
-        self._modify()
+        # Queued on the connection, which merges it with any other change
+        # to this DN (sent right away unless a batch is open)
+        self._connection()._queueModify(self, kwdict)
+        self._clearSubentries()
 
     def setAll(self, kwdict={}, **kw):
         """ The dictionary/keywords passed in become ALL of the new
         attributes for the Entry (old data is lost) """
-        kwdict.update(kw)               # Merge passed in dict with keywords
+        kwdict = dict(kwdict, **kw)     # Merge passed in dict with keywords
         self._data = {}                 # Clear our Entry attributes
         self.setattrs(kwdict)           # And call self.setattrs to do the work
 
@@ -155,29 +237,26 @@ class GenericEntry(Acquisition.Implicit):
             attr = (attr,)
 
         data = self._data
-        mod_d = self._mod_delete
+        removed = []
         for item in attr:
             if item in data:
-                del data[attr]
-                mod_d.append(attr)
+                del data[item]
+                removed.append(item)
+        self._items = None
 
-        self._modify()                  # Send the changes to LDAP
+        # Send the changes to LDAP
+        self._connection()._queueModify(self, deleted=removed)
+        self._clearSubentries()
 
     # These methods actually change the object.  In the Generic Model,
     # a .set calls this directly, while in the TransactionalModel this
     # gets called by the Transaction system at commit time.
     def _modify(self):
-        """_modify."""
-        modlist = []
-
-        for attribute, values in self._data.items():
-            modlist.append((ldap.MOD_REPLACE, attribute, values))
-            for del_attribute in self._mod_delete:
-                modlist.append((ldap.MOD_DELETE, del_attribute, None))
-
-        self._connection()._modifyEntry(self.dn, modlist)
+        """ Queue all of our attributes (and pending deletions) on the
+        connection """
+        self._connection()._queueModify(self, self._data, self._mod_delete)
         self._mod_delete = []
-        self.__subentries = {}
+        self._clearSubentries()
 
     # Get the ZLDAPConnection object.
     def _connection(self):
@@ -195,21 +274,44 @@ class GenericEntry(Acquisition.Implicit):
         self.__connection = connection
 
     # Subentries
-    def _subentries(self):
-        """_subentries."""
-        if not self.__subentries:
-            # self.__subentries is empty, look up our subentries
-            # in the connection object and then set self.__subentries
+    # The subentries are listed as lightweight LDAPRecords; each one only
+    # becomes an Entry object when it is asked for.
+    __records = None
+
+    def _subrecords(self):
+        """ id -> LDAPRecord of our subentries, looked up once """
+        if self.__records is None:
             r = {}
-            se = self._connection().getSubEntries(self.dn, self)
-            for subentry in se:
-                r[subentry.id] = subentry
-            self.__subentries = r
+            for record in self._connection().getSubRecords(self.dn):
+                r[record.id] = record
+            self.__records = r
+        return self.__records
+
+    def _subentry(self, entryid):
+        """ The subentry entryid as an Entry object, or None """
+        entry = self.__subentries.get(entryid)
+        if entry is None:
+            record = self._subrecords().get(entryid)
+            if record is not None:
+                entry = record.getObject(self)
+                self.__subentries[entryid] = entry
+        return entry
 
+    def _subentryIds(self):
+        """ The ids of our subentries, without building Entry objects """
+        ids = list(self._subrecords().keys())
+        ids.extend([i for i in self.__subentries if i not in self.__records])
+        return ids
+
+    def _subentries(self):
+        """ id -> Entry object of all our subentries """
+        for entryid in self._subentryIds():
+            self._subentry(entryid)
         return self.__subentries
 
     def _clearSubentries(self):
         """_clearSubentries."""
+        self.__records = None
         self.__subentries = {}
 
     def _setSubentry(self, entryid, entry):
@@ -225,15 +327,15 @@ class GenericEntry(Acquisition.Implicit):
 
         :param entryid:
         """
-        subs = self.__subentries
-        if entryid in subs:
-            del self.__subentries[entryid]
+        self.__subentries.pop(entryid, None)
+        if self.__records is not None:
+            self.__records.pop(entryid, None)
 
     # Deleting Subentries
     def _beforeDelete(self, **ignored):
         """ Go through all the subentries and delete them too """
         conn = self._connection()
-        for entry in self._subentries().values():
+        for entry in list(self._subentries().values()):
             entry._beforeDelete()
             conn._deleteEntry(entry.dn)  # Delete from the server
             self._delSubentry(entry.id)  # Delete our own reference
@@ -266,17 +368,17 @@ class GenericEntry(Acquisition.Implicit):
 
         # Create the full new DN (Distinguished Name) for the new subentry
         # and verify that it doesn't already exist
-        dn = "%s,%s" % (string.strip(rdn), self.dn)
+        dn = "%s,%s" % (rdn.strip(), self.dn)
         if conn.hasEntry(dn):           # Check the LDAP server directly
             raise KeyError("DN '%s' already exists" % dn)
 
         # Now split out the first attr based on the RDN (ie 'cn=bob') and
         # turn it into one of our attributes (ie attr[cn] = 'bob')
-        key, value = list(map(string.strip, string.split(rdn, '=')))
+        key, value = splitRDN(rdn)
         attrs[key] = value
 
         # If the objectclass is not already set in the attrs, set it now
-        if 'objectclass' not in attrs:
+        if 'objectclass' not in [a.lower() for a in attrs]:
             attrs['objectclass'] = ['top']
 
         # Instantiate the instance based on the connections EntryFactory
@@ -297,7 +399,7 @@ class GenericEntry(Acquisition.Implicit):
             self._delete(entry)         # Delete by Entry object itself
 
 
-class TransactionalEntry(Acquisition.Implicit):
+class TransactionalEntry(GenericEntry):
     """\
     The TransactionalEntry class holds all the LDAP-Entry specific information,
     registers itself with the transaction manager, etc.  It's faceless.
@@ -305,18 +407,25 @@ class TransactionalEntry(Acquisition.Implicit):
     """
     __name__ = "TransactionalEntry"
 
+    # Declared in full rather than inherited from GenericEntry: get, set,
+    # setAll and deleteSubentry are new here (they used to be missing),
+    # and are meant to be protected as for non-transactional entries.
     __ac_permissions__ = (
+        ('Access contents information',
+         ('get', 'getBinary'), ('Anonymous',),),
         ('Manage Entry information',
-         ('undelete', 'setattrs', 'remove'),),
+         ('set', 'setattrs', 'setAll', 'remove', 'undelete'),),
         ('Create New Entry Objects',
          ('addSubentry',),),
+        ('Delete Entry Objects',
+         ('deleteSubentry',),),
     )
 
     # denotes if we've registered with the transaction manager
     _registered = None
 
     def __init__(self, dn, attrs=None, connection=None, isNew=0):
-        self.id = ldap.explode_dn(dn)[0]  # split the DN into a list.
+        self.id = parseDN(dn).id          # our first RDN
         self.dn = dn                      # Our actually unique ID in tree
         self._p_jar = None                # actually, the connection
         self._setConnection(None)
@@ -324,15 +433,15 @@ class TransactionalEntry(Acquisition.Implicit):
         if attrs is None and connection is not None:
             self._init(connection)
         elif attrs and connection is not None:
-            self._data = attrs
+            self._version = popVersion(attrs)
+            self._data = wrapAttrs(attrs)
             self._p_jar = connection
             self._setConnection(connection)
         else:
             self._data = {}
         self._isNew = isNew
         if isNew:
-            commit()
-            self._registered = 1
+            self._register()
         self._isDeleted = 0               # deletion flag
         self._clearSubentries()
         self._mod_delete = []
@@ -346,16 +455,16 @@ class TransactionalEntry(Acquisition.Implicit):
         transaction machinery.  Data is not committed to LDAP when this
         is called.
         """
-        if not self._registered:
-            commit()
-            self._registered = 1
+        self._register()
 
-        kwdict.update(kw)
+        kwdict = dict(kwdict, **kw)
         data = self._data
         for attr, value in kwdict.items():
-            if isinstance(value, str):
-                value = [value]
-            data[attr] = value
+            data[attr] = kwdict[attr] = AttrWrap.wrap(value)
+        self._items = None
+
+        if not self._isNew:
+            self._connection()._queueModify(self, kwdict)
 
     # We override _remove (previously '_unSet') here because we don't call
     # self._modify() (the transaction manager will)
@@ -363,46 +472,55 @@ class TransactionalEntry(Acquisition.Implicit):
         """\
         Unset (delete) an attribute
         """
-        if not self._registered:
-            commit()
-            self._registered = 1
+        self._register()
 
         if isinstance(attr, str):
             attr = (attr,)
 
         data = self._data
-        mod_d = self._mod_delete
+        removed = []
         for item in attr:
             if item in data:
                 del data[item]
-                mod_d.append(item)
+                removed.append(item)
+        self._items = None
+
+        if not self._isNew:
+            self._connection()._queueModify(self, deleted=removed)
 
     # Transaction Related methods
+    def _register(self):
+        """ Register with the transaction machinery (through our
+        connection, which keeps one registration list per DN) """
+        if not self._registered:
+            self._connection()._registerEntry(self)
+            self._registered = 1
+
     def _reset(self):
         """_reset."""
         self._rollback()
 
     def _rollback(self):
-        """_rollback."""
-        conn = self._connection()
+        """ Drop our local changes.  Our attributes are only read again
+        from the server if they are used after the rollback. """
         if not self._isNew:
-            self._data = conn.getAttributes(self.dn)
-            self._clear_subentries = {}
+            Acquisition.aq_base(self).__dict__.pop('_data', None)
+            self._version = None
+            self._items = None
+            self._clearSubentries()
         else:
             self._data = {}
 
     # Adding and Deleting sub-entries.
     def _beforeDelete(self, **ignored):
-        """_beforeDelete.
-
-        :param ignored:
-        """
+        """ Register all our subentries, at every level below us, for
+        deletion (deepest first) """
         c = self._connection()
-        for entry in self._subentries().values():
-            entry.manage_beforeDelete()
+        for entry in list(self._subentries().values()):
+            entry._beforeDelete()
             c._registerDelete(entry.dn)
             entry._isDeleted = 1
-            del self._subentries()[entry.id]
+            self._delSubentry(entry.id)
 
     def _delete(self, o):
         """_delete.
@@ -413,10 +531,8 @@ class TransactionalEntry(Acquisition.Implicit):
         o._beforeDelete()
         c._registerDelete(o.dn)
         o._isDeleted = 1
-        if not o._registered:
-            commit()
-            o._registered = 1
-        del self._subentries()[o.id]
+        o._register()
+        self._delSubentry(o.id)
 
     def _delete_dn(self, rdn):
         """_delete_dn.
@@ -441,17 +557,17 @@ class TransactionalEntry(Acquisition.Implicit):
         attrs = nkw
 
         # create the new full DN for new subentry and check its existance
-        dn = '%s,%s' % (string.strip(rdn), self.dn)
+        dn = '%s,%s' % (rdn.strip(), self.dn)
         if c.hasEntry(dn):
             raise KeyError("DN '%s' already exists" % dn)
 
         # now split out the first attr based on the rdn (ie 'cn=bob', turns
         # into attr['cn'] = 'bob'
-        key, value = list(map(string.strip, string.split(rdn, '=')))
+        key, value = splitRDN(rdn)
         attrs[key] = value
 
         # if objectclass is not set in the attrs, set it now
-        if 'objectclass' not in attrs:
+        if 'objectclass' not in [a.lower() for a in attrs]:
             attrs['objectclass'] = ['top']
 
         # instantiate the instance based on current instances class
@@ -474,8 +590,9 @@ class ZopeEntry(Item):
     )
 
     __ac_permissions__ = (
-        ('Access contents information', ('manage_attributes',),
+        ('Access contents information', ('manage_attributes', 'manage_main'),
          ('Manager', 'Anonymous',),),
+        ('View LDAP Binary Attributes', ('binary',), ('Manager',),),
         ('Manage Entry information', ('manage_changeAttributes',
                                       'manage_addAttribute',
                                       'manage_editAttributes',),
@@ -483,21 +600,27 @@ class ZopeEntry(Item):
         ('Create New Entry Objects',
          ('manage_newEntry', 'manage_newEntryWithAttributes'),
          ('Manager',),),
+        ('Browse Connection Entries',
+         ('exportSubtree', 'manage_exportSubtree'), ('Manager',),),
     )
 
     manage_attributes = HTMLFile("attributes", globals())
-    manage_main = manage_attributes
+    manage_main = HTMLFile("attributes", globals())
     isPrincipiaFolderish = 1
 
     def attributesMap(self):
-        """attributesMap."""
-        return list(self._data.items())
+        """ (name, values) pairs of our attributes """
+        items = self._items
+        if items is None:
+            items = self._items = tuple(self._data.items())
+        return items
 
     def __bobo_traverse__(self, REQUEST, key):
         ' allow traversal to subentries '
         key = six.moves.urllib.parse.unquote(key)
-        if key in self.objectIds():
-            return self[key]
+        entry = self._subentry(key)
+        if entry is not None:
+            return entry
         return getattr(self, key)
 
     # Tree Machinery
@@ -521,12 +644,46 @@ class ZopeEntry(Item):
 
     def objectIds(self):
         """objectIds."""
-        return list(self._subentries().keys())
+        return self._subentryIds()
 
     def objectItems(self):
         """objectItems."""
         return list(self._subentries().items())
 
+    # Binary attributes
+    def binary(self, attr, index=0, REQUEST=None, RESPONSE=None):
+        """ Publish value 'index' of the binary attribute attr (as in
+        .../cn=Bob/binary?attr=jpegPhoto), with its content type, an ETag
+        based on the entry's revision and support for Range requests.
+        Passwords and private keys are never published. """
+        if isSecret(attr):
+            raise Forbidden('%s cannot be published' % attr)
+        conn = self._connection()
+        values, version = conn.getBinaryAttribute(self.dn, attr)
+        index = int(index)
+        if not 0 <= index < len(values):
+            raise NotFound('%s has no %s value %s' % (self.dn, attr, index))
+        data = values[index]
+        if REQUEST is None:
+            return data
+        if RESPONSE is None:
+            RESPONSE = REQUEST.RESPONSE
+        info = conn.getSchema().attribute(attr)
+        return serveBinary(REQUEST, RESPONSE, data, contentType(info, data),
+                           makeETag(version, attr, index))
+
+    # Exporting
+    def exportSubtree(self, out, format='ldif'):
+        """ Write this entry and everything below it to the file-like
+        object out ('ldif' or 'jsonl') """
+        return self._connection().exportSubtree(out, self.dn, format)
+
+    def manage_exportSubtree(self, format='ldif', REQUEST=None,
+                             RESPONSE=None):
+        """ Download this entry and everything below it """
+        return self._connection().manage_exportSubtree(
+            self.dn, format, REQUEST, RESPONSE)
+
     # Zope management stuff
     def manage_deleteEntry(self, ids, REQUEST=None):
         """ Delete marked Entries and all their sub-entries.
@@ -596,6 +753,5 @@ class ZopeEntry(Item):
                 action='manage_propertiesForm')
 
 
-# import Globals
-# for klass in (GenericEntry, TransactionalEntry, ZopeEntry):
-#    Globals.default__class_init__(klass)
+for klass in (GenericEntry, TransactionalEntry, ZopeEntry):
+    InitializeClass(klass)
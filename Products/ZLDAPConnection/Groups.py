@@ -0,0 +1,153 @@
+""" Nested group resolution
+
+Groups are expanded one nesting level at a time: with the 'member' style
+a single search (per chunk of DNs) finds every group listing any of the
+DNs of the current level as a member or uniqueMember; with the
+'memberOf' style the memberOf values of all the DNs of the level are read
+with base searches sent together.
+"""
+import threading
+import time
+
+import ldap
+from ldap.filter import escape_filter_chars
+
+from .Cache import LRUCache
+from .DN import isBelow, normalizeDN
+from .Schema import decodeValue
+from .Stats import Operation
+
+# Seconds expanded memberships are kept
+GROUP_CACHE_TTL = 300
+
+# Expanded memberships kept per server
+GROUP_CACHE_SIZE = 1000
+
+# DNs OR-ed together in one member search
+FILTER_CHUNK = 50
+
+# Nesting levels followed at most
+MAX_DEPTH = 20
+
+# Attributes whose change invalidates expanded memberships
+GROUP_ATTRS = ('member', 'uniquemember', 'memberof')
+
+GROUP_STYLES = ('member', 'memberOf')
+
+_caches = {}
+_lock = threading.Lock()
+
+
+def touchesGroups(attrs):
+    """ true if changing the attributes named in attrs can change group
+    membership """
+    for attr in attrs:
+        if attr.lower() in GROUP_ATTRS:
+            return True
+    return False
+
+
+def _memberLevel(conn, base, dns):
+    """ the DNs of the groups having one of dns as a member """
+    found = []
+    for i in range(0, len(dns), FILTER_CHUNK):
+        terms = []
+        for dn in dns[i:i + FILTER_CHUNK]:
+            value = escape_filter_chars(dn)
+            terms.append('(member=%s)(uniqueMember=%s)' % (value, value))
+        filterstr = '(|%s)' % ''.join(terms)
+        for groupdn, _attrs in conn._search(base, ldap.SCOPE_SUBTREE,
+                                            filterstr, ['1.1']):
+            if groupdn is not None:     # skip search references
+                found.append(groupdn)
+    return found
+
+
+def _memberOfLevel(conn, base, dns):
+    """ the memberOf values of dns naming groups below base, read with
+    pipelined base searches """
+    msgids = []
+    for dn in dns:
+        msgids.append((dn, conn._call(None, dn, 'search', dn,
+                                      ldap.SCOPE_BASE, '(objectClass=*)',
+                                      ['memberOf'])))
+    found = []
+    for dn, msgid in msgids:
+        try:
+            _rtype, rdata = conn._perform(
+                Operation('search.base', dn, ldap.SCOPE_BASE,
+                          '(objectClass=*)', ['memberOf']), 'result', msgid)
+        except ldap.NO_SUCH_OBJECT:
+            continue
+        for _dn, attrs in rdata:
+            for attr, values in attrs.items():
+                if attr.lower() == 'memberof':
+                    groups = [decodeValue(v) for v in values]
+                    found.extend([g for g in groups if isBelow(g, base)])
+    return found
+
+
+def expandGroups(conn, base, dn, style='member'):
+    """ The DNs of all the groups dn belongs to, directly or through
+    other groups, found below base by the searches of the connection conn.
+    Cycles are followed once. """
+    if style not in GROUP_STYLES:
+        raise ValueError('Unknown group style %r' % style)
+    seen = set([normalizeDN(dn)])
+    groups = []
+    level = [dn]
+    depth = 0
+    while level and depth < MAX_DEPTH:
+        if style == 'member':
+            found = _memberLevel(conn, base, level)
+        else:
+            found = _memberOfLevel(conn, base, level)
+        level = []
+        for groupdn in found:
+            key = normalizeDN(groupdn)
+            if key not in seen:
+                seen.add(key)
+                level.append(groupdn)
+        groups.extend(level)
+        depth += 1
+    return groups
+
+
+class GroupCache(object):
+    """ (style, base, DN) -> the groups below base that DN belongs to,
+    for GROUP_CACHE_TTL seconds, for the 'size' DNs used last """
+
+    def __init__(self, ttl=GROUP_CACHE_TTL, size=GROUP_CACHE_SIZE):
+        self.ttl = ttl
+        self._data = LRUCache(size)
+
+    def get(self, style, base, dn):
+        """ the cached groups, or None """
+        key = (style, normalizeDN(base), normalizeDN(dn))
+        found = self._data.get(key)
+        if found is None:
+            return None
+        if found[0] <= time.time():
+            self._data.pop(key)
+            return None
+        return found[1]
+
+    def set(self, style, base, dn, groups):
+        """ remember groups """
+        self._data.set((style, normalizeDN(base), normalizeDN(dn)),
+                       (time.time() + self.ttl, tuple(groups)))
+
+    def clear(self):
+        """ forget everything """
+        self._data.clear()
+
+
+def groupCache(key):
+    """ The GroupCache for key (the server), shared by all the
+    connections to it, so that a change made through any of them is seen
+    by the others """
+    cache = _caches.get(key)
+    if cache is None:
+        with _lock:
+            cache = _caches.setdefault(key, GroupCache())
+    return cache
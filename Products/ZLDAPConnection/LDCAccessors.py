@@ -10,11 +10,15 @@ class LDAPConnectionAccessors(object):
         ('Access contents information',
          ('getId', 'getTitle', 'getHost', 'getPort', 'getBindAs', 'getBoundAs',
           'getPW', 'getDN', 'getOpenConnection', 'getBrowsable',
-          'shouldBeOpen', 'getTransactional',),),
+          'shouldBeOpen', 'getTransactional', 'getAuthCacheTTL',
+          'getSlowThreshold', 'getSharedCache',
+          'getSyncSubtrees', 'getSnapshotDir',),),
         ('Manage properties',
          ('setID', 'setTitle', 'setHost', 'setPort', 'setBindAs', 'setPW',
           'setDN', 'setOpenConnection', 'setBrowsable', 'setBoundAs',
-          'setTransactional',),),
+          'setTransactional', 'setAuthCacheTTL',
+          'setSlowThreshold', 'setSharedCache',
+          'setSyncSubtrees', 'setSnapshotDir',),),
     )
 
     def getId(self):
@@ -137,5 +141,63 @@ class LDAPConnectionAccessors(object):
         always committing.'''
         self.isTransactional = transactional
         self._refreshEntryClass()
-        if not transactional:
-            self._isCommitting = 1
+
+    def getAuthCacheTTL(self):
+        """ Seconds a successful authenticate() is remembered for, so
+        that it needs no bind; 0 (the default) to always bind """
+        return getattr(self, '_authCacheTTL', 0)
+
+    def setAuthCacheTTL(self, ttl):
+        """setAuthCacheTTL.
+
+        :param ttl:
+        """
+        self._authCacheTTL = ttl
+
+    def getSlowThreshold(self):
+        """ Operations taking more seconds than this are logged and
+        listed on the Statistics tab; 0 not to watch for slow ones """
+        return getattr(self, '_slowThreshold', 1.0)
+
+    def setSlowThreshold(self, threshold):
+        """setSlowThreshold.
+
+        :param threshold:
+        """
+        self._slowThreshold = threshold
+
+    def getSharedCache(self):
+        """ If true, entries read by any thread are kept in a cache
+        shared by all of them (see SharedCache) """
+        return getattr(self, '_shareEntries', 0)
+
+    def setSharedCache(self, shared):
+        """setSharedCache.
+
+        :param shared:
+        """
+        self._shareEntries = shared
+
+    def getSyncSubtrees(self):
+        """ The DNs of the subtrees mirrored in memory with syncrepl (see
+        Sync) """
+        return getattr(self, '_syncSubtrees', ())
+
+    def setSyncSubtrees(self, subtrees):
+        """setSyncSubtrees.
+
+        :param subtrees:
+        """
+        self._syncSubtrees = tuple([dn.strip() for dn in subtrees
+                                    if dn.strip()])
+
+    def getSnapshotDir(self):
+        """ The directory mirrors are saved to, or '' (see Snapshot) """
+        return getattr(self, '_snapshotDir', '')
+
+    def setSnapshotDir(self, directory):
+        """setSnapshotDir.
+
+        :param directory:
+        """
+        self._snapshotDir = directory.strip()
@@ -0,0 +1,626 @@
+""" An in-memory directory, for tests and benchmarks
+
+A Directory keeps its entries in memory and hands out connections that
+behave like python-ldap's LDAPObject for everything ZLDAPConnection
+needs: base, one-level and subtree searches with simple filters, the
+paged results, assertion and post-read controls, compare, add, modify,
+delete, simple binds against userPassword, the subschema subentry when
+given one, and the asynchronous calls (search_ext, add_ext, ... then
+result3).  Every round trip can be given
+an artificial latency.  Register it for a host and port to have
+connections to them use it::
+
+    directory = Directory(suffixes=('dc=example,dc=org',), latency=0.001)
+    registerBackend('memory', 389, directory.connect)
+
+Values are matched ignoring case and repeated spaces, whatever the
+attribute's syntax.  The schema is published, not enforced.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import ldap
+from ldap.controls import SimplePagedResultsControl
+from ldap.controls.readentry import PostReadControl
+from zope.interface import implementer
+
+from .Cache import LRUCache
+from .DN import parseDN
+from .interfaces import ILDAPBackend
+
+OPERATIONAL_ATTRS = ('entryCSN', 'modifyTimestamp', 'createTimestamp')
+
+_OPERATIONAL = dict([(a.lower(), a) for a in OPERATIONAL_ATTRS])
+
+SUBSCHEMA_DN = 'cn=Subschema'
+
+SUPPORTED_CONTROLS = (ldap.CONTROL_PAGEDRESULTS, ldap.CONTROL_ASSERT,
+                      ldap.CONTROL_POST_READ)
+
+_escaped = re.compile(br'\\([0-9a-fA-F]{2})')
+_filters = LRUCache(1000)
+
+
+def _error(exc, dn, info=''):
+    """ a python-ldap exception of class exc about dn """
+    return exc({'desc': exc.__name__.replace('_', ' ').lower(),
+                'matched': dn, 'info': info})
+
+
+def _bytes(value):
+    """ value as bytes """
+    if isinstance(value, bytes):
+        return value
+    return value.encode('utf-8')
+
+
+def _values(values):
+    """ the values of a modlist item as a list of bytes """
+    if values is None:
+        return []
+    if isinstance(values, (bytes, type(u''))):
+        values = [values]
+    return [_bytes(v) for v in values]
+
+
+def _normalize(value):
+    """ value as compared by the directory """
+    if isinstance(value, bytes):
+        try:
+            value = value.decode('utf-8')
+        except UnicodeDecodeError:
+            value = value.decode('latin-1')
+    return ' '.join(value.lower().split())
+
+
+def _filterValue(value):
+    """ the normalized value of a filter assertion, with \\XX escapes
+    decoded """
+    value = _escaped.sub(lambda m: bytes(bytearray([int(m.group(1), 16)])),
+                         _bytes(value))
+    return _normalize(value)
+
+
+def _attrKey(attr):
+    """ attr lowercased, without options (';binary', ';lang-en') """
+    return attr.split(';')[0].strip().lower()
+
+
+# Filters
+
+def _present(attr):
+    """ (attr=*) """
+    def match(attrs):
+        return attr in attrs
+    return match
+
+
+def _compare(attr, test):
+    """ a filter item true if test(normalized value) for a value of attr """
+    def match(attrs):
+        found = attrs.get(attr)
+        if found is None:
+            return False
+        for value in found[1]:
+            if test(_normalize(value)):
+                return True
+        return False
+    return match
+
+
+def _substrings(pattern):
+    """ a test matching the (normalized) substring pattern a*b*c """
+    parts = [_filterValue(p) for p in pattern.split('*')]
+    first, middle, last = parts[0], parts[1:-1], parts[-1]
+
+    def test(value):
+        if not value.startswith(first) or not value.endswith(last):
+            return False
+        pos = len(first)
+        end = len(value) - len(last)
+        for part in middle:
+            pos = value.find(part, pos, end)
+            if pos < 0:
+                return False
+            pos += len(part)
+        return pos <= end
+    return test
+
+
+def _ordering(assertion, greater):
+    """ a test for >= (greater) or <= on numbers or strings """
+    def key(value):
+        try:
+            return (0, int(value), '')
+        except ValueError:
+            return (1, 0, value)
+    bound = key(assertion)
+
+    def test(value):
+        if greater:
+            return key(value) >= bound
+        return key(value) <= bound
+    return test
+
+
+def _item(text):
+    """ the predicate for a filter item such as cn=Bob* """
+    pos = text.find('=')
+    if pos < 1:
+        raise ldap.FILTER_ERROR({'desc': 'Bad search filter', 'info': text})
+    op = '='
+    attr = text[:pos]
+    if attr[-1] in '~<>':
+        op = attr[-1] + '='
+        attr = attr[:-1]
+    if ':' in attr:
+        raise ldap.FILTER_ERROR({'desc': 'Bad search filter',
+                                 'info': 'extensible match not supported'})
+    attr = _attrKey(attr)
+    value = text[pos + 1:]
+    if op == '=' and value == '*':
+        return _present(attr)
+    if op == '=' and '*' in value:
+        return _compare(attr, _substrings(value))
+    if op in ('>=', '<='):
+        return _compare(attr, _ordering(_filterValue(value), op == '>='))
+    assertion = _filterValue(value)
+    return _compare(attr, lambda v: v == assertion)
+
+
+def _parse(text, pos):
+    """ parse the filter starting at text[pos], an opening parenthesis;
+    return its predicate and the position after it """
+    if text[pos] != '(':
+        raise ValueError(pos)
+    pos += 1
+    if text[pos] in '&|':
+        combine = text[pos] == '&' and all or any
+        subs = []
+        pos += 1
+        while text[pos] == '(':
+            sub, pos = _parse(text, pos)
+            subs.append(sub)
+
+        def match(attrs):
+            return combine(sub(attrs) for sub in subs)
+    elif text[pos] == '!':
+        sub, pos = _parse(text, pos + 1)
+
+        def match(attrs):
+            return not sub(attrs)
+    else:
+        end = text.index(')', pos)
+        match = _item(text[pos:end])
+        pos = end
+    if text[pos] != ')':
+        raise ValueError(pos)
+    return match, pos + 1
+
+
+def parseFilter(filterstr):
+    """ A predicate taking the attributes of an entry (lowercased name ->
+    (name, values)) and telling whether the entry matches filterstr """
+    match = _filters.get(filterstr)
+    if match is None:
+        text = filterstr.strip()
+        if not text.startswith('('):
+            text = '(%s)' % text
+        try:
+            match, pos = _parse(text, 0)
+        except (IndexError, ValueError):
+            pos = None
+        if pos != len(text):
+            raise ldap.FILTER_ERROR({'desc': 'Bad search filter',
+                                     'info': filterstr})
+        _filters.set(filterstr, match)
+    return match
+
+
+class _Entry(object):
+    """ an entry: its DN and attributes, lowercased name -> (name, values) """
+
+    __slots__ = ('dn', 'attrs')
+
+    def __init__(self, dn, attrs):
+        self.dn = dn
+        self.attrs = attrs
+
+    def select(self, attrlist):
+        """ the attributes asked for by attrlist, as search returns them """
+        attrlist = attrlist or ['*']
+        names = set([_attrKey(a) for a in attrlist])
+        user = '*' in names
+        operational = '+' in names
+        result = {}
+        for key, (name, values) in self.attrs.items():
+            if key in _OPERATIONAL and operational or \
+                    key not in _OPERATIONAL and user or key in names:
+                result[name] = list(values)
+        return result
+
+
+class Directory(object):
+    """ Entries kept in memory.  Entries below 'suffixes' can be added once
+    their parent exists; the suffix entries themselves need none.  Every
+    round trip takes 'latency' seconds.  'schema', the attributes of the
+    subschema subentry ({'attributeTypes': [...], ...}), is published
+    under SUBSCHEMA_DN.  'connections', 'binds' and 'operations' count
+    what was asked of the directory. """
+
+    def __init__(self, suffixes=(), latency=0.0, schema=None):
+        self.suffixes = [parseDN(s).key for s in suffixes]
+        self.latency = latency
+        self.schema = schema
+        self.connections = 0
+        self.binds = 0
+        self.operations = 0
+        self._entries = {}              # key -> _Entry
+        self._children = {}             # key -> OrderedDict of child keys
+        self._csn = 0
+        self._lock = threading.RLock()
+
+    def connect(self):
+        """ A new connection to the directory (see MemoryConnection) """
+        with self._lock:
+            self.connections += 1
+        return MemoryConnection(self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, entries):
+        """ Add entries, an iterable of (dn, {attr: values}), with no
+        latency and without counting the operations (for fixtures) """
+        for dn, attrs in entries:
+            self._add(dn, list(attrs.items()))
+
+    # operations, called by MemoryConnection
+
+    def search(self, base, scope, filterstr, attrlist, serverctrls):
+        """ (rtype, results, response controls) of a search """
+        match = parseFilter(filterstr or '(objectClass=*)')
+        with self._lock:
+            self.operations += 1
+            key = parseDN(base).key
+            if not key and scope == ldap.SCOPE_BASE:
+                return ldap.RES_SEARCH_RESULT, [('', self._rootDSE())], []
+            subschema = self._subschema()
+            if subschema is not None and key == parseDN(SUBSCHEMA_DN).key:
+                results = [(subschema.dn, subschema.select(attrlist))]
+                return ldap.RES_SEARCH_RESULT, results, []
+            if key not in self._entries:
+                raise _error(ldap.NO_SUCH_OBJECT, base)
+            if scope == ldap.SCOPE_BASE:
+                keys = [key]
+            elif scope == ldap.SCOPE_ONELEVEL:
+                keys = list(self._children.get(key, ()))
+            else:
+                keys = self._subtree(key)
+            results = []
+            for found in keys:
+                entry = self._entries[found]
+                if match(entry.attrs):
+                    results.append((entry.dn, entry.select(attrlist)))
+        controls = []
+        for ctrl in serverctrls or ():
+            if ctrl.controlType == ldap.CONTROL_PAGEDRESULTS:
+                start = int(ctrl.cookie or 0)
+                end = start + (ctrl.size or len(results))
+                cookie = end < len(results) and str(end).encode() or b''
+                results = results[start:end]
+                controls.append(SimplePagedResultsControl(
+                    False, size=len(results), cookie=cookie))
+        return ldap.RES_SEARCH_RESULT, results, controls
+
+    def compare(self, dn, attr, value):
+        """ (rtype, True if dn has value in attr, no controls) """
+        with self._lock:
+            self.operations += 1
+            entry = self._get(dn)
+            found = entry.attrs.get(_attrKey(attr))
+            if found is None:
+                raise _error(ldap.NO_SUCH_ATTRIBUTE, dn, attr)
+            value = _normalize(value)
+            result = value in [_normalize(v) for v in found[1]]
+        return ldap.RES_COMPARE, result, []
+
+    def add(self, dn, modlist):
+        """ add entry dn with the attributes of modlist """
+        with self._lock:
+            self.operations += 1
+            self._add(dn, modlist)
+        return ldap.RES_ADD, [], []
+
+    def modify(self, dn, modlist, serverctrls):
+        """ apply modlist to dn, honouring the assertion and post-read
+        controls """
+        controls = []
+        with self._lock:
+            self.operations += 1
+            entry = self._get(dn)
+            for ctrl in serverctrls or ():
+                if ctrl.controlType == ldap.CONTROL_ASSERT and \
+                        not parseFilter(ctrl.filterstr)(entry.attrs):
+                    raise _error(ldap.ASSERTION_FAILED, dn)
+            attrs = OrderedDict(entry.attrs)
+            for op, attr, values in modlist:
+                self._apply(dn, attrs, op, attr, _values(values))
+            self._stamp(attrs, created=False)
+            entry.attrs = attrs
+            for ctrl in serverctrls or ():
+                if ctrl.controlType == ldap.CONTROL_POST_READ:
+                    response = PostReadControl(False, ctrl.attrList)
+                    response.dn = entry.dn
+                    response.entry = entry.select(ctrl.attrList)
+                    controls.append(response)
+        return ldap.RES_MODIFY, [], controls
+
+    def delete(self, dn):
+        """ delete the leaf entry dn """
+        with self._lock:
+            self.operations += 1
+            key = parseDN(dn).key
+            self._get(dn)
+            if self._children.get(key):
+                raise _error(ldap.NOT_ALLOWED_ON_NONLEAF, dn)
+            del self._entries[key]
+            self._children.pop(key, None)
+            parent = self._children.get(parseDN(dn).parent)
+            if parent is not None:
+                parent.pop(key, None)
+        return ldap.RES_DELETE, [], []
+
+    def bind(self, who, cred):
+        """ check a simple bind """
+        with self._lock:
+            self.operations += 1
+            self.binds += 1
+            if not who:
+                return
+            if not cred:
+                raise _error(ldap.UNWILLING_TO_PERFORM, who,
+                             'unauthenticated bind')
+            entry = self._entries.get(parseDN(who).key)
+            passwords = entry and entry.attrs.get('userpassword')
+            if not passwords or _bytes(cred) not in passwords[1]:
+                raise _error(ldap.INVALID_CREDENTIALS, '')
+
+    # helpers
+
+    def _get(self, dn):
+        """ the _Entry for dn """
+        entry = self._entries.get(parseDN(dn).key)
+        if entry is None:
+            raise _error(ldap.NO_SUCH_OBJECT, dn)
+        return entry
+
+    def _add(self, dn, modlist):
+        """ add dn """
+        parsed = parseDN(dn)
+        if parsed.key in self._entries:
+            raise _error(ldap.ALREADY_EXISTS, dn)
+        if parsed.key not in self.suffixes and \
+                parsed.parent not in self._entries:
+            raise _error(ldap.NO_SUCH_OBJECT, dn)
+        attrs = OrderedDict()
+        for attr, values in modlist:
+            values = _values(values)
+            if values:
+                attrs[_attrKey(attr)] = (attr.split(';')[0], values)
+        self._stamp(attrs, created=True)
+        self._entries[parsed.key] = _Entry(dn, attrs)
+        self._children.setdefault(parsed.parent, OrderedDict())[
+            parsed.key] = None
+
+    def _apply(self, dn, attrs, op, attr, values):
+        """ apply one modlist item to attrs """
+        key = _attrKey(attr)
+        name, current = attrs.get(key, (attr.split(';')[0], []))
+        if op == ldap.MOD_ADD:
+            normalized = [_normalize(v) for v in current]
+            for value in values:
+                if _normalize(value) in normalized:
+                    raise _error(ldap.TYPE_OR_VALUE_EXISTS, dn, attr)
+            current = current + values
+        elif op == ldap.MOD_DELETE:
+            if key not in attrs:
+                raise _error(ldap.NO_SUCH_ATTRIBUTE, dn, attr)
+            if values:
+                removed = [_normalize(v) for v in values]
+                kept = [v for v in current if _normalize(v) not in removed]
+                if len(current) - len(kept) != len(set(removed)):
+                    raise _error(ldap.NO_SUCH_ATTRIBUTE, dn, attr)
+                current = kept
+            else:
+                current = []
+        else:
+            current = values
+        if current:
+            attrs[key] = (name, current)
+        else:
+            attrs.pop(key, None)
+
+    def _stamp(self, attrs, created):
+        """ set the operational attributes of a new revision """
+        self._csn += 1
+        now = time.strftime('%Y%m%d%H%M%SZ', time.gmtime()).encode()
+        csn = ('%s#%06d#000#000000' % (now.decode(), self._csn)).encode()
+        attrs['entrycsn'] = ('entryCSN', [csn])
+        attrs['modifytimestamp'] = ('modifyTimestamp', [now])
+        if created:
+            attrs['createtimestamp'] = ('createTimestamp', [now])
+
+    def _subtree(self, key):
+        """ key and the keys of all the entries below it """
+        keys = [key]
+        i = 0
+        while i < len(keys):
+            keys.extend(self._children.get(keys[i], ()))
+            i += 1
+        return keys
+
+    def _rootDSE(self):
+        """ the attributes of the root DSE """
+        contexts = [self._entries[k].dn.encode('utf-8')
+                    for k in self.suffixes if k in self._entries]
+        dse = {
+            'supportedControl': [c.encode('ascii')
+                                 for c in SUPPORTED_CONTROLS],
+            'supportedExtension': [],
+            'namingContexts': contexts,
+        }
+        if self.schema is not None:
+            dse['subschemaSubentry'] = [SUBSCHEMA_DN.encode('utf-8')]
+        return dse
+
+    def _subschema(self):
+        """ the subschema subentry, or None """
+        if self.schema is None:
+            return None
+        attrs = dict(self.schema)
+        attrs.setdefault('objectClass', [b'top', b'subschema'])
+        return _Entry(SUBSCHEMA_DN, dict([
+            (_attrKey(a), (a, _values(v))) for a, v in attrs.items()]))
+
+
+@implementer(ILDAPBackend)
+class MemoryConnection(object):
+    """ A connection to a Directory, with the LDAPObject methods used by
+    ZLDAPConnection """
+
+    def __init__(self, directory):
+        self._directory = directory
+        self._pending = OrderedDict()   # msgid -> (due, call, args)
+        self._msgid = 0
+        self._lock = threading.Lock()
+        self.bound = ''
+
+    def _send(self, call, *args):
+        """ queue call(*args), answered latency seconds from now """
+        with self._lock:
+            self._msgid += 1
+            msgid = self._msgid
+            self._pending[msgid] = (time.time() + self._directory.latency,
+                                    call, args)
+        return msgid
+
+    def result3(self, msgid=ldap.RES_ANY, all=1, timeout=None):
+        """ (rtype, rdata, msgid, controls) of request msgid """
+        with self._lock:
+            if msgid == ldap.RES_ANY:
+                msgid = next(iter(self._pending))
+            due, call, args = self._pending.pop(msgid)
+        wait = due - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        rtype, rdata, controls = call(*args)
+        return rtype, rdata, msgid, controls
+
+    def result(self, msgid=ldap.RES_ANY, all=1, timeout=None):
+        """ (rtype, rdata) of request msgid """
+        return self.result3(msgid, all, timeout)[:2]
+
+    # searching
+    def search_ext(self, base, scope, filterstr='(objectClass=*)',
+                   attrlist=None, attrsonly=0, serverctrls=None,
+                   clientctrls=None, timeout=-1, sizelimit=0):
+        """ send a search """
+        return self._send(self._directory.search, base, scope, filterstr,
+                          attrlist, serverctrls)
+
+    def search(self, base, scope, filterstr='(objectClass=*)', attrlist=None,
+               attrsonly=0):
+        """ send a search """
+        return self.search_ext(base, scope, filterstr, attrlist, attrsonly)
+
+    def search_ext_s(self, base, scope, filterstr='(objectClass=*)',
+                     attrlist=None, attrsonly=0, serverctrls=None,
+                     clientctrls=None, timeout=-1, sizelimit=0):
+        """ search and wait for the results """
+        return self.result3(self.search_ext(base, scope, filterstr, attrlist,
+                                            attrsonly, serverctrls))[1]
+
+    def search_s(self, base, scope, filterstr='(objectClass=*)',
+                 attrlist=None, attrsonly=0):
+        """ search and wait for the results """
+        return self.search_ext_s(base, scope, filterstr, attrlist, attrsonly)
+
+    def read_subschemasubentry_s(self, subschemasubentry_dn, attrs=None):
+        """ the attributes of the subschema subentry, or None """
+        if self._directory.schema is None:
+            return None
+        r = self.search_s(subschemasubentry_dn, ldap.SCOPE_BASE,
+                          '(objectClass=subschema)', attrs)
+        return r and r[0][1] or None
+
+    def compare_s(self, dn, attr, value):
+        """ True if dn has value among the values of attr """
+        return self.result3(self._send(self._directory.compare, dn, attr,
+                                       value))[1]
+
+    # writing
+    def add_ext(self, dn, modlist, serverctrls=None, clientctrls=None):
+        """ send an add """
+        return self._send(self._directory.add, dn, modlist)
+
+    def add_ext_s(self, dn, modlist, serverctrls=None, clientctrls=None):
+        """ add and wait """
+        return self.result3(self.add_ext(dn, modlist))
+
+    def add_s(self, dn, modlist):
+        """ add and wait """
+        return self.add_ext_s(dn, modlist)
+
+    def modify_ext(self, dn, modlist, serverctrls=None, clientctrls=None):
+        """ send a modify """
+        return self._send(self._directory.modify, dn, modlist, serverctrls)
+
+    def modify_ext_s(self, dn, modlist, serverctrls=None, clientctrls=None):
+        """ modify and wait """
+        return self.result3(self.modify_ext(dn, modlist, serverctrls))
+
+    def modify_s(self, dn, modlist):
+        """ modify and wait """
+        return self.modify_ext_s(dn, modlist)
+
+    def delete_ext(self, dn, serverctrls=None, clientctrls=None):
+        """ send a delete """
+        return self._send(self._directory.delete, dn)
+
+    def delete_ext_s(self, dn, serverctrls=None, clientctrls=None):
+        """ delete and wait """
+        return self.result3(self.delete_ext(dn))
+
+    def delete_s(self, dn):
+        """ delete and wait """
+        return self.delete_ext_s(dn)
+
+    # binding
+    def simple_bind_s(self, who='', cred='', serverctrls=None,
+                      clientctrls=None):
+        """ bind as who """
+        self.result3(self._send(self._bind, who, cred))
+        self.bound = who
+
+    def _bind(self, who, cred):
+        """ the bind request """
+        self._directory.bind(who, cred)
+        return ldap.RES_BIND, [], []
+
+    def whoami_s(self, serverctrls=None, clientctrls=None):
+        """ the authorization identity """
+        return self.bound and 'dn:%s' % self.bound or ''
+
+    def unbind_s(self):
+        """ forget the requests not answered yet """
+        with self._lock:
+            self._pending.clear()
+        self.bound = ''
+
+    unbind = unbind_s
+
+    def destroy_cache(self):
+        """ there is no client side cache """
@@ -0,0 +1,139 @@
+""" Pending (not yet sent) changes held by an LDAP Connection
+"""
+import ldap
+
+from .DN import normalizeDN, parentDN
+
+
+class PendingChange(object):
+    """ The merged attribute changes queued against a single DN.  However
+    many Entry objects edit the DN, their changes end up here and are sent
+    to the server as one modify operation. """
+
+    def __init__(self, dn, version=None):
+        self.dn = dn
+        self.version = version          # assertion filter, see popVersion
+        self.entries = []               # the Entry objects involved
+        self._replace = {}              # lowercased name -> (name, values)
+        self._delete = {}               # lowercased name -> name
+
+    def __bool__(self):
+        return bool(self._replace or self._delete)
+
+    __nonzero__ = __bool__
+
+    def set(self, attrs):
+        """ Record new values for the attributes in the mapping attrs,
+        overriding any earlier change to the same attributes. """
+        for attr, values in attrs.items():
+            key = attr.lower()
+            self._delete.pop(key, None)
+            self._replace[key] = (attr, list(values))
+
+    def remove(self, attrs):
+        """ Record the deletion of the attributes named in attrs """
+        for attr in attrs:
+            key = attr.lower()
+            self._replace.pop(key, None)
+            self._delete[key] = attr
+
+    def replaced(self):
+        """ attribute name -> new values, for the replaced attributes """
+        return dict(self._replace.values())
+
+    def removed(self):
+        """ The names of the removed attributes """
+        return list(self._delete.values())
+
+    def modlist(self):
+        """ The modlist to hand to modify_s """
+        modlist = [(ldap.MOD_REPLACE, attr, values)
+                   for attr, values in self._replace.values()]
+        modlist.extend([(ldap.MOD_DELETE, attr, None)
+                        for attr in self._delete.values()])
+        return modlist
+
+
+class PendingIndex(object):
+    """ The uncommitted adds and deletes of a connection, keyed by
+    normalized DN, with a parent -> children map of the pending adds so
+    that listings can overlay them without scanning every pending entry.
+    """
+
+    def __init__(self):
+        self._added = {}                # key -> entry
+        self._children = {}             # parent key -> {key: entry}
+        self._deleted = {}              # key -> dn, in registration order
+
+    def __len__(self):
+        return len(self._added) + len(self._deleted)
+
+    # pending adds
+    def add(self, entry):
+        """ Register entry to be added, unless its DN already is """
+        key = normalizeDN(entry.dn)
+        if key in self._added:
+            return
+        self._added[key] = entry
+        self._children.setdefault(parentDN(key), {})[key] = entry
+
+    def discardAdd(self, dn):
+        """ Forget the pending add of dn """
+        key = normalizeDN(dn)
+        if self._added.pop(key, None) is not None:
+            parent = parentDN(key)
+            children = self._children.get(parent)
+            if children is not None:
+                children.pop(key, None)
+                if not children:
+                    del self._children[parent]
+
+    def getAdded(self, dn, default=None):
+        """ Return the entry pending to be added as dn """
+        return self._added.get(normalizeDN(dn), default)
+
+    def addedEntries(self):
+        """ All entries pending to be added, parents first """
+        return list(self._added.values())
+
+    def addedChildren(self, dn):
+        """ The pending entries to be added directly below dn """
+        return list(self._children.get(normalizeDN(dn), {}).values())
+
+    # pending deletes
+    def delete(self, dn):
+        """ Register dn for deletion """
+        key = normalizeDN(dn)
+        if key not in self._deleted:
+            self._deleted[key] = dn
+
+    def undelete(self, dn):
+        """ Forget the pending deletion of dn """
+        self._deleted.pop(normalizeDN(dn), None)
+
+    def deletedDNs(self):
+        """ The DNs pending deletion, in the order they were registered
+        (subentries before their parents) """
+        return list(self._deleted.values())
+
+    def isDeleted(self, dn):
+        """ True if dn, or any of its ancestors, is pending deletion and
+        dn itself is not pending to be re-added """
+        if not self._deleted:
+            return False
+        key = normalizeDN(dn)
+        if key in self._added:
+            return False
+        while key:
+            if key in self._deleted:
+                return True
+            key = parentDN(key)
+        return False
+
+    def isChildDeleted(self, dn):
+        """ Cheap check for a child of a DN already known not to be
+        deleted: only dn's own key is looked at """
+        if not self._deleted:
+            return False
+        key = normalizeDN(dn)
+        return key in self._deleted and key not in self._added
@@ -0,0 +1,70 @@
+""" Lightweight search results
+"""
+from .DN import parseDN
+from .Entry import AttrWrap
+
+
+class LDAPRecord(object):
+    """ A read-only search result, much like a catalog brain.  It keeps
+    only the DN and the attributes (as AttrWraps), and builds a full Entry
+    object only when getObject() is called. """
+
+    __slots__ = ('dn', '_attrs', '_conn')
+    __allow_access_to_unprotected_subobjects__ = 1
+
+    def __init__(self, dn, attrs, conn):
+        self.dn = dn
+        self._attrs = tuple([(name, AttrWrap.wrap(values))
+                             for name, values in attrs.items()])
+        self._conn = conn
+
+    def __repr__(self):
+        return '<LDAPRecord %s>' % self.dn
+
+    @property
+    def id(self):
+        """ our first RDN, as for Entry objects """
+        return parseDN(self.dn).id
+
+    def getId(self):
+        """getId."""
+        return self.id
+
+    def get(self, attr, default=None):
+        """ the values of attribute attr (compared case-insensitively) """
+        lattr = attr.lower()
+        for name, values in self._attrs:
+            if name.lower() == lattr:
+                return values
+        return default
+
+    def __getitem__(self, attr):
+        values = self.get(attr)
+        if values is None:
+            raise KeyError(attr)
+        return values
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        values = self.get(attr)
+        if values is None:
+            raise AttributeError(attr)
+        return values
+
+    def keys(self):
+        """ the attribute names """
+        return [name for name, _values in self._attrs]
+
+    def items(self):
+        """ (name, values) pairs """
+        return list(self._attrs)
+
+    def getObject(self, o=None):
+        """ The full Entry object for this record, wrapped in o if given """
+        conn = self._conn
+        Entry = conn._EntryFactory()
+        entry = Entry(self.dn, dict(self._attrs), conn)
+        if o is not None:
+            return entry.__of__(o)
+        return entry
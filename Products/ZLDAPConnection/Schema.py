@@ -0,0 +1,342 @@
+""" Directory schema
+"""
+import threading
+import time
+import six
+import ldap
+import ldap.schema
+from ldap.schema.models import AttributeType, ObjectClass
+
+# How often (seconds) the subschema's modifyTimestamp is checked
+SCHEMA_CHECK_INTERVAL = 300
+
+# Seconds after which a subschema that could not be read is read again
+SCHEMA_RETRY_INTERVAL = 30
+
+SCHEMA_ATTRS = list(ldap.schema.SCHEMA_ATTRS) + ['modifyTimestamp']
+
+# Syntaxes whose values are binary data rather than text
+BINARY_SYNTAXES = frozenset([
+    '1.3.6.1.4.1.1466.115.121.1.4',     # Audio
+    '1.3.6.1.4.1.1466.115.121.1.5',     # Binary
+    '1.3.6.1.4.1.1466.115.121.1.8',     # Certificate
+    '1.3.6.1.4.1.1466.115.121.1.9',     # Certificate List
+    '1.3.6.1.4.1.1466.115.121.1.10',    # Certificate Pair
+    '1.3.6.1.4.1.1466.115.121.1.23',    # Fax
+    '1.3.6.1.4.1.1466.115.121.1.28',    # JPEG
+    '1.3.6.1.4.1.1466.115.121.1.40',    # Octet String
+    '1.3.6.1.4.1.1466.115.121.1.49',    # Supported Algorithm
+])
+
+# Used when the server does not let us read its schema
+DEFAULT_BINARY_ATTRS = frozenset([
+    'audio', 'cacertificate', 'certificaterevocationlist',
+    'authorityrevocationlist', 'crosscertificatepair', 'jpegphoto',
+    'photo', 'thumbnailphoto', 'usercertificate', 'userpkcs12',
+    'usersmimecertificate', 'objectguid', 'objectsid',
+])
+
+# Password attributes: read and edited along with the text attributes,
+# whatever their syntax, so that they can be changed like any other
+PASSWORD_ATTRS = frozenset([
+    'userpassword', 'authpassword', 'sambantpassword', 'sambalmpassword',
+])
+
+# Attributes whose values are never published (see ZopeEntry.binary)
+SECRET_ATTRS = PASSWORD_ATTRS | frozenset(['userpkcs12'])
+
+_schemas = {}
+_lock = threading.Lock()
+
+
+class AttributeInfo(object):
+    """ What the schema says about an attribute type """
+
+    __slots__ = ('name', 'syntax', 'singleValued', 'binary', 'operational')
+
+    def __init__(self, name, syntax, singleValued, operational=False):
+        self.name = name
+        self.syntax = syntax
+        self.singleValued = singleValued
+        self.binary = syntax in BINARY_SYNTAXES and \
+            name.lower() not in PASSWORD_ATTRS
+        self.operational = operational
+
+
+class ObjectClassInfo(object):
+    """ What the schema says about an object class; 'must' and 'may'
+    include the attributes inherited from superclasses and hold the
+    lowercased primary names of the attribute types """
+
+    __slots__ = ('name', 'must', 'may')
+
+    def __init__(self, name, must, may):
+        self.name = name
+        self.must = must
+        self.may = may
+
+
+class Schema(object):
+    """ The attribute types and object classes of a server's subschema
+    subentry, indexed by (lowercased) name and OID.  'failed' is set on
+    the empty Schema standing for one that could not be read, 'warned'
+    once its being unknown has been logged. """
+
+    failed = False
+    warned = False
+
+    def __init__(self, entry=None):
+        self._attrs = {}
+        self._classes = {}
+        self.timestamp = None
+        self.checked = time.time()
+        if entry:
+            for attr, values in entry.items():
+                if attr.lower() == 'modifytimestamp' and values:
+                    self.timestamp = values[0]
+            subschema = ldap.schema.SubSchema(entry, check_uniqueness=0)
+            for oid in subschema.listall(AttributeType):
+                self._addAttributeType(subschema, oid)
+            for oid in subschema.listall(ObjectClass):
+                self._addObjectClass(subschema, oid)
+        self._text = self._textAttributes()
+
+    def _addAttributeType(self, subschema, oid):
+        """ index the attribute type oid """
+        at = subschema.get_obj(AttributeType, oid)
+        try:
+            syntax = subschema.get_inheritedattr(AttributeType, oid,
+                                                 'syntax')
+        except KeyError:
+            syntax = at.syntax
+        syntax = (syntax or '').split('{')[0]
+        names = tuple(at.names or ())
+        info = AttributeInfo(names and names[0] or oid, syntax,
+                             bool(at.single_value), bool(at.usage))
+        for name in names + (oid,):
+            self._attrs[name.lower()] = info
+
+    def _addObjectClass(self, subschema, oid):
+        """ index the object class oid """
+        oc = subschema.get_obj(ObjectClass, oid)
+        must, may = subschema.attribute_types([oid], raise_keyerror=0)
+        names = tuple(oc.names or ())
+        info = ObjectClassInfo(names and names[0] or oid,
+                               self._attributeNames(must),
+                               self._attributeNames(may))
+        for name in names + (oid,):
+            self._classes[name.lower()] = info
+
+    def _textAttributes(self):
+        """ the names of the user attribute types whose values are
+        text, or None if no attribute type is known """
+        if not self._attrs:
+            return None
+        names = set([info.name for info in self._attrs.values()
+                     if not info.binary and not info.operational])
+        names.add('objectClass')
+        return sorted(names)
+
+    def _attributeNames(self, attributeTypes):
+        """ the lowercased primary names of attributeTypes """
+        return frozenset([(at.names and at.names[0] or oid).lower()
+                          for oid, at in attributeTypes.items()])
+
+    def _primary(self, attr):
+        """ the lowercased primary name of attribute attr """
+        info = self.attribute(attr)
+        return (info is not None and info.name or attr).lower()
+
+    def objectClass(self, name):
+        """ The ObjectClassInfo for name, or None """
+        return self._classes.get(name.lower())
+
+    def mustAttributes(self, objectclasses):
+        """ The (lowercased) attributes required by objectclasses """
+        must = set()
+        for name in objectclasses:
+            info = self.objectClass(name)
+            if info is not None:
+                must.update(info.must)
+        return must
+
+    def mayAttributes(self, objectclasses):
+        """ The (lowercased) attributes allowed by objectclasses """
+        may = set()
+        for name in objectclasses:
+            info = self.objectClass(name)
+            if info is not None:
+                may.update(info.may)
+        return may
+
+    def isKnown(self):
+        """ true if object classes are known, so that entries can be
+        checked """
+        return bool(self._classes)
+
+    def checkEntry(self, attrs):
+        """ Problems (a list of messages) that would keep the entry with
+        the attributes attrs from being added """
+        if not self._classes:
+            return []                   # nothing known, nothing to check
+        present = dict([(self._primary(a), v)
+                        for a, v in attrs.items() if v])
+        objectclasses = [decodeValue(v)
+                         for v in present.get('objectclass', ())]
+        problems = ['unknown object class %s' % oc for oc in objectclasses
+                    if self.objectClass(oc) is None]
+        must = self.mustAttributes(objectclasses)
+        problems.extend(['missing required attribute %s' % a
+                         for a in sorted(must) if a not in present])
+        problems.extend(self.checkAllowed(
+            objectclasses, [a for a, v in attrs.items() if v]))
+        problems.extend(self.checkValues(attrs))
+        return problems
+
+    def checkAllowed(self, objectclasses, names):
+        """ Problems with the attributes named in names that none of
+        objectclasses requires or allows.  Nothing is checked when one of
+        the classes is unknown or is extensibleObject, and operational
+        attributes are left to the server. """
+        if not objectclasses:
+            return []
+        infos = [self.objectClass(oc) for oc in objectclasses]
+        if None in infos or 'extensibleobject' in [i.name.lower()
+                                                   for i in infos]:
+            return []
+        allowed = set(['objectclass'])
+        for info in infos:
+            allowed.update(info.must)
+            allowed.update(info.may)
+        problems = []
+        for name in sorted(names):
+            info = self.attribute(name)
+            if info is not None and info.operational:
+                continue
+            if self._primary(name) not in allowed:
+                problems.append('attribute %s is not allowed' % name)
+        return problems
+
+    def checkValues(self, attrs):
+        """ Problems with the values in attrs: several values for a
+        single-valued attribute """
+        return ['attribute %s is single-valued' % attr
+                for attr, values in attrs.items()
+                if values and len(values) > 1 and self.isSingleValued(attr)]
+
+    def checkRemove(self, attrs, removed):
+        """ Problems with removing the attributes named in removed from
+        an entry currently holding attrs """
+        must = self.mustAttributes(objectClassesOf(attrs))
+        return ['cannot remove required attribute %s' % attr
+                for attr in removed if self._primary(attr) in must]
+
+    def attribute(self, name):
+        """ The AttributeInfo for name (options such as ';binary' are
+        ignored), or None if the schema does not know it """
+        return self._attrs.get(name.split(';')[0].lower())
+
+    def isBinary(self, name):
+        """ true if the values of attribute name are binary data """
+        if ';binary' in name.lower():
+            return True
+        info = self.attribute(name)
+        if info is None:
+            return name.lower() in DEFAULT_BINARY_ATTRS
+        return info.binary
+
+    def textAttributes(self):
+        """ The names of the user attributes an entry is read with,
+        instead of '*': every user attribute type but the binary ones,
+        which are read when asked for.  The attributes of the entry's own
+        object classes would do, but those classes are only known once the
+        entry is read, and extensibleObject entries may hold any user
+        attribute.  None when the schema is unknown. """
+        return self._text
+
+    def isSingleValued(self, name):
+        """ true if attribute name may only have one value """
+        info = self.attribute(name)
+        return info is not None and info.singleValued
+
+    def decode(self, attrs):
+        """ A copy of attrs with the values of text attributes decoded
+        from UTF-8.  Binary attributes are left alone. """
+        if six.PY2:
+            return attrs
+        result = {}
+        for attr, values in attrs.items():
+            if not self.isBinary(attr):
+                values = [decodeValue(v) for v in values]
+            result[attr] = values
+        return result
+
+    def decodeText(self, attrs):
+        """ decode() without the binary attributes, which are left to be
+        read when asked for """
+        result = {}
+        for attr, values in attrs.items():
+            if not self.isBinary(attr):
+                if not six.PY2:
+                    values = [decodeValue(v) for v in values]
+                result[attr] = values
+        return result
+
+
+def isSecret(name):
+    """ true if the values of attribute name must not be published """
+    return name.split(';')[0].lower() in SECRET_ATTRS
+
+
+def objectClassesOf(attrs):
+    """ the (decoded) objectClass values in attrs """
+    for attr, values in attrs.items():
+        if attr.lower() == 'objectclass':
+            return [decodeValue(v) for v in values or ()]
+    return []
+
+
+def decodeValue(value):
+    """ value decoded from UTF-8, or left as it is if it is not text """
+    if isinstance(value, bytes):
+        try:
+            return value.decode('utf-8')
+        except UnicodeDecodeError:
+            pass
+    return value
+
+
+def encodeValues(values):
+    """ values as the UTF-8 encoded byte strings python-ldap expects """
+    if values is None:
+        return None
+    if isinstance(values, (six.text_type, bytes)):
+        values = (values,)
+    return [v.encode('utf-8') if isinstance(v, six.text_type) else v
+            for v in values]
+
+
+def cachedSchema(key, load, timestamp):
+    """ The Schema cached for key (the server), calling load() to read it
+    the first time.  Every SCHEMA_CHECK_INTERVAL seconds, timestamp() is
+    asked for the current modifyTimestamp of the subschema, and the schema
+    is read again if it changed.  When load() returns None, the schema
+    could not be read: an empty Schema is used, and the schema is read
+    again after SCHEMA_RETRY_INTERVAL seconds. """
+    now = time.time()
+    schema = _schemas.get(key)
+    if schema is not None and schema.failed:
+        if schema.checked + SCHEMA_RETRY_INTERVAL < now:
+            schema = None
+    elif schema is not None and schema.checked + SCHEMA_CHECK_INTERVAL < now:
+        schema.checked = now
+        if timestamp() != schema.timestamp:
+            schema = None
+    if schema is None:
+        schema = load()
+        if schema is None:
+            schema = Schema()
+            schema.failed = True
+        with _lock:
+            _schemas[key] = schema
+    return schema
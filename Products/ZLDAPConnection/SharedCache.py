@@ -0,0 +1,273 @@
+""" A cache of entries shared by all the copies of a connection
+
+Every ZODB connection (so every worker thread) has its own copy of a
+ZLDAPConnection, and what one copy reads in its _v_ attributes is of no
+use to the others.  A SharedEntryCache, looked up by the connection's
+physical path, holds the entries and the lists of children read by any of
+them, within a byte budget, for up to SHARED_CACHE_TTL seconds.  Writes
+made through any copy invalidate what they touch.
+
+Entries older than SHARED_CACHE_REFRESH seconds are still served, but
+read again in the background by the cache's Refresher, so that popular
+entries do not expire and have every thread that wants them wait for
+the same search.  Only one read of an entry is in flight at a time:
+threads wanting an entry already being read wait for that read.
+"""
+import logging
+import threading
+import time
+
+import ldap
+from six.moves.queue import Queue
+
+from .Cache import ByteBudgetCache
+from .DN import normalizeDN, parentDN
+
+LOG = logging.getLogger('Products.ZLDAPConnection')
+
+# Bytes of entries kept per connection
+SHARED_CACHE_BUDGET = 64 * 1024 * 1024
+
+# Seconds an entry is served at most
+SHARED_CACHE_TTL = 60
+
+# Seconds after which a served entry is read again in the background
+SHARED_CACHE_REFRESH = 30
+
+# Seconds a thread waits for another one reading the entry it wants,
+# before reading it itself
+SHARED_CACHE_WAIT = 5
+
+_caches = {}
+_lock = threading.Lock()
+
+
+def entrySize(attrs):
+    """ roughly the bytes taken by the attributes attrs """
+    size = 64
+    for attr, values in attrs.items():
+        size += len(attr) + 16
+        for value in values:
+            size += len(value) + 8
+    return size
+
+
+def _copy(entry):
+    """ (dn, attrs) with attrs copied, as entries pop their revision
+    attributes from the dictionary they are given """
+    return entry[0], dict(entry[1])
+
+
+class SharedEntryCache(object):
+    """ Raw entries, (dn, attrs), and lists of them (the children of an
+    entry) by normalized DN.  What was read before an invalidation is not
+    cached after it: readers pass the generation() they started in. """
+
+    def __init__(self, budget=SHARED_CACHE_BUDGET, ttl=SHARED_CACHE_TTL,
+                 refresh=SHARED_CACHE_REFRESH):
+        self.ttl = ttl
+        self.refresh = refresh
+        self.refresher = None
+        self._data = ByteBudgetCache(budget)
+        self._generation = 0
+        self._flights = {}              # normalized DN -> _Flight
+        self._lock = threading.Lock()
+
+    def generation(self):
+        """ changes with every invalidation """
+        return self._generation
+
+    def _set(self, key, value, size, generation):
+        """ cache value, unless invalidated since generation """
+        if generation == self._generation:
+            self._data.set(key, (value, time.time()), size)
+
+    def _get(self, key):
+        """ the (value, time read) cached under key, if not expired """
+        found = self._data.get(key)
+        if found is not None and found[1] + self.ttl > time.time():
+            return found
+        return None
+
+    def getEntry(self, dn):
+        """ the cached entry dn, or None.  Entries older than refresh
+        seconds are handed to the refresher. """
+        found = self._get(('entry', normalizeDN(dn)))
+        if found is None:
+            return None
+        refresher = self.refresher
+        if refresher is not None and found[1] + self.refresh < time.time():
+            refresher.schedule(dn)
+        return _copy(found[0])
+
+    def load(self, dn, read, wait=True):
+        """ Cache and return read(dn), the entry dn from the server, or
+        if another thread is reading it already, wait for its result (or
+        return None at once unless wait) for up to SHARED_CACHE_WAIT
+        seconds """
+        key = normalizeDN(dn)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            if not wait:
+                return None
+            flight.done.wait(SHARED_CACHE_WAIT)
+            if flight.ok:
+                return flight.entry and _copy(flight.entry)
+            # the other read failed or hangs: try ourselves
+            return read(dn)
+        try:
+            generation = self.generation()
+            entry = read(dn)
+            if entry:
+                self.setEntry(dn, entry, generation)
+                flight.entry = entry
+                entry = _copy(entry)
+            flight.ok = True
+            return entry
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def setEntry(self, dn, entry, generation):
+        """ cache the entry dn, read in generation """
+        self._set(('entry', normalizeDN(dn)), entry, entrySize(entry[1]),
+                  generation)
+
+    def getChildren(self, dn):
+        """ the cached children of dn, or None """
+        found = self._get(('children', normalizeDN(dn)))
+        if found is None:
+            return None
+        return [_copy(e) for e in found[0]]
+
+    def setChildren(self, dn, children, generation):
+        """ cache the children of dn, read in generation """
+        size = sum([entrySize(attrs) for _dn, attrs in children])
+        self._set(('children', normalizeDN(dn)), children, size, generation)
+
+    def invalidate(self, dn):
+        """ forget dn, its children and the children of its parent """
+        key = normalizeDN(dn)
+        with self._lock:
+            self._generation += 1
+        self._data.pop(('entry', key))
+        self._data.pop(('children', key))
+        self._data.pop(('children', parentDN(key)))
+
+    def clear(self):
+        """ forget everything """
+        with self._lock:
+            self._generation += 1
+        self._data.clear()
+
+    def startRefresher(self, connect, read, stats=None):
+        """ start the Refresher (see there), unless there is one """
+        with self._lock:
+            if self.refresher is not None:
+                return
+            self.refresher = Refresher(self, connect, read, stats)
+        self.refresher.start()
+
+    def stopRefresher(self):
+        """ stop the Refresher, if there is one """
+        with self._lock:
+            refresher, self.refresher = self.refresher, None
+        if refresher is not None:
+            refresher.stop()
+
+
+class _Flight(object):
+    """ a read of an entry in progress """
+
+    __slots__ = ('done', 'ok', 'entry')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+        self.entry = None
+
+
+class Refresher(threading.Thread):
+    """ The worker reading again, one at a time, the entries of a
+    SharedEntryCache that are getting old, on its own LDAP connection:
+    connect() returns a bound one, read(conn, dn) the entry dn or None.
+    Its searches are counted in the Statistics stats. """
+
+    def __init__(self, cache, connect, read, stats=None):
+        threading.Thread.__init__(self, name='ZLDAP refresh')
+        self.daemon = True
+        self.cache = cache
+        self.connect = connect
+        self.read = read
+        self.stats = stats
+        self._queue = Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def schedule(self, dn):
+        """ read dn again soon, unless that is planned already """
+        key = normalizeDN(dn)
+        with self._lock:
+            if key in self._queued:
+                return
+            self._queued.add(key)
+        self._queue.put(dn)
+
+    def stop(self):
+        """ stop after the current refresh """
+        self._queue.put(None)
+
+    def _read(self, dn):
+        """ the entry dn from the server, or None """
+        if self._conn is None:
+            self._conn = self.connect()
+        start = time.time()
+        entry = None
+        error = False
+        try:
+            entry = self.read(self._conn, dn)
+        except ldap.NO_SUCH_OBJECT:
+            self.cache.invalidate(dn)
+        except Exception:
+            error = True
+            raise
+        finally:
+            if self.stats is not None:
+                self.stats.record('search.base', time.time() - start,
+                                  entry and 1 or 0, error)
+        return entry
+
+    def run(self):
+        while True:
+            dn = self._queue.get()
+            if dn is None:
+                break
+            try:
+                # skipped if another thread is reading dn already
+                self.cache.load(dn, self._read, wait=False)
+            except Exception:
+                LOG.warning('Cannot refresh %s', dn, exc_info=True)
+                self._conn = None
+            finally:
+                with self._lock:
+                    self._queued.discard(normalizeDN(dn))
+        if self._conn is not None:
+            try:
+                self._conn.unbind_s()
+            except Exception:
+                pass
+
+
+def sharedCache(key):
+    """ The SharedEntryCache for key (a connection's physical path) """
+    cache = _caches.get(key)
+    if cache is None:
+        with _lock:
+            cache = _caches.setdefault(key, SharedEntryCache())
+    return cache
@@ -0,0 +1,130 @@
+""" Snapshots of mirrors on disk
+
+The Syncer of a Mirror (see Sync) writes the mirrored entries and its
+syncrepl cookie to an SQLite file every SNAPSHOT_INTERVAL seconds when
+they changed.  When the mirror is made again after a restart, the
+snapshot is loaded first: reads are answered from it at once, and the
+sync resumes from the cookie, so the server only sends what changed
+since.  Snapshots older than SNAPSHOT_MAX_AGE seconds are not loaded.
+
+Attribute values are stored one per row, text as TEXT and anything else
+as BLOB, so that loading a file runs no code whoever wrote it.  Files
+are created readable by their owner only, as they hold directory data.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+import six
+
+from .DN import normalizeDN
+
+LOG = logging.getLogger('Products.ZLDAPConnection')
+
+# Seconds between snapshots of a changed mirror
+SNAPSHOT_INTERVAL = 300
+
+# Seconds after which a snapshot is too stale to be loaded
+SNAPSHOT_MAX_AGE = 24 * 3600
+
+# Changed when the layout of the file changes
+SNAPSHOT_FORMAT = 2
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+def snapshotPath(directory, key, base):
+    """ the snapshot file in directory for the mirror of base of the
+    connection key """
+    digest = hashlib.sha1(
+        ('%s\n%s' % (key, normalizeDN(base))).encode('utf-8')).hexdigest()
+    return os.path.join(directory, 'zldap-%s.db' % digest)
+
+
+def _store(value):
+    """ value as stored: text as TEXT, the rest as BLOB """
+    if value is None or isinstance(value, six.text_type):
+        return value
+    return sqlite3.Binary(value)
+
+
+def _load(value):
+    """ the value stored by _store() """
+    if value is None or isinstance(value, six.text_type):
+        return value
+    return bytes(value)
+
+
+def saveSnapshot(path, mirror, attrlist):
+    """ Write the entries and cookie of mirror, read with attrlist, to
+    path.  The file is replaced at once, so that readers never see half
+    of it. """
+    cookie, entries = mirror.dump()
+    temp = '%s.%s.tmp' % (path, os.getpid())
+    if os.path.exists(temp):
+        os.remove(temp)
+    # an empty file is a new database to SQLite
+    os.close(os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+    db = sqlite3.connect(temp)
+    try:
+        db.execute('CREATE TABLE meta (name TEXT PRIMARY KEY, value)')
+        db.execute('CREATE TABLE entries (uuid PRIMARY KEY, dn)')
+        db.execute('CREATE TABLE attrs (uuid, attr TEXT, value)')
+        db.executemany('INSERT INTO meta VALUES (?, ?)', [
+            ('format', SNAPSHOT_FORMAT),
+            ('base', mirror.key),
+            ('attrlist', json.dumps(list(attrlist))),
+            ('cookie', _store(cookie)),
+            ('time', time.time()),
+        ])
+        db.executemany('INSERT INTO entries VALUES (?, ?)',
+                       [(_store(uuid), _store(dn))
+                        for uuid, dn, _attrs in entries])
+        db.executemany('INSERT INTO attrs VALUES (?, ?, ?)',
+                       [(_store(uuid), attr, _store(value))
+                        for uuid, _dn, attrs in entries
+                        for attr, values in attrs.items()
+                        for value in values])
+        db.commit()
+    finally:
+        db.close()
+    _replace(temp, path)
+
+
+def loadSnapshot(path, mirror, attrlist):
+    """ Fill mirror from the snapshot in path, if there is one, of the
+    same subtree read with the same attrlist and recent enough.  Returns
+    true if it was loaded. """
+    if not os.path.exists(path):
+        return False
+    try:
+        db = sqlite3.connect(path)
+        try:
+            meta = dict(db.execute('SELECT name, value FROM meta'))
+            if (meta.get('format') != SNAPSHOT_FORMAT or
+                    meta.get('base') != mirror.key or
+                    meta.get('attrlist') != json.dumps(list(attrlist)) or
+                    (meta.get('time') or 0) + SNAPSHOT_MAX_AGE <
+                    time.time()):
+                return False
+            entries = {}
+            for uuid, dn in db.execute('SELECT uuid, dn FROM entries'):
+                entries[_load(uuid)] = (_load(dn), {})
+            for uuid, attr, value in db.execute(
+                    'SELECT uuid, attr, value FROM attrs ORDER BY rowid'):
+                attrs = entries[_load(uuid)][1]
+                attrs.setdefault(attr, []).append(_load(value))
+        finally:
+            db.close()
+    except Exception:
+        LOG.warning('Cannot load the snapshot %s', path, exc_info=True)
+        return False
+    mirror.restore(_load(meta['cookie']),
+                   [(uuid, dn, attrs) for uuid, (dn, attrs) in
+                    entries.items()])
+    LOG.info('Loaded %d entries of %s from %s', len(entries), mirror.base,
+             path)
+    return True
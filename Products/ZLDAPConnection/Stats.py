@@ -0,0 +1,209 @@
+""" Operation statistics
+
+Every LDAP operation a connection sends is counted, timed and sized here,
+per operation type, along with the hits and misses of its caches.
+Statistics are kept per connection object, for the whole process, with
+the last operations slower than the connection's threshold.
+"""
+import threading
+import time
+from collections import deque
+
+import ldap
+from zope.interface import implementer
+
+from .interfaces import ILDAPOperation
+
+# Upper bounds (milliseconds) of the latency histogram buckets
+LATENCY_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+SEARCH_OPS = {
+    ldap.SCOPE_BASE: 'search.base',
+    ldap.SCOPE_ONELEVEL: 'search.onelevel',
+    ldap.SCOPE_SUBTREE: 'search.subtree',
+}
+
+# Slow operations remembered per connection
+SLOW_LOG_SIZE = 50
+
+SCOPE_NAMES = {
+    ldap.SCOPE_BASE: 'base',
+    ldap.SCOPE_ONELEVEL: 'onelevel',
+    ldap.SCOPE_SUBTREE: 'subtree',
+}
+
+OPERATIONS = ('search.base', 'search.onelevel', 'search.subtree', 'compare',
+              'add', 'modify', 'delete', 'bind', 'reconnect', 'import')
+
+_statistics = {}
+_lock = threading.Lock()
+
+
+def resultSize(result):
+    """ the number of entries in result, as returned by search_s(),
+    result() or result3(), or None if it holds no entries """
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, tuple) and len(result) > 1 and \
+            isinstance(result[1], list):
+        return len(result[1])
+    return None
+
+
+@implementer(ILDAPOperation)
+class Operation(object):
+    """ An operation sent to the server: its type (op), target DN and,
+    for searches, scope, filter and attribute list.  Once done, elapsed,
+    results, error and the URL of the request it was made for are
+    filled in. """
+
+    __slots__ = ('op', 'dn', 'scope', 'filterstr', 'attrlist', 'start',
+                 'elapsed', 'results', 'error', 'url')
+
+    def __init__(self, op, dn, scope=None, filterstr=None, attrlist=None):
+        self.op = op
+        self.dn = dn
+        self.scope = scope
+        self.filterstr = filterstr
+        self.attrlist = attrlist
+        self.start = None
+        self.elapsed = None
+        self.results = None
+        self.error = None
+        self.url = None
+
+    def asDict(self):
+        """ the operation as a dictionary of plain values """
+        return {
+            'op': self.op,
+            'dn': self.dn,
+            'scope': SCOPE_NAMES.get(self.scope),
+            'filter': self.filterstr,
+            'attrs': self.attrlist and list(self.attrlist) or None,
+            'time': self.start,
+            'elapsed_ms': self.elapsed is not None and
+            round(self.elapsed * 1000, 3) or None,
+            'results': self.results,
+            'error': self.error and repr(self.error) or None,
+            'url': self.url,
+        }
+
+
+class OperationStats(object):
+    """ count, errors, latency histogram and result sizes of one type of
+    operation """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.slowest = 0.0
+        self.results = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def record(self, seconds, results=None, error=False):
+        """ account for an operation that took seconds """
+        self.count += 1
+        if error:
+            self.errors += 1
+        self.seconds += seconds
+        self.slowest = max(self.slowest, seconds)
+        if results:
+            self.results += results
+        ms = seconds * 1000
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def asDict(self):
+        """ the statistics as a dictionary of plain values """
+        buckets = [('<=%sms' % bound, n)
+                   for bound, n in zip(LATENCY_BUCKETS, self.buckets)]
+        buckets.append(('>%sms' % LATENCY_BUCKETS[-1], self.buckets[-1]))
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'seconds': round(self.seconds, 6),
+            'average_ms': self.count and
+            round(self.seconds * 1000 / self.count, 3) or 0,
+            'slowest_ms': round(self.slowest * 1000, 3),
+            'results': self.results,
+            'latency': buckets,
+        }
+
+
+class Statistics(object):
+    """ The statistics of a connection """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """ start counting again """
+        with self._lock:
+            self.since = time.time()
+            self._ops = {}
+            self._caches = {}
+            self._slow = deque(maxlen=SLOW_LOG_SIZE)
+
+    def record(self, op, seconds, results=None, error=False):
+        """ account for operation op, which took seconds and returned
+        results entries """
+        with self._lock:
+            stats = self._ops.get(op)
+            if stats is None:
+                stats = self._ops[op] = OperationStats()
+            stats.record(seconds, results, error)
+
+    def slow(self, operation):
+        """ remember the Operation operation as a slow one """
+        with self._lock:
+            self._slow.append(operation.asDict())
+
+    def hit(self, cache):
+        """ count a hit in cache (a name) """
+        with self._lock:
+            self._caches.setdefault(cache, [0, 0])[0] += 1
+
+    def miss(self, cache):
+        """ count a miss in cache (a name) """
+        with self._lock:
+            self._caches.setdefault(cache, [0, 0])[1] += 1
+
+    def snapshot(self):
+        """ Everything, as a dictionary of plain values (suitable for
+        JSON): 'operations' maps operation types to their OperationStats,
+        'caches' cache names to their hits, misses and hit rate, 'slow'
+        lists the last slow operations, most recent first. """
+        with self._lock:
+            operations = dict([(op, stats.asDict())
+                               for op, stats in self._ops.items()])
+            caches = {}
+            for name, (hits, misses) in self._caches.items():
+                total = hits + misses
+                caches[name] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_rate': total and round(float(hits) / total, 4) or 0,
+                }
+            slow = list(reversed(self._slow))
+        return {
+            'since': self.since,
+            'uptime': round(time.time() - self.since, 3),
+            'operations': operations,
+            'caches': caches,
+            'slow': slow,
+        }
+
+
+def statistics(key):
+    """ The Statistics for key (a connection) """
+    stats = _statistics.get(key)
+    if stats is None:
+        with _lock:
+            stats = _statistics.setdefault(key, Statistics())
+    return stats
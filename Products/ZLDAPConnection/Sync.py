@@ -0,0 +1,416 @@
+""" Directory mirrors kept up to date with syncrepl
+
+A Mirror holds every entry of a subtree of the directory in memory.  A
+Syncer thread fills it with an RFC 4533 refreshAndPersist search and then
+applies the changes the server sends as soon as they are made, so that
+reads below the subtree are answered locally with next to no staleness.
+
+Until the first refresh is done, while the session is down, and for a
+few seconds after an entry was written through the connection (until
+the server sends the change back), the mirror does not answer and reads
+go to the server.  With a snapshot directory, mirrors are saved to disk
+and loaded from there when made again (see Snapshot).
+"""
+import logging
+import threading
+import time
+
+import ldap
+import ldap.dn
+from ldap.ldapobject import SimpleLDAPObject
+from ldap.syncrepl import SyncreplConsumer
+
+from .Backends import initialize
+from .DN import normalizeDN, parentDN
+from .Snapshot import SNAPSHOT_INTERVAL, saveSnapshot
+
+LOG = logging.getLogger('Products.ZLDAPConnection')
+
+# Seconds the Syncer waits for changes before checking it should stop
+SYNC_POLL_TIMEOUT = 1
+
+# Seconds before reconnecting after the session failed
+SYNC_RETRY_DELAY = 10
+
+# Seconds an entry written through the connection is read from the server
+# at most, waiting for the server to send the change
+SYNC_STALE_TIMEOUT = 10
+
+_mirrors = {}
+_lock = threading.Lock()
+
+
+def _covers(base, key):
+    """ true if the normalized DN key is base or below it """
+    return key == base or key.endswith(',' + base)
+
+
+class Mirror(object):
+    """ The entries, (dn, decoded attributes), of the subtree below base,
+    by normalized DN.  changed(dn) is called for every entry the server
+    changes. """
+
+    def __init__(self, base, changed=None):
+        self.base = base
+        self.key = normalizeDN(base)
+        self.changed = changed
+        self.ready = False
+        self.cookie = None
+        self.syncer = None
+        self.serial = 0                 # counts the changes
+        self.refreshes = 0              # counts the completed refreshes
+        self._entries = {}
+        self._children = {}
+        self._uuids = {}
+        self._present = None
+        self._stale = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def covers(self, dn):
+        """ true if dn is in the mirrored subtree """
+        return _covers(self.key, normalizeDN(dn))
+
+    def _fresh(self, key):
+        """ true unless key was written through the connection and its
+        change did not come back yet """
+        written = self._stale.get(key)
+        if written is None:
+            return True
+        if written + SYNC_STALE_TIMEOUT < time.time():
+            self._stale.pop(key, None)
+            return True
+        return False
+
+    def lookup(self, dn):
+        """ (known, entry): known is false if the mirror cannot tell, else
+        entry is a copy of the entry dn, or None if there is none """
+        key = normalizeDN(dn)
+        with self._lock:
+            if not self.ready or not self._fresh(key):
+                return False, None
+            entry = self._entries.get(key)
+        if entry is None:
+            return True, None
+        return True, (entry[0], dict(entry[1]))
+
+    def children(self, dn):
+        """ (known, entries): known is false if the mirror cannot tell,
+        else entries are copies of the children of dn, or None if there is
+        no dn """
+        key = normalizeDN(dn)
+        with self._lock:
+            if not self.ready or not self._fresh(key):
+                return False, None
+            if key not in self._entries:
+                return True, None
+            entries = [self._entries[child]
+                       for child in self._children.get(key, ())]
+        return True, [(e[0], dict(e[1])) for e in entries]
+
+    def markStale(self, dn):
+        """ dn is being written through the connection: read it and the
+        children of its parent from the server until the server sends the
+        change """
+        key = normalizeDN(dn)
+        now = time.time()
+        with self._lock:
+            self._stale[key] = now
+            self._stale[parentDN(key)] = now
+
+    # Changes from the server
+
+    def startRefresh(self):
+        """ a refresh begins: note which entries are reported present """
+        with self._lock:
+            self._present = set()
+
+    def update(self, uuid, dn, attrs):
+        """ the entry uuid is now dn, with attrs """
+        key = normalizeDN(dn)
+        moved = []
+        with self._lock:
+            old = self._uuids.get(uuid)
+            if old is not None and old != key:
+                self._remove(old)       # renamed
+                moved = self._move(old, key, dn)
+            self._entries[key] = (dn, attrs)
+            self._children.setdefault(parentDN(key), set()).add(key)
+            self._uuids[uuid] = key
+            self.serial += 1
+            if self._present is not None:
+                self._present.add(uuid)
+            self._stale.pop(key, None)
+            self._stale.pop(parentDN(key), None)
+        self._changed(dn)
+        if old is not None and old != key:
+            self._changed(old)
+        for olddn in moved:
+            self._changed(olddn)
+
+    def present(self, uuids):
+        """ the entries uuids did not change """
+        with self._lock:
+            if self._present is not None:
+                self._present.update(uuids)
+
+    def delete(self, uuids):
+        """ the entries uuids are gone """
+        removed = []
+        with self._lock:
+            for uuid in uuids:
+                key = self._uuids.pop(uuid, None)
+                if key is not None:
+                    self._remove(key)
+                    self._stale.pop(key, None)
+                    self._stale.pop(parentDN(key), None)
+                    removed.append(key)
+            self.serial += len(removed)
+        for key in removed:
+            self._changed(key)
+
+    def dropAbsent(self):
+        """ the refresh reported all the present entries: delete the
+        others """
+        with self._lock:
+            if self._present is None:
+                return
+            absent = [uuid for uuid in self._uuids
+                      if uuid not in self._present]
+            self._present = None
+        self.delete(absent)
+
+    def refreshDone(self):
+        """ the mirror is complete: start answering """
+        with self._lock:
+            self._present = None
+            self.ready = True
+            self.refreshes += 1
+
+    # Snapshots
+
+    def dump(self):
+        """ (cookie, [(uuid, dn, attrs)]) of the current state """
+        with self._lock:
+            entries = [(uuid, self._entries[key][0], self._entries[key][1])
+                       for uuid, key in self._uuids.items()]
+            return self.cookie, entries
+
+    def restore(self, cookie, entries):
+        """ start from the cookie and [(uuid, dn, attrs)] of a dump,
+        answering reads at once """
+        with self._lock:
+            for uuid, dn, attrs in entries:
+                key = normalizeDN(dn)
+                self._entries[key] = (dn, attrs)
+                self._children.setdefault(parentDN(key), set()).add(key)
+                self._uuids[uuid] = key
+            self.cookie = cookie
+            self.ready = True
+
+    def _move(self, old, key, dn):
+        """ The entry old was renamed to key (dn): move the entries
+        below it along, as the server does not send them again (holding
+        the lock).  Returns their old normalized DNs. """
+        suffix = ',' + old
+        moved = [k for k in self._entries if k.endswith(suffix)]
+        if not moved:
+            self._children.pop(old, None)
+            return moved
+        rdns = ldap.dn.str2dn(dn)
+        depth = len(ldap.dn.str2dn(old))
+        renamed = {}
+        for k in moved:
+            childdn, attrs = self._entries.pop(k)
+            childrdns = ldap.dn.str2dn(childdn)
+            newdn = ldap.dn.dn2str(childrdns[:len(childrdns) - depth] + rdns)
+            renamed[k] = newkey = k[:-len(old)] + key
+            self._entries[newkey] = (newdn, attrs)
+        for k in [old] + moved:
+            self._children.pop(k, None)
+        for newkey in renamed.values():
+            self._children.setdefault(parentDN(newkey), set()).add(newkey)
+        for uuid, k in list(self._uuids.items()):
+            if k in renamed:
+                self._uuids[uuid] = renamed[k]
+        self.serial += len(moved)
+        return moved
+
+    def _remove(self, key):
+        """ forget the entry key (holding the lock) """
+        self._entries.pop(key, None)
+        siblings = self._children.get(parentDN(key))
+        if siblings is not None:
+            siblings.discard(key)
+
+    def _changed(self, dn):
+        """ tell about a change """
+        if self.changed is not None:
+            try:
+                self.changed(dn)
+            except Exception:
+                LOG.exception('Cannot invalidate %s', dn)
+
+
+class SyncConnection(SimpleLDAPObject, SyncreplConsumer):
+    """ An LDAP connection applying the syncrepl messages it gets to a
+    Mirror """
+
+    def __init__(self, uri, mirror, decode):
+        SimpleLDAPObject.__init__(self, uri)
+        self.mirror = mirror
+        self.decode = decode
+
+    def syncrepl_get_cookie(self):
+        return self.mirror.cookie
+
+    def syncrepl_set_cookie(self, cookie):
+        self.mirror.cookie = cookie
+
+    def syncrepl_entry(self, dn, attributes, uuid):
+        self.mirror.update(uuid, dn, self.decode(attributes))
+
+    def syncrepl_delete(self, uuids):
+        self.mirror.delete(uuids)
+
+    def syncrepl_present(self, uuids, refreshDeletes=False):
+        if uuids is None:
+            # end of the present phase: the others were deleted, unless
+            # the server sends deletes itself
+            if not refreshDeletes:
+                self.mirror.dropAbsent()
+        elif refreshDeletes:
+            self.mirror.delete(uuids)
+        else:
+            self.mirror.present(uuids)
+
+    def syncrepl_refreshdone(self):
+        self.mirror.refreshDone()
+
+
+class Syncer(threading.Thread):
+    """ A thread keeping a Mirror up to date, reconnecting when the
+    session fails """
+
+    def __init__(self, mirror, host, port, bind_as, pw, attrlist, decode,
+                 snapshot=None):
+        threading.Thread.__init__(self, name='ZLDAP sync %s' % mirror.base)
+        self.daemon = True
+        self.mirror = mirror
+        self.host = host
+        self.port = port
+        self.bind_as = bind_as
+        self.pw = pw
+        self.attrlist = attrlist
+        self.decode = decode
+        self.snapshot = snapshot        # the path of the snapshot file
+        self._saved = (0, mirror.serial)
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """ end the session """
+        self._stopped.set()
+
+    def _connect(self):
+        """ a bound SyncConnection """
+        conn = initialize(self.host, self.port, lambda uri: SyncConnection(
+            uri, self.mirror, self.decode))
+        conn.simple_bind_s(self.bind_as, self.pw)
+        return conn
+
+    def session(self):
+        """ refresh the mirror and follow the changes until stopped """
+        conn = self._connect()
+        try:
+            self.mirror.startRefresh()
+            msgid = conn.syncrepl_search(self.mirror.base, ldap.SCOPE_SUBTREE,
+                                         mode='refreshAndPersist',
+                                         filterstr='(objectClass=*)',
+                                         attrlist=self.attrlist)
+            while not self._stopped.is_set():
+                try:
+                    if not conn.syncrepl_poll(msgid=msgid, all=1,
+                                              timeout=SYNC_POLL_TIMEOUT):
+                        break           # the server ended the search
+                except ldap.TIMEOUT:
+                    pass
+                self.save()
+        finally:
+            try:
+                conn.unbind_s()
+            except ldap.LDAPError:
+                pass
+
+    def save(self):
+        """ write a snapshot if the mirror changed and the last one is
+        SNAPSHOT_INTERVAL seconds old """
+        saved, serial = self._saved
+        if (self.snapshot is None or not self.mirror.ready or
+                serial == self.mirror.serial or
+                saved + SNAPSHOT_INTERVAL > time.time()):
+            return
+        serial = self.mirror.serial
+        try:
+            saveSnapshot(self.snapshot, self.mirror, self.attrlist)
+        except Exception:
+            LOG.exception('Cannot save the snapshot %s', self.snapshot)
+        self._saved = (time.time(), serial)
+
+    def run(self):
+        while not self._stopped.is_set():
+            refreshes = self.mirror.refreshes
+            try:
+                self.session()
+            except Exception as exc:
+                LOG.exception('Sync of %s failed, retrying in %s seconds',
+                              self.mirror.base, SYNC_RETRY_DELAY)
+                if self.mirror.refreshes == refreshes and _rejected(exc):
+                    # e.g. e-syncRefreshRequired, or an expired or unknown
+                    # cookie: start over with a full refresh
+                    self.mirror.cookie = None
+            # changes may be missed until the next refresh
+            self.mirror.ready = False
+            self._stopped.wait(SYNC_RETRY_DELAY)
+
+
+def _rejected(exc):
+    """ true if the session failed with exc because the server refused
+    to go on from our cookie, rather than because it was not reachable """
+    return isinstance(exc, ldap.LDAPError) and not isinstance(
+        exc, (ldap.SERVER_DOWN, ldap.CONNECT_ERROR, ldap.TIMEOUT))
+
+
+def mirror(key, base, start):
+    """ The Mirror of the subtree base for key (a connection's physical
+    path).  A new one is made to sync by start(mirror), which returns its
+    Syncer; None is returned if that fails, or if there is no mirror yet
+    and start is None. """
+    mkey = (key, normalizeDN(base))
+    found = _mirrors.get(mkey)
+    if found is not None or start is None:
+        return found
+    with _lock:
+        found = _mirrors.get(mkey)
+        if found is not None:
+            return found
+        found = _mirrors[mkey] = Mirror(base)
+    try:
+        found.syncer = start(found)
+    except Exception:
+        LOG.exception('Cannot start the sync of %s', base)
+        with _lock:
+            _mirrors.pop(mkey, None)
+        return None
+    return found
+
+
+def stopMirrors(key):
+    """ stop and forget the mirrors of key """
+    with _lock:
+        stopped = [mkey for mkey in _mirrors if mkey[0] == key]
+        stopped = [_mirrors.pop(mkey) for mkey in stopped]
+    for found in stopped:
+        if found.syncer is not None:
+            found.syncer.stop()
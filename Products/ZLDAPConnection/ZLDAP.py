@@ -9,11 +9,21 @@
 # pylint: disable=no-init,old-style-class,too-many-public-methods
 # pylint: disable=too-many-instance-attributes,too-many-arguments
 # pylint: disable=too-many-function-args
+import json
+import logging
 import time
+from contextlib import contextmanager
+from functools import partial
 import six.moves.urllib.request
 import six.moves.urllib.parse
 import six.moves.urllib.error
 import ldap
+from ldap.controls import SimplePagedResultsControl
+from ldap.controls.libldap import AssertionControl
+from ldap.controls.readentry import PostReadControl
+import transaction
+from ZODB.POSException import ConflictError
+from zope.component import getAllUtilitiesRegisteredFor
 import Acquisition
 import OFS
 from Persistence import Persistent
@@ -21,10 +31,38 @@ from App.Dialogs import MessageDialog
 from App.special_dtml import HTMLFile
 
 from . import LDCAccessors
+from .Auth import bindPool, verifiedCredentials
+from .Backends import backendFor, initialize
+from .Binary import binaryCache
+from .Bulk import LDIFImporter, DEFAULT_WINDOW
+from .Bulk import DEFAULT_PAGE_SIZE, EXPORT_FORMATS, ResponseWriter
+from .DN import normalizeDN, parentDN
 from .Entry import ZopeEntry, GenericEntry, TransactionalEntry
+from .Entry import VERSION_ATTRS, popVersion, AttrWrap
+from .Groups import expandGroups, groupCache, touchesGroups
+from .interfaces import ILDAPOperationObserver
+from .Pending import PendingChange, PendingIndex
+from .Record import LDAPRecord
+from .Schema import Schema, SCHEMA_ATTRS
+from .Schema import cachedSchema, decodeValue, encodeValues, objectClassesOf
+from .SharedCache import sharedCache
+from .Snapshot import loadSnapshot, snapshotPath
+from .Sync import Syncer, mirror, stopMirrors
+from .Stats import Operation, SEARCH_OPS, resultSize, statistics
 
 ConnectionError = 'ZLDAP Connection Error'
 
+LOG = logging.getLogger('Products.ZLDAPConnection')
+
+# attributes requested when reading entries
+ENTRY_ATTRS = ['*'] + list(VERSION_ATTRS)
+
+# Seconds the cached root entry is used before checking its revision
+ROOT_CHECK_INTERVAL = 60
+
+# (host, port) of the servers found not to support the assertion control
+_unasserted = set()
+
 manage_addZLDAPConnectionForm = HTMLFile('add', globals())
 
 
@@ -32,6 +70,47 @@ class NoBrainer:
     """ Empty class for mixin to EntryFactory """
 
 
+class LDAPDataManager(object):
+    """ Joins a ZLDAPConnection to the current transaction and relays
+    the two-phase commit calls to the connection. """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.transaction_manager = transaction.manager
+
+    def abort(self, txn):
+        """abort."""
+        self.conn.tpc_abort(txn)
+
+    def tpc_begin(self, txn):
+        """tpc_begin."""
+        self.conn.tpc_begin(txn)
+
+    def commit(self, txn):
+        """commit."""
+        for entries in list(self.conn._registeredEntries().values()):
+            for o in entries:
+                self.conn.commit(o, txn)
+
+    def tpc_vote(self, txn):
+        """tpc_vote."""
+        self.conn.tpc_vote(txn)
+
+    def tpc_finish(self, txn):
+        """tpc_finish."""
+        self.conn.tpc_finish(txn)
+
+    def tpc_abort(self, txn):
+        """tpc_abort."""
+        self.conn.tpc_abort(txn)
+
+    def sortKey(self):
+        """ Vote after the other resources (such as ZODB, whose keys
+        start with letters or digits): what is sent to the LDAP server in
+        tpc_vote cannot be taken back if a later vote fails. """
+        return '~ZLDAPConnection:%s' % id(self.conn)
+
+
 class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
                       LDCAccessors.LDAPConnectionAccessors,
                       OFS.role.RoleManager):
@@ -46,24 +125,39 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
         {'label': 'Connection Properties', 'action': 'manage_main'},
         {'label': 'Open/Close', 'action': 'manage_connection'},
         {'label': 'Browse', 'action': 'manage_browse'},
+        {'label': 'Import', 'action': 'manage_import'},
+        {'label': 'Statistics', 'action': 'manage_statistics'},
         {'label': 'Security', 'action': 'manage_access'},
     )
 
     __ac_permissions__ = (
         ('Access contents information',
-         ('canBrowse',),),
+         ('canBrowse', 'getSubRecords', 'searchRecords', 'exists',
+          'compare', 'getGroups', 'isMemberOf'),),
         ('View management screens', ('manage_tabs', 'manage_main'),
          ('Manager',)),
-        ('Edit connection', ('manage_edit',), ('Manager',)),
+        ('Edit connection', ('manage_edit', 'manage_resetStatistics'),
+         ('Manager',)),
         ('Change permissions', ('manage_access',)),
         ('Open/Close Connection', ('manage_connection',
                                    'manage_open', 'manage_close',),
          ('Manager',)),
-        ('Browse Connection Entries', ('manage_browse',), ('Manager',),),
+        ('Browse Connection Entries', ('manage_browse', 'exportSubtree',
+                                       'manage_exportSubtree', 'getRootDSE',
+                                       'supportsControl'),
+         ('Manager',),),
+        ('Manage Entry information', ('beginBatch', 'endBatch'),),
+        ('Verify LDAP Credentials', ('authenticate',), ('Manager',)),
+        ('View LDAP Statistics', ('manage_statistics', 'getStatistics',
+                                  'statisticsJSON'), ('Manager',)),
+        ('Create New Entry Objects', ('manage_import', 'manage_importLDIF',
+                                      'importLDIF'), ('Manager',)),
     )
 
     manage_browse = HTMLFile('browse', globals())
     manage_connection = HTMLFile('connection', globals())
+    manage_import = HTMLFile('import', globals())
+    manage_statistics = HTMLFile('statistics', globals())
 
     # dealing with browseability on the root.
     def canBrowse(self):
@@ -76,7 +170,8 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
                  transactional=1):
         "init method"
         self._v_conn = None
-        self._v_delete = []
+        self._v_pending = PendingIndex()
+        self._v_changes = {}
         self._v_openc = 0
 
         self.setId(ob_id)
@@ -99,7 +194,8 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
         self._refreshEntryClass()
         Persistent.__setstate__(self, state)
         self._v_conn = None
-        self._v_delete = []
+        self._v_pending = PendingIndex()
+        self._v_changes = {}
         self._v_openc = 0
 
     # Entry Factory stuff
@@ -163,42 +259,21 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
 
     def commit(self, o, *ignored):
         ''' o = object to commit '''
-        # check to see if object exists
-        oko = []
-        if self.hasEntry(o.dn):
-            oko.append(o)
-        elif o._isNew or o._isDeleted:
+        # Entries changed or deleted on the server meanwhile are caught
+        # in tpc_vote (see _checkVote), no need to look
+        oko = self._v_okobjects
+        if o not in oko:
             oko.append(o)
-        self._v_okobjects = oko
 
     def tpc_finish(self, *ignored):
         " really really commit and DON'T FAIL "
-        oko = self._v_okobjects
-        self._isCommitting = 1
-        d = getattr(self, '_v_delete', [])
-
-        for deldn in d:
-            self._deleteEntry(deldn)
-        self._v_delete = []
-
-        for o in oko:
-            try:
-                if o._isDeleted:
-                    pass
-                    # we shouldn't need to do anything now that
-                    # the mass delete has happened
-                elif o._isNew:
-                    self._addEntry(o.dn, list(o._data.items()))
-                    o._isNew = 0
-                    del self._v_add[o.dn]
-                else:
-                    o._modify()
+        # everything was sent in tpc_vote
+        for entries in self._registeredEntries().values():
+            for o in entries:
                 o._registered = 0
-            except Exception:
-                pass    # X X X We should log errors here
+        self._v_registered = None
 
         del self._v_okobjects
-        del self._isCommitting
         self.GetConnection().destroy_cache()
 
     def tpc_abort(self, *ignored):
@@ -214,30 +289,261 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
         :param o:
         :param ignored:
         """
-        if o.dn in getattr(self, '_v_delete', ()):
-            self._v_delete.remove(o.dn)
+        pending = self._pending()
+        pending.undelete(o.dn)
         if o._isDeleted:
             o.undelete()
         o._rollback()
         o._registered = 0
         if o._isNew:
-            if o.dn in list(getattr(self, '_v_add', {}).keys()):
-                del self._v_add[o.dn]
+            pending.discardAdd(o.dn)
         self.GetConnection().destroy_cache()
 
     def _abort(self):
         """_abort."""
-        oko = self._v_okobjects
-        for o in oko:
-            self.abort(o)
+        for entries in self._registeredEntries().values():
+            for o in entries:
+                self.abort(o)
+        self._v_registered = None
+        self._v_changes = {}
+        self._v_okobjects = []
         self.GetConnection().destroy_cache()
 
     def tpc_vote(self, *ignored):
-        """tpc_vote.
+        """ Send the changes: the modifications, one per DN, then the
+        deletes and the adds.  Before anything is sent, _checkVote() makes
+        sure that no entry was changed, deleted or added by someone else
+        since the transaction read it; if one was, a ConflictError aborts
+        the transaction.  The modifications also carry an assertion on the
+        revision the entry was read at, for changes made in between.  We
+        vote last (see LDAPDataManager.sortKey), as what was sent cannot
+        be undone: if a write fails all the same, the DNs already written
+        are logged. """
+        self._v_committing = 1
+        written = []
+        try:
+            self._checkVote()
+            self._flushChanges(written)
+            self._flushDeletes(written)
+            self._flushAdds(written)
+        except Exception:
+            if written:
+                LOG.error('LDAP transaction failed after writing %s',
+                          '; '.join(written))
+            raise
+        finally:
+            self._v_committing = 0
+
+    def _checkVote(self):
+        """ Check with pipelined base reads that the entries changed by
+        the transaction are still at the revision they were read at, that
+        those deleted still exist and that those added do not, raising a
+        ConflictError otherwise """
+        pending = self._pending()
+        checks = []                     # (dn, filter, should exist)
+        for change in getattr(self, '_v_changes', {}).values():
+            if change and change.version and \
+                    not pending.isDeleted(change.dn) and \
+                    pending.getAdded(change.dn) is None:
+                checks.append((change.dn, change.version, True))
+        for deldn in pending.deletedDNs():
+            checks.append((deldn, '(objectClass=*)', True))
+        for o in self._v_okobjects:
+            if o._isNew and not o._isDeleted:
+                checks.append((o.dn, '(objectClass=*)', False))
+        msgids = [self._call(None, dn, 'search_ext', dn, ldap.SCOPE_BASE,
+                             filterstr, ['1.1'])
+                  for dn, filterstr, _exists in checks]
+        conflicts = []
+        for (dn, filterstr, exists), msgid in zip(checks, msgids):
+            try:
+                _rtype, rdata = self._perform(
+                    Operation('search.base', dn, ldap.SCOPE_BASE, filterstr,
+                              ['1.1']), 'result', msgid)
+            except ldap.NO_SUCH_OBJECT:
+                rdata = []
+            if bool(rdata) == exists:
+                continue
+            if not exists:
+                conflicts.append('%s was added by someone else' % dn)
+            elif filterstr == '(objectClass=*)':
+                conflicts.append('%s was deleted by someone else' % dn)
+            else:
+                # don't read the outdated revision again on retry
+                self._invalidate(dn)
+                conflicts.append('%s was changed by someone else' % dn)
+        if conflicts:
+            raise ConflictError('LDAP entry ' + '; '.join(conflicts))
+
+    def _flushDeletes(self, written):
+        """ send the pending deletes, subentries first, adding their DNs
+        to written """
+        pending = self._pending()
+        for deldn in pending.deletedDNs():
+            self._discardChange(deldn)
+            try:
+                self._deleteEntry(deldn)
+            except ldap.NO_SUCH_OBJECT:
+                raise ConflictError(
+                    'LDAP entry %s was deleted by someone else' % deldn)
+            written.append(deldn)
+            pending.undelete(deldn)
+
+    def _flushAdds(self, written):
+        """ send the pending adds, parents first, adding their DNs to
+        written """
+        pending = self._pending()
+        for o in self._v_okobjects:
+            if o._isDeleted or not o._isNew:
+                continue
+            self._discardChange(o.dn)
+            try:
+                self._addEntry(o.dn, list(o._data.items()))
+            except ldap.ALREADY_EXISTS:
+                raise ConflictError(
+                    'LDAP entry %s was added by someone else' % o.dn)
+            written.append(o.dn)
+            o._isNew = 0
+            pending.discardAdd(o.dn)
+
+    def _committing(self):
+        """ True if changes may be sent to the server now: during
+        tpc_vote, or at any time when not transactional """
+        return getattr(self, '_v_committing', 0) or \
+            not self.getTransactional()
+
+    def _registeredEntries(self):
+        """ entries registered in the current transaction, grouped by
+        normalized DN """
+        return getattr(self, '_v_registered', None) or {}
+
+    def _registerEntry(self, o):
+        """ register a changed entry with the current transaction """
+        registered = getattr(self, '_v_registered', None)
+        if registered is None:
+            registered = self._v_registered = {}
+            transaction.get().join(LDAPDataManager(self))
+        entries = registered.setdefault(normalizeDN(o.dn), [])
+        if o not in entries:
+            entries.append(o)
+
+    # pending modifications, coalesced per normalized DN
+    def _queueModify(self, o, attrs=None, deleted=()):
+        """ Merge a modification of entry o into the change pending for
+        its DN.  Non-transactional connections send it right away unless
+        a batch is open. """
+        changes = getattr(self, '_v_changes', None)
+        if changes is None:
+            changes = self._v_changes = {}
+        key = normalizeDN(o.dn)
+        change = changes.get(key)
+        if change is None:
+            change = changes[key] = PendingChange(o.dn, o._version)
+        if o not in change.entries:
+            change.entries.append(o)
+        if attrs:
+            change.set(attrs)
+        if deleted:
+            change.remove(deleted)
+        if not self.getTransactional() and not getattr(self, '_v_batch', 0):
+            self._flushChanges()
+
+    def _discardChange(self, dn):
+        """ forget the change pending for dn, if any """
+        getattr(self, '_v_changes', {}).pop(normalizeDN(dn), None)
+
+    def _flushChanges(self, written=None):
+        """ send every pending change as a single modify per DN, adding
+        the DNs to written if given """
+        changes = getattr(self, '_v_changes', {})
+        pending = self._pending()
+        try:
+            self._checkPending()
+            for key, change in list(changes.items()):
+                del changes[key]
+                if not change or pending.isDeleted(change.dn) or \
+                        pending.getAdded(change.dn) is not None:
+                    # deleted or added as a whole anyway
+                    continue
+                try:
+                    version = self._modifyEntry(change.dn, change.modlist(),
+                                                change.version)
+                except ldap.ASSERTION_FAILED:
+                    # don't read the outdated revision again on retry
+                    self._invalidate(change.dn)
+                    raise ConflictError(
+                        'LDAP entry %s was changed by someone else' %
+                        change.dn)
+                if written is not None:
+                    written.append(change.dn)
+                for o in change.entries:
+                    o._version = version
+                root = getattr(self, '_v_root', None)
+                if root is not None and root[0] not in change.entries and \
+                        normalizeDN(change.dn) == normalizeDN(self.dn):
+                    self._v_root = None
+        except Exception:
+            changes.clear()
+            raise
+
+    def _checkPending(self):
+        """ Check the pending adds and modifications against the schema,
+        raising ldap.OBJECT_CLASS_VIOLATION before anything is sent """
+        schema = self._checkingSchema()
+        problems = []
+        for o in self._pending().addedEntries():
+            problems.extend(['%s: %s' % (o.dn, p)
+                             for p in schema.checkEntry(o._data)])
+        for change in getattr(self, '_v_changes', {}).values():
+            replaced = change.replaced()
+            found = schema.checkValues(replaced)
+            removed = change.removed()
+            data = None
+            if change.entries:
+                # only look at data that is already loaded
+                data = Acquisition.aq_base(change.entries[0]).__dict__.get(
+                    '_data')
+            if data is not None:
+                if removed:
+                    found.extend(schema.checkRemove(data, removed))
+                objectclasses = (objectClassesOf(replaced) or
+                                 objectClassesOf(data))
+                found.extend(schema.checkAllowed(
+                    objectclasses, [a for a, v in replaced.items() if v]))
+            problems.extend(['%s: %s' % (change.dn, p) for p in found])
+        if problems:
+            raise ldap.OBJECT_CLASS_VIOLATION({
+                'desc': 'Object class violation',
+                'info': '; '.join(problems)})
+
+    def beginBatch(self):
+        """ Hold back the changes of non-transactional entries until the
+        matching endBatch(), so that repeated set() calls on one DN are
+        sent as a single modify operation.  Batches may be nested. """
+        self._v_batch = getattr(self, '_v_batch', 0) + 1
+
+    def endBatch(self):
+        """ Close a batch opened by beginBatch().  The queued changes
+        are sent when the outermost batch is closed. """
+        self._v_batch = max(getattr(self, '_v_batch', 0) - 1, 0)
+        if not self._v_batch:
+            self._flushChanges()
+
+    @contextmanager
+    def batch(self):
+        """ beginBatch()/endBatch() as a context manager """
+        self.beginBatch()
+        try:
+            yield self
+        finally:
+            self.endBatch()
 
-        :param ignored:
-        """
-        pass
+    def _pending(self):
+        """ the index of uncommitted adds and deletes """
+        pending = getattr(self, '_v_pending', None)
+        if pending is None:
+            pending = self._v_pending = PendingIndex()
+        return pending
 
     # getting entries and attributes
     def hasEntry(self, dn):
@@ -245,45 +551,148 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
 
         :param dn:
         """
-        if dn in getattr(self, '_v_add', {}):
-            # object is marked for adding
-            return 1
-        elif dn in getattr(self, '_v_delete', ()):
-            # object is marked for deletion
-            return 0
-
+        return self.exists(dn) and 1 or 0
+
+    def exists(self, dn):
+        """ True if the entry dn exists, taking uncommitted adds and
+        deletes into account.  Asks the server for no attribute at all. """
+        pending = self._pending()
+        if pending.getAdded(dn) is not None:
+            return True
+        elif pending.isDeleted(dn):
+            return False
         try:
-            e = self._connection().search_s(dn, ldap.SCOPE_BASE,
-                                            'objectclass=*')
-            if e:
-                return 1
+            e = self._search(dn, ldap.SCOPE_BASE, '(objectClass=*)', ['1.1'])
         except ldap.NO_SUCH_OBJECT:
-            return 0
-        return 0
+            return False
+        return bool(e)
+
+    def compare(self, dn, attr, value):
+        """ True if the entry dn has value among the values of attr,
+        as decided by the server's matching rule for attr (LDAP compare),
+        e.g. compare(groupdn, 'member', userdn).  Raises
+        ldap.NO_SUCH_OBJECT if there is no such entry. """
+        pending = self._pending()
+        added = pending.getAdded(dn)
+        if added is not None:
+            for name, values in added._data.items():
+                if name.lower() == attr.lower():
+                    return value in values
+            return False
+        elif pending.isDeleted(dn):
+            raise ldap.NO_SUCH_OBJECT("Cannot retrieve entry '%s'" % dn)
+        try:
+            result = self._call('compare', dn, 'compare_s', dn, attr,
+                                encodeValues(value)[0])
+        except ldap.COMPARE_TRUE:
+            return True
+        except ldap.COMPARE_FALSE:
+            return False
+        except ldap.NO_SUCH_ATTRIBUTE:
+            return False
+        return bool(result)
 
     def getRawEntry(self, dn):
         " return raw entry from LDAP module "
-        if dn in getattr(self, '_v_add', {}):
-            return (dn, self._v_add[dn]._data)
-        elif dn in getattr(self, '_v_delete', ()):
+        pending = self._pending()
+        added = pending.getAdded(dn)
+        if added is not None:
+            return (added.dn, added._data)
+        elif pending.isDeleted(dn):
             raise ldap.NO_SUCH_OBJECT("Entry '%s' has been deleted" % dn)
 
+        return self._readEntry(dn)
+
+    def _readEntry(self, dn):
+        """ (dn, decoded attributes) of entry dn as the server has it,
+        from its mirror or the shared cache if they are on """
+        found = self._mirrorFor(dn)
+        if found is not None:
+            known, e = found.lookup(dn)
+            if known:
+                self._statistics().hit('mirror')
+                if e is None:
+                    raise ldap.NO_SUCH_OBJECT(
+                        "Cannot retrieve entry '%s'" % dn)
+                return e
+            self._statistics().miss('mirror')
+        shared = self._sharedCache()
+        if shared is None:
+            return self._searchEntry(dn)
+        e = shared.getEntry(dn)
+        if e is not None:
+            self._statistics().hit('shared')
+            return e
+        self._statistics().miss('shared')
+        # one search for all the threads wanting dn
+        return shared.load(dn, self._searchEntry)
+
+    def _searchEntry(self, dn):
+        """ (dn, decoded attributes) of entry dn, read from the
+        server """
         try:
-            e = self._connection().search_s(
-                dn, ldap.SCOPE_BASE, 'objectclass=*'
-            )
-            if e:
-                return e[0]
+            e = self._search(dn, ldap.SCOPE_BASE, 'objectclass=*',
+                             self._entryAttrs())
         except Exception:
             raise ldap.NO_SUCH_OBJECT("Cannot retrieve entry '%s'" % dn)
+        if e:
+            return (e[0][0], self.getSchema().decodeText(e[0][1]))
+
+    def _entryAttrs(self):
+        """ The attributes requested when reading entries: the text
+        attributes of the schema (see Schema.textAttributes) and the
+        revision ones, so that binary values are not sent; they are read
+        by getBinaryAttribute() when asked for.  When the schema is not
+        known, all the user attributes are asked for, and binary values
+        among them are dropped on arrival (see Schema.decodeText). """
+        text = self.getSchema().textAttributes()
+        if text is None:
+            return ENTRY_ATTRS
+        return text + list(VERSION_ATTRS)
+
+    def getBinaryAttribute(self, dn, attr):
+        """ Return (values, version) for the binary attribute attr of
+        dn, version being the entry's revision (see popVersion).  Values
+        are kept in a byte-budgeted cache shared by the connections to our
+        server (see Binary.BinaryCache), until the entry is changed
+        through one of them or BINARY_CACHE_TTL seconds have passed. """
+        added = self._pending().getAdded(dn)
+        if added is not None:
+            return AttrWrap(added._data.get(attr, ())), None
+        cache = binaryCache((self.host, self.port))
+        cached = cache.get(dn, attr)
+        if cached is not None:
+            self._statistics().hit('binary')
+            return cached
+        self._statistics().miss('binary')
+        generation = cache.generation()
+        try:
+            r = self._search(dn, ldap.SCOPE_BASE, '(objectClass=*)',
+                             [attr] + list(VERSION_ATTRS))
+        except ldap.NO_SUCH_OBJECT:
+            raise ldap.NO_SUCH_OBJECT("Cannot retrieve entry '%s'" % dn)
+        attrs = dict(r and r[0][1] or {})
+        version = popVersion(attrs)
+        values = ()
+        for name, found in attrs.items():
+            if name.split(';')[0].lower() == attr.lower():
+                values = found
+        result = (AttrWrap(values), version)
+        cache.set(dn, attr, result, generation)
+        return result
+
+    def _entryVersion(self, dn):
+        """ the current revision of dn, read without any attribute """
+        r = self._search(dn, ldap.SCOPE_BASE, '(objectClass=*)',
+                         list(VERSION_ATTRS))
+        return r and popVersion(dict(r[0][1])) or None
 
     def getEntry(self, dn, o=None):
         " return **unwrapped** Entry object, unless o is specified "
         Entry = self._EntryFactory()
 
-        if dn in getattr(self, '_v_add', {}):
-            e = self._v_add[dn]
-        else:
+        e = self._pending().getAdded(dn)
+        if e is None:
             e = self.getRawEntry(dn)
             e = Entry(e[0], e[1], self)
 
@@ -292,8 +701,38 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
         return e
 
     def getRoot(self):
-        " return root entry object "
-        return self.getEntry(self.dn, self)
+        """ return root entry object.  It is kept for the life of the
+        connection: every ROOT_CHECK_INTERVAL seconds its revision is
+        compared with the server's, and it is read again if it changed.
+        Its list of subentries is read again at that check too, and as
+        soon as entries are changed through this connection (see
+        _invalidate) or through its copies in other threads (the
+        generation of the shared cache changes).  Nothing is dropped while
+        the transaction has changed entries, so that their objects stay
+        the ones the changes were made on. """
+        root = getattr(self, '_v_root', None)
+        now = time.time()
+        generation = self._sharedGeneration()
+        if root is not None and not self._registeredEntries():
+            entry = root[0]
+            if root[1] + ROOT_CHECK_INTERVAL < now:
+                if entry._version is None or \
+                        entry._version != self._entryVersion(self.dn):
+                    root = None
+                else:
+                    entry._clearSubentries()
+                    root = self._v_root = (entry, now, generation)
+            elif root[2] != generation:
+                entry._clearSubentries()
+                root = self._v_root = (entry, root[1], generation)
+        if root is None:
+            self._statistics().miss('root')
+            # keep no reference to the request the root was first read in
+            conn = Acquisition.aq_base(self)
+            root = self._v_root = (conn.getEntry(self.dn), now, generation)
+        else:
+            self._statistics().hit('root')
+        return root[0].__of__(self)
 
     def getAttributes(self, dn):
         " get raw attributes from entry from LDAP module "
@@ -303,18 +742,148 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
 
     def getRawSubEntries(self, dn):
         " get the raw entry objects of entry dn's immediate children "
-        # X X X Do something soon to account for added but noncommited..?
-        if dn in getattr(self, '_v_delete', ()):
+        pending = self._pending()
+        if pending.isDeleted(dn):
             raise ldap.NO_SUCH_OBJECT
-        results = self._connection().search_s(
-            dn, ldap.SCOPE_ONELEVEL, 'objectclass=*')
         r = []
-        for entry in results:
-            # make sure that the subentry isn't marked for deletion
-            if entry[0] not in getattr(self, '_v_delete', ()):
-                r.append(entry)
+        if pending.getAdded(dn) is None:
+            for entry in self._readChildren(dn):
+                # make sure that the subentry isn't marked for deletion
+                if not pending.isChildDeleted(entry[0]):
+                    r.append(entry)
+        # and overlay the subentries added but not yet committed
+        for added in pending.addedChildren(dn):
+            r.append((added.dn, added._data))
         return r
 
+    def _readChildren(self, dn):
+        """ [(dn, decoded attributes)] of the children of dn as the
+        server has them, from its mirror or the shared cache if they
+        are on """
+        found = self._mirrorFor(dn)
+        if found is not None:
+            known, children = found.children(dn)
+            if known:
+                self._statistics().hit('mirror')
+                if children is None:
+                    raise ldap.NO_SUCH_OBJECT(
+                        "Cannot retrieve entry '%s'" % dn)
+                return children
+            self._statistics().miss('mirror')
+        shared = self._sharedCache()
+        if shared is not None:
+            children = shared.getChildren(dn)
+            if children is not None:
+                self._statistics().hit('shared')
+                return children
+            self._statistics().miss('shared')
+            generation = shared.generation()
+        decode = self.getSchema().decodeText
+        children = [(entry[0], decode(entry[1])) for entry in
+                    self._search(dn, ldap.SCOPE_ONELEVEL, 'objectclass=*',
+                                 self._entryAttrs())]
+        if shared is not None:
+            shared.setChildren(dn, children, generation)
+            children = [(entry[0], dict(entry[1])) for entry in children]
+        return children
+
+    def _sharedKey(self):
+        """ Our physical path, which the copies of this connection in
+        all the threads share, or None if it is not known """
+        key = getattr(self, '_v_sharedkey', None)
+        if key is None:
+            if Acquisition.aq_parent(self) is None:
+                # unwrapped, our path is unknown
+                return None
+            key = self._v_sharedkey = '/'.join(self.getPhysicalPath())
+        return key
+
+    def _sharedCache(self, refresh=True):
+        """ The SharedEntryCache of all the copies of this connection,
+        or None if it is not used.  Its refresher is started unless
+        refresh is false (which saves reading the schema). """
+        if not self.getSharedCache():
+            return None
+        key = self._sharedKey()
+        if key is None:
+            return None
+        shared = sharedCache(key)
+        if refresh and shared.refresher is None:
+            self._startRefresher(shared)
+        return shared
+
+    def _sharedGeneration(self):
+        """ the generation of the shared cache (see SharedEntryCache),
+        or None if it is not used """
+        shared = self._sharedCache(refresh=False)
+        if shared is None:
+            return None
+        return shared.generation()
+
+    def _startRefresher(self, shared):
+        """ start the worker reading again the entries of the shared
+        cache that are getting old, on a connection of its own """
+        host, port, bind_as, pw = self.host, self.port, self.bind_as, self.pw
+        attrlist = self._entryAttrs()
+        decode = self.getSchema().decodeText
+
+        def connect():
+            conn = initialize(host, port)
+            conn.simple_bind_s(bind_as, pw)
+            return conn
+
+        def read(conn, dn):
+            e = conn.search_s(dn, ldap.SCOPE_BASE, 'objectclass=*', attrlist)
+            if e:
+                return (e[0][0], decode(e[0][1]))
+
+        shared.startRefresher(connect, read, self._statistics())
+
+    def _mirrorFor(self, dn, start=True):
+        """ The Sync.Mirror of the synchronized subtree dn is in, or
+        None.  Unless start, only a mirror already syncing is returned. """
+        subtrees = self.getSyncSubtrees()
+        if not subtrees or backendFor(self.host, self.port) is not None:
+            return None
+        key = self._sharedKey()
+        if key is None:
+            return None
+        for base in subtrees:
+            found = mirror(key, base, start and self._startSync or None)
+            if found is not None and found.covers(dn):
+                return found
+        return None
+
+    def _startSync(self, found):
+        """ start the thread keeping the Mirror found up to date """
+        key = self._sharedKey()
+        found.changed = sharedCache(key).invalidate
+        attrlist = self._entryAttrs()
+        snapshot = None
+        if self.getSnapshotDir():
+            snapshot = snapshotPath(self.getSnapshotDir(), key, found.base)
+            loadSnapshot(snapshot, found, attrlist)
+        syncer = Syncer(found, self.host, self.port, self.bind_as, self.pw,
+                        attrlist, self.getSchema().decodeText, snapshot)
+        syncer.start()
+        return syncer
+
+    def _invalidate(self, dn):
+        """ dn was changed: drop it and its binary values from the
+        shared caches, and read it from the server until its mirror has
+        the change.  The root's list of subentries is read again if dn is
+        one of them. """
+        binaryCache((self.host, self.port)).invalidate(dn)
+        shared = self._sharedCache(refresh=False)
+        if shared is not None:
+            shared.invalidate(dn)
+        root = getattr(self, '_v_root', None)
+        if root is not None and parentDN(dn) == normalizeDN(self.dn):
+            root[0]._clearSubentries()
+        found = self._mirrorFor(dn, start=False)
+        if found is not None:
+            found.markStale(dn)
+
     def getSubEntries(self, dn, o=None):
         """getSubEntries.
 
@@ -334,46 +903,188 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
 
         return r
 
-    # modifying entries
-    def _modifyEntry(self, dn, modlist):
-        """_modifyEntry.
+    def getSubRecords(self, dn):
+        """ the immediate children of entry dn as LDAPRecords """
+        return [LDAPRecord(entry[0], entry[1], self)
+                for entry in self.getRawSubEntries(dn)]
+
+    def searchRecords(self, base=None, scope=ldap.SCOPE_SUBTREE,
+                      filterstr='(objectClass=*)', attrlist=None):
+        """ Search below base (the base DN by default) and return the
+        results as LDAPRecords, cheap read-only records that turn into
+        Entry objects through getObject().  Uncommitted changes are not
+        taken into account. """
+        decode = self.getSchema().decode
+        if attrlist is None:
+            attrlist = self._entryAttrs()
+            decode = self.getSchema().decodeText
+        return [LDAPRecord(dn, decode(attrs), self) for dn, attrs in
+                self._pagedSearch(base or self.dn, scope, filterstr,
+                                  attrlist)]
+
+    def _pagedSearch(self, dn, scope=ldap.SCOPE_SUBTREE,
+                     filterstr='(objectClass=*)', attrlist=None,
+                     pagesize=DEFAULT_PAGE_SIZE):
+        """ Generate the (dn, attrs) results of a search, fetched from
+        the server one page (simple paged results control) at a time """
+        if not self.supportsControl(ldap.CONTROL_PAGEDRESULTS):
+            for entry in self._search(dn, scope, filterstr, attrlist):
+                if entry[0] is not None:
+                    yield entry
+            return
+        c = self._connection()
+        control = SimplePagedResultsControl(True, size=pagesize, cookie='')
+
+        def page():
+            msgid = c.search_ext(dn, scope, filterstr, attrlist,
+                                 serverctrls=[control])
+            return c.result3(msgid)
+
+        while True:
+            _rtype, rdata, _rmsgid, serverctrls = self._perform(
+                Operation(SEARCH_OPS[scope], dn, scope, filterstr, attrlist),
+                page)
+            for entry in rdata:
+                if entry[0] is not None:    # skip search references
+                    yield entry
+            cookie = None
+            for ctrl in serverctrls:
+                if ctrl.controlType == control.controlType:
+                    cookie = ctrl.cookie
+            if not cookie:
+                break
+            control.cookie = cookie
+
+    # groups
+    def getGroups(self, dn, style='member'):
+        """ The DNs of the groups below our base DN that dn belongs to,
+        directly or through nested groups.  With style 'member' groups
+        list their members in member or uniqueMember, with 'memberOf' the
+        server maintains memberOf on the members.  Results are kept for a
+        few minutes, or until group membership is changed through a
+        connection to the same server.  Uncommitted changes are not taken
+        into account. """
+        cache = self._groupCache()
+        groups = cache.get(style, self.dn, dn)
+        if groups is None:
+            self._statistics().miss('groups')
+            groups = expandGroups(self, self.dn, dn, style)
+            cache.set(style, self.dn, dn, groups)
+        else:
+            self._statistics().hit('groups')
+        return list(groups)
+
+    def isMemberOf(self, dn, groupdn, style='member'):
+        """ True if dn belongs to groupdn, possibly through nested
+        groups (see getGroups) """
+        key = normalizeDN(groupdn)
+        return key in [normalizeDN(g) for g in self.getGroups(dn, style)]
+
+    def _groupCache(self):
+        """ the GroupCache of our server """
+        return groupCache((self.host, self.port))
+
+    def _clearGroupCache(self):
+        """ forget expanded group memberships, in every thread """
+        self._groupCache().clear()
+
+    # exporting entries
+    def exportSubtree(self, out, dn=None, format='ldif',
+                      filterstr='(objectClass=*)'):
+        """ Write the subtree below dn (the base DN by default) to the
+        file-like object out as 'ldif' or 'jsonl' (JSON lines), with a
+        single paged search.  Uncommitted changes are not included.
+        Returns the number of entries written. """
+        writer = EXPORT_FORMATS[format][0]
+        records = self._pagedSearch(dn or self.dn, ldap.SCOPE_SUBTREE,
+                                    filterstr)
+        return writer(records, out)
+
+    def manage_exportSubtree(self, dn=None, format='ldif', REQUEST=None,
+                             RESPONSE=None):
+        """ Stream the subtree below dn as a download """
+        if RESPONSE is None:
+            RESPONSE = REQUEST.RESPONSE
+        if format not in EXPORT_FORMATS:
+            raise ValueError('Unknown export format %r' % format)
+        _writer, content_type, ext = EXPORT_FORMATS[format]
+        dn = dn or self.dn
+        RESPONSE.setHeader('Content-Type', content_type)
+        RESPONSE.setHeader('Content-Disposition',
+                           'attachment; filename="%s.%s"' % (
+                               ldap.explode_dn(dn, 1)[0], ext))
+        out = ResponseWriter(RESPONSE)
+        self.exportSubtree(out, dn, format)
+        out.flush()
+        return ''
 
-        :param dn:
-        :param modlist:
-        """
-        if not getattr(self, '_isCommitting', 0):
+    # modifying entries
+    def _modifyEntry(self, dn, modlist, version=None):
+        """ Modify dn.  If version (an assertion filter as made by
+        popVersion) is given and the server supports it, the modify only
+        succeeds if the entry still matches it.  Returns the assertion
+        filter for the entry's new revision, when the server tells. """
+        if not self._committing():
             raise AttributeError('Cannot modify unless in a commit')
             # someone's trying to be sneaky and modify an object
             # outside of a commit.  We're not going to allow that!
-        c = self._connection()
-        c.modify_s(dn, modlist)
+        modlist = [(op, attr, encodeValues(values))
+                   for op, attr, values in modlist]
+        if [m for m in modlist if m[1].lower() == 'userpassword']:
+            verifiedCredentials((self.host, self.port)).forget(dn)
+        if touchesGroups([m[1] for m in modlist]):
+            self._clearGroupCache()
+        serverctrls = []
+        if version and self.supportsControl(ldap.CONTROL_ASSERT):
+            serverctrls.append(AssertionControl(True, version))
+        elif version and (self.host, self.port) not in _unasserted:
+            _unasserted.add((self.host, self.port))
+            LOG.warning('%s:%s does not support the assertion control, '
+                        'changes made by others since an entry was read '
+                        'are overwritten', self.host, self.port)
+        if self.supportsControl(ldap.CONTROL_POST_READ):
+            serverctrls.append(PostReadControl(False, list(VERSION_ATTRS)))
+        if not serverctrls:
+            try:
+                self._call('modify', dn, 'modify_s', dn, modlist)
+            finally:
+                self._invalidate(dn)
+            return None
+        try:
+            result = self._call('modify', dn, 'modify_ext_s', dn, modlist,
+                                serverctrls=serverctrls)
+        finally:
+            self._invalidate(dn)
+        for ctrl in result[3]:
+            if ctrl.controlType == ldap.CONTROL_POST_READ:
+                return popVersion(dict(ctrl.entry))
+        return None
 
     # deleting entries
     def _registerDelete(self, dn):
         " register DN for deletion "
-        d = getattr(self, '_v_delete', [])
-        if dn not in d:
-            d.append(dn)
-        self._v_delete = d
+        self._pending().delete(dn)
 
     def _unregisterDelete(self, dn):
         " unregister DN for deletion "
-        d = getattr(self, '_v_delete', [])
-        if dn in d:
-            d.remove(dn)
-        self._v_delete = d
-
-        self._unregisterAdd(dn)
+        self._pending().undelete(dn)
+        self._unregisterAdd(dn=dn)
 
     def _deleteEntry(self, dn):
         """_deleteEntry.
 
         :param dn:
         """
-        if not getattr(self, '_isCommitting', 0):
+        if not self._committing():
             raise AttributeError('Cannot delete unless in a commit')
-        c = self._connection()
-        c.delete_s(dn)
+        try:
+            self._call('delete', dn, 'delete_s', dn)
+        finally:
+            self._invalidate(dn)
+        self._clearGroupCache()
+        verifiedCredentials((self.host, self.port)).forget(dn)
+        if normalizeDN(dn) == normalizeDN(self.dn):
+            self._v_root = None
 
     # adding entries
     def _registerAdd(self, o):
@@ -381,10 +1092,7 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
 
         :param o:
         """
-        a = getattr(self, '_v_add', {})
-        if o.dn not in a:
-            a[o.dn] = o
-        self._v_add = a
+        self._pending().add(o)
 
     def _unregisterAdd(self, o=None, dn=None):
         """_unregisterAdd.
@@ -392,12 +1100,11 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
         :param o:
         :param dn:
         """
-        a = getattr(self, '_v_add', {})
-        if o and o in list(a.values()):
-            del a[o.dn]
-        elif dn and dn in a:
-            del a[dn]
-        self._v_add = a
+        pending = self._pending()
+        if o is not None and pending.getAdded(o.dn) is o:
+            pending.discardAdd(o.dn)
+        elif dn:
+            pending.discardAdd(dn)
 
     def _addEntry(self, dn, attrs):
         """_addEntry.
@@ -405,10 +1112,53 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
         :param dn:
         :param attrs:
         """
-        if not getattr(self, '_isCommitting', 0):
+        if not self._committing():
             raise AttributeError('Cannot add unless in a commit')
-        c = self._connection()
-        c.add_s(dn, attrs)
+        problems = self._checkingSchema().checkEntry(dict(attrs))
+        if problems:
+            raise ldap.OBJECT_CLASS_VIOLATION({
+                'desc': 'Object class violation',
+                'info': '; '.join(problems)})
+        try:
+            self._call('add', dn, 'add_s', dn,
+                       [(attr, encodeValues(values))
+                        for attr, values in attrs])
+        finally:
+            self._invalidate(dn)
+        if touchesGroups([attr for attr, _v in attrs]):
+            self._clearGroupCache()
+
+    # bulk import
+    def importLDIF(self, file, window=DEFAULT_WINDOW, update=0):
+        """ Stream the entry records of the LDIF file-like object to the
+        server, keeping up to 'window' operations in flight.  Parents are
+        added before their children; with 'update' set, existing entries
+        get their attributes replaced.  The entries are written
+        immediately, outside of the transaction.  Returns the importer,
+        whose 'added', 'modified' and 'failures' tell what happened. """
+        importer = LDIFImporter(self._connection(), file, window, update,
+                                self._call)
+        try:
+            report = self._call('import', self.dn, importer.run)
+        finally:
+            binaryCache((self.host, self.port)).clear()
+            shared = self._sharedCache(refresh=False)
+            if shared is not None:
+                shared.clear()
+        self._clearGroupCache()
+        self.GetConnection().destroy_cache()
+        return report
+
+    def manage_importLDIF(self, file, window=DEFAULT_WINDOW, update=0,
+                          REQUEST=None):
+        """ import an uploaded LDIF file """
+        report = self.importLDIF(file, window, update)
+        if REQUEST is not None:
+            m = 'Imported %s entries, %s failed.' % (
+                report.added + report.modified, len(report.failures))
+            return self.manage_import(self, REQUEST, report=report,
+                                      manage_tabs_message=m)
+        return report
 
     # other stuff
     def title_and_id(self):
@@ -420,6 +1170,223 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
             s = '%s (<font color="red"> not connected</font>)' % s
         return s
 
+    # server capabilities
+    def getRootDSE(self):
+        """ The root DSE of the server (supportedControl,
+        supportedExtension, namingContexts and subschemaSubentry), read
+        once per connection and again after reconnecting.  When it cannot
+        be read, it is empty and read again the next time. """
+        dse = getattr(self, '_v_rootdse', None)
+        if dse is None:
+            try:
+                r = self._search('', ldap.SCOPE_BASE, '(objectClass=*)',
+                                 ['supportedControl', 'supportedExtension',
+                                  'namingContexts', 'subschemaSubentry'])
+            except ldap.LDAPError as e:
+                LOG.warning('Could not read the root DSE of %s: %s',
+                            self.host, e)
+                return {}
+            dse = self._v_rootdse = r and r[0][1] or {}
+        return dse
+
+    def getSchema(self):
+        """ The subschema of our server (see Schema.Schema): attribute
+        syntaxes and single-valuedness, and the required and allowed
+        attributes of object classes.  Read when first needed, shared by
+        all connections to the same server and read again when its
+        modifyTimestamp changes. """
+        return cachedSchema((self.host, self.port), self._readSchema,
+                            self._schemaTimestamp)
+
+    def _checkingSchema(self):
+        """ getSchema(), for checking changes against it; whether it is
+        unknown, so that nothing gets checked, is logged once per read """
+        schema = self.getSchema()
+        if not schema.isKnown() and not schema.warned:
+            schema.warned = True
+            LOG.warning('The schema of %s:%s is not known, changes are not '
+                        'checked against it', self.host, self.port)
+        return schema
+
+    def _readSchema(self):
+        """ read the subschema subentry named in the root DSE, or return
+        None if it cannot be read """
+        dn = self.getRootDSE().get('subschemaSubentry')
+        if getattr(self, '_v_rootdse', None) is None:
+            return None                 # the root DSE could not be read
+        if not dn:
+            return Schema()
+        try:
+            entry = self._call('search.base', decodeValue(dn[0]),
+                               'read_subschemasubentry_s',
+                               decodeValue(dn[0]), SCHEMA_ATTRS)
+        except ldap.LDAPError as e:
+            LOG.warning('Could not read the schema of %s: %s', self.host, e)
+            return None
+        if not entry:
+            LOG.warning('Could not read the schema of %s', self.host)
+            return None
+        return Schema(entry)
+
+    def _schemaTimestamp(self):
+        """ the current modifyTimestamp of the subschema subentry """
+        dn = self.getRootDSE().get('subschemaSubentry')
+        if not dn:
+            return None
+        try:
+            r = self._search(decodeValue(dn[0]), ldap.SCOPE_BASE,
+                             '(objectClass=*)', ['modifyTimestamp'])
+        except ldap.LDAPError:
+            return None
+        for attr, values in (r and r[0][1] or {}).items():
+            if attr.lower() == 'modifytimestamp' and values:
+                return values[0]
+        return None
+
+    def supportsControl(self, oid):
+        """ true if the server announces support for control oid """
+        if isinstance(oid, str):
+            oid = oid.encode('ascii')
+        return oid in self.getRootDSE().get('supportedControl', ())
+
+    # statistics
+    def _call(self, op, dn, method, *args, **kw):
+        """ Every operation sent to the server goes through here: call
+        method (the name of a method of our LDAPObject, or a callable)
+        with args and record it in our statistics as an operation of
+        type op about dn.  Operations with no type (such as sending an
+        asynchronous request) are not recorded. """
+        if op is None:
+            if not callable(method):
+                method = getattr(self._connection(), method)
+            return method(*args, **kw)
+        return self._perform(Operation(op, dn), method, *args, **kw)
+
+    def _search(self, dn, scope, filterstr='(objectClass=*)', attrlist=None):
+        """ search_s() through _call() """
+        return self._perform(Operation(SEARCH_OPS[scope], dn, scope,
+                                       filterstr, attrlist),
+                             'search_s', dn, scope, filterstr, attrlist)
+
+    def _perform(self, operation, method, *args, **kw):
+        """ _call() for an Operation: time it, count it, log it if it
+        took longer than getSlowThreshold(), and tell the registered
+        ILDAPOperationObserver utilities about it """
+        if not callable(method):
+            method = getattr(self._connection(), method)
+        observers = self._observe(operation)
+        operation.start = time.time()
+        try:
+            result = method(*args, **kw)
+        except Exception as exc:
+            operation.error = exc
+            raise
+        else:
+            operation.results = resultSize(result)
+        finally:
+            operation.elapsed = time.time() - operation.start
+            self._record(operation)
+            for observer, token in observers:
+                try:
+                    observer.after(self, operation, token)
+                except Exception:
+                    LOG.exception('LDAP operation observer %r failed',
+                                  observer)
+        return result
+
+    def _observe(self, operation):
+        """ tell the observers operation is about to be sent; return
+        the (observer, token) pairs to call after() on """
+        observers = []
+        for observer in getAllUtilitiesRegisteredFor(ILDAPOperationObserver):
+            try:
+                observers.append((observer, observer.before(self, operation)))
+            except Exception:
+                LOG.exception('LDAP operation observer %r failed', observer)
+        return observers
+
+    def _record(self, operation):
+        """ account for a finished operation """
+        stats = self._statistics()
+        stats.record(operation.op, operation.elapsed, operation.results,
+                     operation.error is not None)
+        threshold = self.getSlowThreshold()
+        if threshold and operation.elapsed >= threshold:
+            request = getattr(self, 'REQUEST', None)
+            if request is not None and hasattr(request, 'get'):
+                operation.url = request.get('URL')
+            stats.slow(operation)
+            LOG.warning(
+                'Slow LDAP %s on %s (scope %s, filter %s, attributes %s): '
+                '%s results in %.3fs%s', operation.op, operation.dn,
+                operation.scope, operation.filterstr, operation.attrlist,
+                operation.results, operation.elapsed,
+                operation.url and ' for %s' % operation.url or '')
+
+    def _statistics(self):
+        """ the Statistics of this connection """
+        return statistics(self._p_oid or id(Acquisition.aq_base(self)))
+
+    def getStatistics(self):
+        """ Operation counts, errors, latency histograms and result
+        sizes per operation type, and cache hit rates, since the process
+        started or the statistics were reset (see Stats.Statistics) """
+        return self._statistics().snapshot()
+
+    def statisticsJSON(self, REQUEST=None):
+        """ getStatistics() as JSON, for monitoring """
+        if REQUEST is not None:
+            REQUEST.RESPONSE.setHeader('Content-Type', 'application/json')
+        return json.dumps(self.getStatistics(), sort_keys=True)
+
+    def manage_resetStatistics(self, REQUEST=None):
+        """ start counting again """
+        self._statistics().reset()
+        if REQUEST is not None:
+            m = 'Statistics have been reset.'
+            return self.manage_statistics(self, REQUEST,
+                                          manage_tabs_message=m)
+
+    # verifying credentials
+    def authenticate(self, dn, password):
+        """ True if password is the password of dn, checked with a simple
+        bind on one of a small pool of connections kept for this purpose,
+        so our own connection stays bound as it is.  Empty passwords are
+        refused, as the server would take them for an anonymous bind.
+        Successful checks are remembered for getAuthCacheTTL() seconds,
+        or until the entry is modified through this connection. """
+        if not dn or not password:
+            return False
+        key = (self.host, self.port)
+        ttl = self.getAuthCacheTTL()
+        verified = verifiedCredentials(key)
+        if ttl and verified.verified(dn, password):
+            self._statistics().hit('authenticate')
+            return True
+        if ttl:
+            self._statistics().miss('authenticate')
+        # not our bound method: the pool outlives this thread's copy
+        pool = bindPool(key, partial(initialize, self.host, self.port))
+        for attempt in (1, 2):
+            try:
+                with pool.connection() as c:
+                    self._call('bind', dn, c.simple_bind_s, dn, password)
+            except ldap.SERVER_DOWN:
+                # pooled connections may have been closed by the server
+                # while idle: drop them and try on a new one
+                if attempt == 2:
+                    raise
+                pool.clear()
+                continue
+            except (ldap.INVALID_CREDENTIALS, ldap.NO_SUCH_OBJECT,
+                    ldap.UNWILLING_TO_PERFORM, ldap.INAPPROPRIATE_AUTH):
+                verified.forget(dn)
+                return False
+            break
+        if ttl:
+            verified.remember(dn, password, ttl)
+        return True
+
     # connection checking stuff
     def _connection(self):
         """_connection."""
@@ -448,8 +1415,7 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
     def __ping(self):
         " more expensive check on the connection and validity of conn "
         try:
-            self._connection().search_s(self.dn, ldap.SCOPE_BASE,
-                                        'objectclass=*')
+            self._search(self.dn, ldap.SCOPE_BASE, 'objectclass=*', ['1.1'])
             return 1
         except Exception:
             self._close()
@@ -461,21 +1427,22 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
             self._close()
         except Exception:
             pass
-        self._v_conn = ldap.initialize('ldaps://%s:%s' % (self.host,
-                                                          self.port))
+        self._v_conn = self._call('reconnect', self.host, self._initialize)
         try:
-            self._v_conn.whoami_s()
-        except ldap.SERVER_DOWN:
-            self._v_conn = ldap.initialize(
-                'ldap://%s:%s' % (self.host, self.port))
-        try:
-            self._v_conn.simple_bind_s(self.bind_as, self.pw)
+            self._call('bind', self.bind_as, self._v_conn.simple_bind_s,
+                       self.bind_as, self.pw)
         except ldap.NO_SUCH_OBJECT:
             return """
    Error: LDAP Server returned `no such object' for %s. Possibly
    the bind string or password are incorrect""" % (self.bind_as)
         self._v_openc = int(time.time())
 
+    def _initialize(self):
+        """ a new, unbound connection to our server: ldaps, or plain
+        ldap if the server does not speak it, unless another backend is
+        registered for our host and port (see Backends) """
+        return initialize(self.host, self.port)
+
     def manage_open(self, REQUEST=None):
         """ open a connection. """
         self.setOpenConnection(1)
@@ -492,6 +1459,8 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
             # I'm already closed, but someone is still trying to close me
             self._v_conn = None
             self._v_openc = 0
+            self._v_rootdse = None
+            self._v_root = None
         else:
             try:
                 self._v_conn.unbind_s()
@@ -499,6 +1468,8 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
                 pass
             self._v_conn = None
             self._v_openc = 0
+            self._v_rootdse = None
+            self._v_root = None
 
     def manage_close(self, REQUEST=None):
         """ close a connection. """
@@ -517,7 +1488,9 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
     manage_main = HTMLFile("edit", globals())
 
     def manage_edit(self, title, hostport, basedn, bind_as, pw, openc=0,
-                    canBrowse=0, transactional=1, REQUEST=None):
+                    canBrowse=0, transactional=1, authCacheTTL=0,
+                    slowThreshold=1.0, sharedCache=0, syncSubtrees=(),
+                    snapshotDir='', REQUEST=None):
         """ handle changes to a connection """
         self.title = title
         host, port = splitHostPort(hostport)
@@ -544,7 +1517,20 @@ class ZLDAPConnection(Acquisition.Implicit, Persistent, OFS.SimpleItem.Item,
 
         self.setBrowsable(canBrowse)
         self.setTransactional(transactional)
+        self.setAuthCacheTTL(authCacheTTL)
+        self.setSlowThreshold(slowThreshold)
+        self.setSharedCache(sharedCache)
+        self.setSyncSubtrees(syncSubtrees)
+        self.setSnapshotDir(snapshotDir)
         self.setDN(basedn)
+        key = self._sharedKey()
+        if key is not None:
+            # started again with the new settings when next needed
+            stopMirrors(key)
+            shared = sharedCache(key)
+            shared.stopRefresher()
+            # read with the old server, base or credentials
+            shared.clear()
 
         if REQUEST is not None:
             return MessageDialog(
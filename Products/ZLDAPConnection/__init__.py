@@ -16,5 +16,8 @@ def initialize(context):
         icon='LDAP_conn_icon.gif',
         permissions=('Manage Entry information',
                      'Create New Entry Objects',
+                     'Verify LDAP Credentials',
+                     'View LDAP Statistics',
+                     'View LDAP Binary Attributes',
                      ),
     )
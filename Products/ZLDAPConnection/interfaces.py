@@ -0,0 +1,92 @@
+""" Interfaces
+"""
+from zope.interface import Attribute, Interface
+
+
+class ILDAPOperation(Interface):
+    """ An operation sent to the LDAP server by a connection """
+
+    op = Attribute("The type of operation: 'search.base', "
+                   "'search.onelevel', 'search.subtree', 'compare', 'add', "
+                   "'modify', 'delete', 'bind', 'reconnect' or 'import'")
+    dn = Attribute("The DN operated on (the base of searches)")
+    scope = Attribute("The scope of searches, None otherwise")
+    filterstr = Attribute("The filter of searches, None otherwise")
+    attrlist = Attribute("The attributes searches ask for, or None")
+    start = Attribute("When the operation was sent (time.time())")
+    elapsed = Attribute("Seconds it took, once done")
+    results = Attribute("The number of entries returned, once done")
+    error = Attribute("The exception it failed with, None if it succeeded")
+
+
+class ILDAPBackend(Interface):
+    """ What a connection needs of the objects returned by the backend
+    factories registered with Backends.registerBackend: the part of
+    python-ldap's LDAPObject API it uses, with the same signatures,
+    results and exceptions.  See MemoryBackend for an example. """
+
+    def simple_bind_s(who='', cred=''):
+        """ bind as who """
+
+    def whoami_s():
+        """ the authorization identity """
+
+    def unbind_s():
+        """ close the connection """
+
+    def search_s(base, scope, filterstr='(objectClass=*)', attrlist=None):
+        """ [(dn, attrs)] of a search """
+
+    def search(base, scope, filterstr='(objectClass=*)', attrlist=None):
+        """ send a search, return its message id """
+
+    def search_ext(base, scope, filterstr='(objectClass=*)', attrlist=None,
+                   attrsonly=0, serverctrls=None):
+        """ send a search with controls, return its message id """
+
+    def result(msgid):
+        """ (result type, data) of a request sent before """
+
+    def result3(msgid):
+        """ (result type, data, msgid, response controls) of a request
+        sent before """
+
+    def read_subschemasubentry_s(subschemasubentry_dn, attrs=None):
+        """ the attributes of the subschema subentry """
+
+    def compare_s(dn, attr, value):
+        """ true if dn has value among the values of attr """
+
+    def add_s(dn, modlist):
+        """ add dn """
+
+    def add_ext(dn, modlist):
+        """ send an add, return its message id """
+
+    def modify_s(dn, modlist):
+        """ modify dn """
+
+    def modify_ext(dn, modlist):
+        """ send a modify, return its message id """
+
+    def modify_ext_s(dn, modlist, serverctrls=None):
+        """ modify dn with controls, return result3() """
+
+    def delete_s(dn):
+        """ delete dn """
+
+
+class ILDAPOperationObserver(Interface):
+    """ Utilities providing this are told about every operation sent to an
+    LDAP server, e.g. to record tracing spans.  They are called in the
+    thread doing the operation; exceptions they raise are logged and
+    otherwise ignored. """
+
+    def before(connection, operation):
+        """ The ILDAPOperation operation is about to be sent by the
+        ZLDAPConnection connection.  Whatever this returns is passed to
+        after(). """
+
+    def after(connection, operation, token):
+        """ The operation is done (or failed, see operation.error).  token
+        is what before() returned. """
@@ -0,0 +1,112 @@
+""" A connection to an in-memory directory, for the tests
+"""
+import itertools
+import logging
+import unittest
+
+import transaction
+from Products.ZLDAPConnection.Backends import registerBackend
+from Products.ZLDAPConnection.Backends import unregisterBackend
+from Products.ZLDAPConnection.MemoryBackend import Directory
+from Products.ZLDAPConnection.ZLDAP import ZLDAPConnection
+
+BASE = 'dc=example,dc=org'
+
+SUBSCHEMA = {
+    'attributeTypes': [
+        b"( 2.5.4.0 NAME 'objectClass' "
+        b"SYNTAX 1.3.6.1.4.1.1466.115.121.1.38 )",
+        b"( 2.5.4.41 NAME 'name' SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )",
+        b"( 2.5.4.3 NAME ( 'cn' 'commonName' ) SUP name )",
+        b"( 2.5.4.4 NAME ( 'sn' 'surname' ) SUP name )",
+        b"( 0.9.2342.19200300.100.1.1 NAME ( 'uid' 'userid' ) "
+        b"SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 )",
+        b"( 0.9.2342.19200300.100.1.3 NAME ( 'mail' 'rfc822Mailbox' ) "
+        b"SYNTAX 1.3.6.1.4.1.1466.115.121.1.26 )",
+        b"( 2.16.840.1.113730.3.1.241 NAME 'displayName' "
+        b"SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 SINGLE-VALUE )",
+        b"( 2.5.4.35 NAME 'userPassword' "
+        b"SYNTAX 1.3.6.1.4.1.1466.115.121.1.40 )",
+        b"( 0.9.2342.19200300.100.1.60 NAME 'jpegPhoto' "
+        b"SYNTAX 1.3.6.1.4.1.1466.115.121.1.28 )",
+        b"( 2.16.840.1.113730.3.1.216 NAME 'userPKCS12' "
+        b"SYNTAX 1.3.6.1.4.1.1466.115.121.1.5 )",
+        b"( 2.5.4.11 NAME ( 'ou' 'organizationalUnitName' ) SUP name )",
+        b"( 0.9.2342.19200300.100.1.25 NAME ( 'dc' 'domainComponent' ) "
+        b"SYNTAX 1.3.6.1.4.1.1466.115.121.1.26 SINGLE-VALUE )",
+        b"( 2.5.18.1 NAME 'createTimestamp' "
+        b"SYNTAX 1.3.6.1.4.1.1466.115.121.1.24 SINGLE-VALUE "
+        b"NO-USER-MODIFICATION USAGE directoryOperation )",
+    ],
+    'objectClasses': [
+        b"( 2.5.6.0 NAME 'top' ABSTRACT MUST objectClass )",
+        b"( 2.5.6.6 NAME 'person' SUP top STRUCTURAL MUST ( sn $ cn ) "
+        b"MAY userPassword )",
+        b"( 2.16.840.1.113730.3.2.2 NAME 'inetOrgPerson' SUP person "
+        b"STRUCTURAL MAY ( uid $ mail $ displayName $ jpegPhoto $ "
+        b"userPKCS12 ) )",
+        b"( 2.5.6.5 NAME 'organizationalUnit' SUP top STRUCTURAL "
+        b"MUST ou )",
+        b"( 0.9.2342.19200300.100.4.13 NAME 'domain' SUP top STRUCTURAL "
+        b"MUST dc )",
+        b"( 1.3.6.1.4.1.1466.101.120.111 NAME 'extensibleObject' "
+        b"SUP top AUXILIARY )",
+    ],
+    'modifyTimestamp': [b'20200101000000Z'],
+}
+
+
+def attrs(**kw):
+    """ entry attributes as python-ldap gives them """
+    return dict([(k, [v.encode('utf-8') for v in vs])
+                 for k, vs in kw.items()])
+
+
+ENTRIES = [
+    (BASE, attrs(objectClass=['domain'], dc=['example'])),
+    ('ou=people,' + BASE, attrs(objectClass=['organizationalUnit'],
+                                ou=['people'])),
+    ('uid=bob,ou=people,' + BASE, attrs(
+        objectClass=['inetOrgPerson'], uid=['bob'], cn=['Bob Smith'],
+        sn=['Smith'], userPassword=['secret'])),
+    ('uid=ann,ou=people,' + BASE, attrs(
+        objectClass=['inetOrgPerson'], uid=['ann'], cn=['Ann Jones'],
+        sn=['Jones'])),
+]
+
+_hosts = itertools.count()
+
+
+class Collector(logging.Handler):
+    """ keeps the messages logged """
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class ConnectionTestCase(unittest.TestCase):
+    """ A ZLDAPConnection, self.conn, to a Directory of 'entries' with
+    the subschema 'schema', registered for a host of its own so that
+    nothing cached for the server is shared with other tests """
+
+    entries = ENTRIES
+    schema = None
+    transactional = 1
+
+    def setUp(self):
+        self.host = 'memory%d' % next(_hosts)
+        self.directory = Directory(suffixes=(BASE,), schema=self.schema)
+        self.directory.load(self.entries)
+        registerBackend(self.host, 389, self.directory.connect)
+        self.conn = ZLDAPConnection('ldap', 'LDAP', self.host, 389, BASE,
+                                    '', '', 1, self.transactional)
+
+    def tearDown(self):
+        transaction.abort()
+        # kept by id() of unsaved connections, which may be reused
+        self.conn.manage_resetStatistics()
+        unregisterBackend(self.host, 389)
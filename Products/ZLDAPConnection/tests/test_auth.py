@@ -0,0 +1,75 @@
+""" Credentials verification tests
+"""
+import unittest
+
+import ldap
+from Products.ZLDAPConnection.Auth import VerifiedCredentials, bindPool
+from Products.ZLDAPConnection.tests.base import BASE, ConnectionTestCase
+
+BOB = 'uid=bob,ou=people,' + BASE
+
+
+class AuthenticateTests(ConnectionTestCase):
+    """ authenticate
+    """
+
+    def test_passwords(self):
+        """ the right password only, and never an empty one """
+        self.assertTrue(self.conn.authenticate(BOB, 'secret'))
+        self.assertFalse(self.conn.authenticate(BOB, 'wrong'))
+        self.assertFalse(self.conn.authenticate(BOB, ''))
+        self.assertFalse(self.conn.authenticate('uid=nobody,' + BASE, 'x'))
+
+    def test_remembered(self):
+        """ successful checks are remembered for the TTL """
+        self.conn.setAuthCacheTTL(60)
+        self.assertTrue(self.conn.authenticate(BOB, 'secret'))
+        binds = self.directory.binds
+        self.assertTrue(self.conn.authenticate(BOB.upper(), 'secret'))
+        self.assertEqual(self.directory.binds, binds)
+        self.assertFalse(self.conn.authenticate(BOB, 'wrong'))
+        self.conn.setAuthCacheTTL(0)
+        self.assertTrue(self.conn.authenticate(BOB, 'secret'))
+        self.assertEqual(self.directory.binds, binds + 2)
+
+    def test_pooled(self):
+        """ bind connections are reused, and dropped when the server
+        closed them """
+        self.conn.setAuthCacheTTL(0)
+        self.assertTrue(self.conn.authenticate(BOB, 'secret'))
+        connections = self.directory.connections
+        self.assertTrue(self.conn.authenticate(BOB, 'secret'))
+        self.assertEqual(self.directory.connections, connections)
+        pool = bindPool((self.host, 389), None)
+
+        def closed(*args):
+            raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+        pool._idle[0].simple_bind_s = closed
+        self.assertTrue(self.conn.authenticate(BOB, 'secret'))
+        self.assertEqual(self.directory.connections, connections + 1)
+
+
+class VerifiedCredentialsTests(unittest.TestCase):
+    """ VerifiedCredentials
+    """
+
+    def test_ttl(self):
+        """ verifications expire, and can be forgotten """
+        verified = VerifiedCredentials()
+        verified.remember(BOB, 'secret', 60)
+        self.assertTrue(verified.verified(BOB, u'secret'))
+        self.assertFalse(verified.verified(BOB, 'Secret'))
+        verified.forget(BOB.upper())
+        self.assertFalse(verified.verified(BOB, 'secret'))
+        verified.remember(BOB, 'secret', -1)
+        self.assertFalse(verified.verified(BOB, 'secret'))
+
+
+def test_suite():
+    """ Suite
+    """
+    suite = unittest.TestSuite()
+    for case in (AuthenticateTests, VerifiedCredentialsTests):
+        suite.addTest(
+            unittest.defaultTestLoader.loadTestsFromTestCase(case))
+    return suite
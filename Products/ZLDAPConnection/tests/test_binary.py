@@ -0,0 +1,74 @@
+""" Binary value serving tests
+"""
+import unittest
+
+from Products.ZLDAPConnection.Binary import BinaryCache, parseRange
+
+
+class ParseRangeTests(unittest.TestCase):
+    """ parseRange
+    """
+
+    def test_ranges(self):
+        """ satisfiable single ranges """
+        self.assertEqual(parseRange('bytes=0-0', 10), (0, 0))
+        self.assertEqual(parseRange('bytes=2-5', 10), (2, 5))
+        self.assertEqual(parseRange('bytes=2-', 10), (2, 9))
+        self.assertEqual(parseRange('bytes=2-100', 10), (2, 9))
+        self.assertEqual(parseRange('bytes=-3', 10), (7, 9))
+
+    def test_whole(self):
+        """ missing, multiple or malformed ranges send everything """
+        self.assertEqual(parseRange(None, 10), None)
+        self.assertEqual(parseRange('bytes=0-1,3-4', 10), None)
+        self.assertEqual(parseRange('bytes=a-b', 10), None)
+        self.assertEqual(parseRange('items=0-1', 10), None)
+
+    def test_unsatisfiable(self):
+        """ ranges outside of the value """
+        self.assertEqual(parseRange('bytes=10-', 10), False)
+        self.assertEqual(parseRange('bytes=5-2', 10), False)
+
+
+class BinaryCacheTests(unittest.TestCase):
+    """ BinaryCache
+    """
+
+    dn = 'uid=bob,ou=People,dc=example,dc=org'
+
+    def test_hit(self):
+        """ values are found under any spelling of the DN """
+        cache = BinaryCache()
+        cache.set(self.dn, 'jpegPhoto', ((b'abc',), 'v1'),
+                  cache.generation())
+        self.assertEqual(cache.get(self.dn.upper(), 'JPEGPHOTO'),
+                         ((b'abc',), 'v1'))
+        self.assertEqual(cache.get(self.dn, 'audio'), None)
+
+    def test_ttl(self):
+        """ values are no longer served after ttl seconds """
+        cache = BinaryCache(ttl=-1)
+        cache.set(self.dn, 'jpegPhoto', ((b'abc',), 'v1'),
+                  cache.generation())
+        self.assertEqual(cache.get(self.dn, 'jpegPhoto'), None)
+
+    def test_invalidate(self):
+        """ invalidated entries are dropped, and values read before the
+        invalidation are not kept """
+        cache = BinaryCache()
+        generation = cache.generation()
+        cache.set(self.dn, 'jpegPhoto', ((b'abc',), 'v1'), generation)
+        cache.invalidate(self.dn)
+        self.assertEqual(cache.get(self.dn, 'jpegPhoto'), None)
+        cache.set(self.dn, 'jpegPhoto', ((b'abc',), 'v1'), generation)
+        self.assertEqual(cache.get(self.dn, 'jpegPhoto'), None)
+
+
+def test_suite():
+    """ Suite
+    """
+    suite = unittest.TestSuite()
+    for case in (ParseRangeTests, BinaryCacheTests):
+        suite.addTest(
+            unittest.defaultTestLoader.loadTestsFromTestCase(case))
+    return suite
@@ -0,0 +1,150 @@
+""" LDIF import and subtree export tests
+"""
+import io
+import json
+import unittest
+
+import ldap
+import ldif
+
+from Products.ZLDAPConnection.tests.base import BASE, ConnectionTestCase
+
+LDIF = b"""dn: uid=eve,ou=staff,ou=people,dc=example,dc=org
+objectClass: inetOrgPerson
+uid: eve
+cn: Eve
+sn: Eve
+
+dn: ou=staff,ou=people,dc=example,dc=org
+objectClass: organizationalUnit
+ou: staff
+
+dn: uid=bob,ou=people,dc=example,dc=org
+objectClass: inetOrgPerson
+uid: bob
+cn: Robert Smith
+sn: Smith
+
+dn: uid=joe,ou=nowhere,dc=example,dc=org
+objectClass: inetOrgPerson
+uid: joe
+cn: Joe
+sn: Joe
+
+"""
+
+
+class ImportTests(ConnectionTestCase):
+    """ importLDIF
+    """
+
+    def operations(self):
+        """ the operation counts of the connection, by type """
+        found = self.conn.getStatistics()['operations']
+        return dict([(op, stats['count']) for op, stats in found.items()])
+
+    def test_recorded(self):
+        """ each add and modify is an operation of its own """
+        self.conn.importLDIF(io.BytesIO(LDIF), window=2, update=1)
+        self.assertTrue(self.conn.hasEntry('uid=eve,ou=staff,ou=people,' +
+                                           BASE))
+        found = self.operations()
+        self.assertEqual(found['import'], 1)
+        # eve is parked until ou=staff is added, then added again
+        self.assertEqual(found['add'], 5)
+        self.assertEqual(found['modify'], 1)
+
+    def test_report(self):
+        """ parents are added before their children, parked records
+        without a parent fail at the end """
+        report = self.conn.importLDIF(io.BytesIO(LDIF), window=2, update=1)
+        self.assertEqual(report.added, 2)
+        self.assertEqual(report.modified, 1)
+        self.assertEqual(report.failures, [
+            (4, 'uid=joe,ou=nowhere,' + BASE, 'parent entry does not exist')])
+        bob = self.conn.getRawEntry('uid=bob,ou=people,' + BASE)
+        self.assertEqual(list(bob[1]['cn']), ['Robert Smith'])
+
+    def test_existing(self):
+        """ without update existing entries are left alone """
+        report = self.conn.importLDIF(io.BytesIO(LDIF), window=1)
+        self.assertEqual((report.added, report.modified), (2, 0))
+        self.assertEqual([f[1] for f in report.failures],
+                         ['uid=bob,ou=people,' + BASE,
+                          'uid=joe,ou=nowhere,' + BASE])
+        bob = self.conn.getRawEntry('uid=bob,ou=people,' + BASE)
+        self.assertEqual(list(bob[1]['cn']), ['Bob Smith'])
+
+    def test_failed_parent(self):
+        """ the children of a record that failed fail too """
+        self.directory.add = self.refuse('ou=staff,ou=people,' + BASE,
+                                         self.directory.add)
+        report = self.conn.importLDIF(io.BytesIO(LDIF), update=1)
+        self.assertEqual([f[1:] for f in report.failures[:2]], [
+            ('ou=staff,ou=people,' + BASE, 'unwilling'),
+            ('uid=eve,ou=staff,ou=people,' + BASE, 'parent entry failed')])
+        self.assertFalse(self.conn.hasEntry('uid=eve,ou=staff,ou=people,' +
+                                            BASE))
+
+    def refuse(self, refused, add):
+        """ an add method of the directory refusing to add refused """
+        def refuse(dn, modlist):
+            if dn == refused:
+                raise ldap.UNWILLING_TO_PERFORM({'desc': 'unwilling'})
+            return add(dn, modlist)
+        return refuse
+
+
+class ExportTests(ConnectionTestCase):
+    """ exportSubtree
+    """
+
+    def setUp(self):
+        ConnectionTestCase.setUp(self)
+        self.directory.load([('uid=eve,ou=people,' + BASE, {
+            'objectClass': [b'inetOrgPerson'], 'uid': [b'eve'],
+            'cn': [b'Eve'], 'sn': [b'Eve'], 'jpegPhoto': [b'\xff\xd8\xff'],
+        })])
+
+    def test_ldif(self):
+        """ the subtree as LDIF, which imports back """
+        out = io.StringIO()
+        count = self.conn.exportSubtree(out, 'ou=people,' + BASE)
+        self.assertEqual(count, 4)
+        records = ldif.LDIFRecordList(io.StringIO(out.getvalue()))
+        records.parse()
+        found = dict(records.all_records)
+        self.assertEqual(found['uid=eve,ou=people,' + BASE]['jpegPhoto'],
+                         [b'\xff\xd8\xff'])
+        self.assertEqual(found['uid=bob,ou=people,' + BASE]['cn'],
+                         [b'Bob Smith'])
+
+    def test_jsonl(self):
+        """ one JSON object per entry, binary values in base64 """
+        out = io.StringIO()
+        self.assertEqual(self.conn.exportSubtree(
+            out, None, 'jsonl', '(uid=eve)'), 1)
+        found = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(found), 1)
+        self.assertEqual(found[0]['dn'], 'uid=eve,ou=people,' + BASE)
+        attributes = found[0]['attributes']
+        self.assertEqual(attributes['cn'], ['Eve'])
+        self.assertEqual(attributes['jpegPhoto;base64'], ['/9j/'])
+
+    def test_uncommitted(self):
+        """ uncommitted changes are not exported """
+        people = self.conn.getEntry('ou=people,' + BASE, self.conn)
+        people.deleteSubentry('uid=ann')
+        out = io.StringIO()
+        self.assertEqual(self.conn.exportSubtree(out, 'ou=people,' + BASE),
+                         4)
+
+
+def test_suite():
+    """ Suite
+    """
+    suite = unittest.TestSuite()
+    for case in (ImportTests, ExportTests):
+        suite.addTest(
+            unittest.defaultTestLoader.loadTestsFromTestCase(case))
+    return suite
@@ -0,0 +1,121 @@
+""" Connection tests: reading entries and what the server offers
+"""
+import unittest
+
+import ldap
+from Products.ZLDAPConnection import ZLDAP
+from Products.ZLDAPConnection.tests.base import BASE, ConnectionTestCase
+
+
+class RootDSETests(ConnectionTestCase):
+    """ reading the root DSE
+    """
+
+    def test_failed(self):
+        """ a root DSE that could not be read is read again """
+        def unavailable():
+            raise ldap.UNAVAILABLE({'desc': 'unavailable'})
+        self.directory._rootDSE = unavailable
+        self.assertEqual(self.conn.getRootDSE(), {})
+        self.assertEqual(self.conn._readSchema(), None)
+        del self.directory._rootDSE
+        self.assertTrue(self.conn.supportsControl(ldap.CONTROL_ASSERT))
+
+
+class RootTests(ConnectionTestCase):
+    """ the cached root entry and its list of subentries
+    """
+
+    def reads(self, call):
+        """ the operations sent to the directory by call() """
+        before = self.directory.operations
+        call()
+        return self.directory.operations - before
+
+    def test_cached(self):
+        """ the root and its subentries are read once """
+        self.assertEqual(self.conn.getRoot().objectIds(), ['ou=people'])
+        self.assertEqual(
+            self.reads(lambda: self.conn.getRoot().objectIds()), 0)
+
+    def test_invalidated(self):
+        """ the subentries are read again once one of them changed """
+        self.conn.getRoot().objectIds()
+        self.directory.load([('ou=groups,' + BASE, {
+            'objectClass': [b'organizationalUnit'], 'ou': [b'groups']})])
+        self.conn._invalidate('ou=groups,' + BASE)
+        self.assertEqual(sorted(self.conn.getRoot().objectIds()),
+                         ['ou=groups', 'ou=people'])
+
+    def test_interval(self):
+        """ and after ROOT_CHECK_INTERVAL """
+        self.conn.getRoot().objectIds()
+        interval = ZLDAP.ROOT_CHECK_INTERVAL
+        ZLDAP.ROOT_CHECK_INTERVAL = -1
+        try:
+            self.assertEqual(
+                self.reads(lambda: self.conn.getRoot().objectIds()), 2)
+        finally:
+            ZLDAP.ROOT_CHECK_INTERVAL = interval
+
+
+class ExistsTests(ConnectionTestCase):
+    """ exists() and compare()
+    """
+
+    bob = 'uid=bob,ou=people,' + BASE
+
+    def setUp(self):
+        ConnectionTestCase.setUp(self)
+        self.searches = []
+        search = self.directory.search
+
+        def recording(base, scope, filterstr, attrlist, serverctrls):
+            self.searches.append(attrlist)
+            return search(base, scope, filterstr, attrlist, serverctrls)
+        self.directory.search = recording
+
+    def test_exists(self):
+        """ no attribute is read to know whether an entry exists """
+        self.assertTrue(self.conn.exists(self.bob))
+        self.assertFalse(self.conn.exists('uid=eve,ou=people,' + BASE))
+        self.assertFalse(self.conn.exists('uid=eve,ou=nowhere,' + BASE))
+        self.assertEqual(self.searches, [['1.1']] * 3)
+        self.assertEqual(self.conn.hasEntry(self.bob), 1)
+
+    def test_compare(self):
+        """ values are compared by the server, as it matches them """
+        self.assertTrue(self.conn.compare(self.bob, 'cn', 'BOB SMITH'))
+        self.assertFalse(self.conn.compare(self.bob, 'cn', 'Ann Jones'))
+        self.assertFalse(self.conn.compare(self.bob, 'mail', 'bob@x.org'))
+        self.assertRaises(ldap.NO_SUCH_OBJECT, self.conn.compare,
+                          'uid=eve,ou=people,' + BASE, 'cn', 'Eve')
+        self.assertEqual(self.searches, [])
+        found = self.conn.getStatistics()['operations']['compare']
+        self.assertEqual(found['count'], 4)
+
+    def test_pending(self):
+        """ uncommitted adds and deletes are taken into account """
+        people = self.conn.getEntry('ou=people,' + BASE, self.conn)
+        people.addSubentry('uid=eve', {'objectClass': ['inetOrgPerson'],
+                                       'cn': ['Eve'], 'sn': ['Eve']})
+        people.deleteSubentry('uid=bob')
+        del self.searches[:]
+        eve = 'uid=eve,ou=people,' + BASE
+        self.assertTrue(self.conn.exists(eve))
+        self.assertTrue(self.conn.compare(eve, 'CN', 'Eve'))
+        self.assertFalse(self.conn.compare(eve, 'mail', 'eve@x.org'))
+        self.assertFalse(self.conn.exists(self.bob))
+        self.assertRaises(ldap.NO_SUCH_OBJECT, self.conn.compare, self.bob,
+                          'cn', 'Bob Smith')
+        self.assertEqual(self.searches, [])
+
+
+def test_suite():
+    """ Suite
+    """
+    suite = unittest.TestSuite()
+    for case in (RootDSETests, RootTests, ExistsTests):
+        suite.addTest(
+            unittest.defaultTestLoader.loadTestsFromTestCase(case))
+    return suite
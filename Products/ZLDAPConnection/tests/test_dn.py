@@ -0,0 +1,94 @@
+""" Distinguished Name helper tests
+"""
+import unittest
+
+from Products.ZLDAPConnection import DN as DNModule
+from Products.ZLDAPConnection.Cache import LRUCache
+from Products.ZLDAPConnection.DN import isBelow, normalizeDN, parentDN
+from Products.ZLDAPConnection.DN import parseDN, splitRDN
+
+
+class DNTests(unittest.TestCase):
+    """ DN normalization
+    """
+
+    def test_normalize(self):
+        """ case and insignificant whitespace are ignored """
+        self.assertEqual(normalizeDN('CN=Bob Smith,  OU=People,dc=Example'),
+                         normalizeDN('cn=bob  smith,ou=people,dc=example'))
+        self.assertNotEqual(normalizeDN('cn=bob,ou=people'),
+                            normalizeDN('cn=bobby,ou=people'))
+
+    def test_case_exact(self):
+        """ values are case-folded whatever their equality rule """
+        self.assertEqual(normalizeDN('cn=Bob,dc=example'),
+                         normalizeDN('cn=BOB,dc=example'))
+
+    def test_escaped(self):
+        """ escaped separators stay in their RDN """
+        self.assertEqual(parentDN('cn=Smith\\, Bob,dc=example'),
+                         'dc=example')
+        self.assertEqual(parseDN('cn=Smith\\, Bob,dc=example').id,
+                         'cn=Smith\\, Bob')
+
+    def test_invalid(self):
+        """ strings that are not DNs are opaque single RDNs """
+        parsed = parseDN('not a DN')
+        self.assertEqual(parsed.key, 'not a dn')
+        self.assertEqual(parsed.parent, '')
+
+    def test_parent(self):
+        """ parents are normalized, the parent of a single RDN is '' """
+        self.assertEqual(parentDN('uid=Bob,OU=People,dc=example'),
+                         'ou=people,dc=example')
+        self.assertEqual(parentDN('dc=example'), '')
+
+    def test_below(self):
+        """ isBelow """
+        self.assertTrue(isBelow('uid=bob,ou=people,dc=example', 'DC=Example'))
+        self.assertTrue(isBelow('dc=example', 'dc=example'))
+        self.assertTrue(isBelow('dc=example', ''))
+        self.assertFalse(isBelow('dc=example', 'ou=people,dc=example'))
+        self.assertFalse(isBelow('uid=bob,ou=people,dc=other', 'dc=example'))
+
+    def test_split(self):
+        """ splitRDN """
+        self.assertEqual(splitRDN(' cn=Bob '), ('cn', 'Bob'))
+
+
+class ParsedCacheTests(unittest.TestCase):
+    """ the memory of parsed DNs
+    """
+
+    def setUp(self):
+        self.parsed = DNModule._parsed
+        DNModule._parsed = LRUCache(2)
+
+    def tearDown(self):
+        DNModule._parsed = self.parsed
+
+    def test_hit(self):
+        """ a DN is parsed once """
+        parsed = parseDN('uid=bob,dc=example')
+        self.assertTrue(parseDN('uid=bob,dc=example') is parsed)
+        self.assertEqual(len(DNModule._parsed), 1)
+
+    def test_evicted(self):
+        """ the least recently used DNs are forgotten """
+        bob = parseDN('uid=bob,dc=example')
+        parseDN('uid=ann,dc=example')
+        parseDN('uid=bob,dc=example')
+        parseDN('uid=eve,dc=example')
+        self.assertEqual(len(DNModule._parsed), 2)
+        self.assertTrue(parseDN('uid=bob,dc=example') is bob)
+        self.assertEqual(DNModule._parsed.get('uid=ann,dc=example'), None)
+
+
+def test_suite():
+    """ Suite
+    """
+    suite = unittest.TestSuite()
+    for case in (DNTests, ParsedCacheTests):
+        suite.addTest(
+            unittest.defaultTestLoader.loadTestsFromTestCase(case))
+    return suite
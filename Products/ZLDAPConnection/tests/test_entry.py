@@ -0,0 +1,111 @@
+""" Entry tests
+"""
+import unittest
+
+import ldap
+import transaction
+from zExceptions import Forbidden
+from Products.ZLDAPConnection.Entry import AttrWrap, TransactionalEntry
+from Products.ZLDAPConnection.tests.base import BASE, ConnectionTestCase
+
+BOB = 'uid=bob,ou=people,' + BASE
+
+
+class SecurityTests(ConnectionTestCase):
+    """ what entries let through the web
+    """
+
+    def test_declarations(self):
+        """ the permissions declared on the entry classes are applied """
+        entry = self.conn._EntryFactory()
+        self.assertEqual(entry.binary__roles__.__name__,
+                         'View LDAP Binary Attributes')
+        self.assertEqual(entry.set__roles__.__name__,
+                         'Manage Entry information')
+
+    def test_transactional(self):
+        """ transactional entries are protected as the others """
+        declared = TransactionalEntry.__dict__
+        for name in ('get', 'set', 'setAll', 'deleteSubentry', 'undelete'):
+            self.assertTrue(name + '__roles__' in declared, name)
+
+    def test_secrets(self):
+        """ binary() publishes no password nor private key """
+        entry = self.conn.getEntry(BOB, self.conn)
+        self.assertRaises(Forbidden, entry.binary, 'userPassword')
+        self.assertRaises(Forbidden, entry.binary, 'userPKCS12')
+        self.assertEqual(entry.get('userPassword'), ['secret'])
+
+
+class DeleteTests(ConnectionTestCase):
+    """ deleting entries with subentries
+    """
+
+    entries = ConnectionTestCase.entries + [
+        ('ou=staff,ou=people,' + BASE, {
+            'objectClass': [b'organizationalUnit'], 'ou': [b'staff']}),
+        ('uid=eve,ou=staff,ou=people,' + BASE, {
+            'objectClass': [b'inetOrgPerson'], 'uid': [b'eve'],
+            'cn': [b'Eve'], 'sn': [b'Eve']}),
+    ]
+
+    def test_subtree(self):
+        """ every level below the deleted entry goes too """
+        self.conn.getRoot().deleteSubentry('ou=people')
+        pending = self.conn._pending()
+        eve = 'uid=eve,ou=staff,ou=people,' + BASE
+        self.assertTrue(pending.isDeleted(eve))
+        deleted = pending.deletedDNs()
+        self.assertTrue(deleted.index(eve) <
+                        deleted.index('ou=staff,ou=people,' + BASE) <
+                        deleted.index('ou=people,' + BASE))
+        self.assertRaises(ldap.NO_SUCH_OBJECT, self.conn.getRawEntry, eve)
+        transaction.commit()
+        self.assertEqual(len(self.directory), 1)
+
+
+class AttrWrapTests(ConnectionTestCase):
+    """ attribute values are handed out without copying
+    """
+
+    def test_wrap(self):
+        """ AttrWrap.wrap """
+        values = AttrWrap.wrap(['a', 'b'])
+        self.assertEqual(values, ('a', 'b'))
+        self.assertTrue(AttrWrap.wrap(values) is values)
+        self.assertEqual(AttrWrap.wrap('a'), ('a',))
+        self.assertEqual(AttrWrap.wrap(b'a'), (b'a',))
+        self.assertEqual(str(AttrWrap([b'caf\xc3\xa9', 'b'])),
+                         u'caf\xe9, b')
+
+    def test_shared(self):
+        """ attribute access gives the stored values themselves """
+        bob = self.conn.getEntry(BOB, self.conn)
+        self.assertTrue(isinstance(bob.cn, AttrWrap))
+        self.assertTrue(bob.cn is bob.cn)
+        self.assertRaises(AttributeError, setattr, bob.cn, 'x', 1)
+
+    def test_copies(self):
+        """ get() gives a list of its own, and set() keeps no reference
+        to the list it was given """
+        bob = self.conn.getEntry(BOB, self.conn)
+        found = bob.get('cn')
+        found.append('Robert')
+        self.assertEqual(bob.cn, ('Bob Smith',))
+        values = ['Robert Smith']
+        bob.set('cn', values)
+        values.append('Bobby')
+        self.assertEqual(bob.cn, ('Robert Smith',))
+        transaction.commit()
+        found = self.directory.connect().search_s(BOB, ldap.SCOPE_BASE)
+        self.assertEqual(found[0][1]['cn'], [b'Robert Smith'])
+
+
+def test_suite():
+    """ Suite
+    """
+    suite = unittest.TestSuite()
+    for case in (SecurityTests, DeleteTests, AttrWrapTests):
+        suite.addTest(
+            unittest.defaultTestLoader.loadTestsFromTestCase(case))
+    return suite
@@ -0,0 +1,76 @@
+""" Nested group tests
+"""
+import unittest
+
+import ldap
+from Products.ZLDAPConnection.DN import isBelow
+from Products.ZLDAPConnection.tests.base import BASE, ConnectionTestCase
+
+BOB = 'uid=bob,ou=people,' + BASE
+STAFF = 'cn=staff,ou=groups,' + BASE
+ADMINS = 'cn=admins,ou=groups,' + BASE
+ALL = 'cn=all,ou=groups,' + BASE
+OUTSIDE = 'cn=others,dc=example,dc=net'
+
+
+def group(dn, members):
+    """ a groupOfNames entry """
+    return (dn, {'objectClass': [b'groupOfNames'],
+                 'cn': [dn.split(',')[0][3:].encode('utf-8')],
+                 'member': [m.encode('utf-8') for m in members]})
+
+
+class GroupTests(ConnectionTestCase):
+    """ getGroups and isMemberOf
+    """
+
+    entries = ConnectionTestCase.entries + [
+        ('ou=groups,' + BASE, {'objectClass': [b'organizationalUnit'],
+                               'ou': [b'groups']}),
+        group(STAFF, [BOB]),
+        group(ADMINS, [STAFF]),
+        # a cycle
+        group(ALL, [ADMINS, STAFF]),
+    ]
+
+    def setUp(self):
+        ConnectionTestCase.setUp(self)
+        # as a server maintaining memberOf would
+        other = self.directory.connect()
+        for dn, groups in ((BOB, [STAFF, OUTSIDE]), (STAFF, [ADMINS, ALL]),
+                           (ADMINS, [ALL])):
+            values = [g.encode('utf-8') for g in groups]
+            other.modify_s(dn, [(ldap.MOD_ADD, 'memberOf', values)])
+
+    def test_member(self):
+        """ groups listing members in member, nested """
+        self.assertEqual(sorted(self.conn.getGroups(BOB)),
+                         sorted([STAFF, ADMINS, ALL]))
+        self.assertTrue(self.conn.isMemberOf(BOB, ALL.upper()))
+        self.assertFalse(self.conn.isMemberOf(STAFF, STAFF))
+
+    def test_memberof(self):
+        """ memberOf values, nested, below the base only """
+        self.assertEqual(sorted(self.conn.getGroups(BOB, 'memberOf')),
+                         sorted([STAFF, ADMINS, ALL]))
+
+    def test_cached(self):
+        """ expanded memberships are kept """
+        self.conn.getGroups(BOB)
+        before = self.directory.operations
+        self.conn.getGroups(BOB)
+        self.assertEqual(self.directory.operations, before)
+
+    def test_below(self):
+        """ isBelow compares whole RDNs """
+        self.assertTrue(isBelow(BOB, BASE.upper()))
+        self.assertTrue(isBelow(BASE, BASE))
+        self.assertTrue(isBelow(BOB, ''))
+        self.assertFalse(isBelow('cn=a\\,dc=example,dc=org', BASE))
+        self.assertFalse(isBelow(BASE, BOB))
+
+
+def test_suite():
+    """ Suite
+    """
+    return unittest.defaultTestLoader.loadTestsFromTestCase(GroupTests)
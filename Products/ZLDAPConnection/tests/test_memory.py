@@ -0,0 +1,116 @@
+""" In-memory directory tests
+"""
+import unittest
+
+import ldap
+from ldap.controls import SimplePagedResultsControl
+from Products.ZLDAPConnection.MemoryBackend import Directory, parseFilter
+
+BASE = 'dc=example,dc=org'
+
+
+def attrs(**kw):
+    """ entry attributes as python-ldap gives them """
+    return dict([(k, [v.encode('utf-8') for v in vs])
+                 for k, vs in kw.items()])
+
+
+class DirectoryTests(unittest.TestCase):
+    """ Directory and MemoryConnection
+    """
+
+    def setUp(self):
+        self.directory = Directory(suffixes=(BASE,))
+        self.directory.load([
+            (BASE, attrs(objectClass=['domain'], dc=['example'])),
+            ('ou=people,' + BASE, attrs(objectClass=['organizationalUnit'],
+                                        ou=['people'])),
+            ('uid=bob,ou=people,' + BASE, attrs(
+                objectClass=['inetOrgPerson'], uid=['bob'],
+                cn=['Bob Smith'], userPassword=['secret'])),
+            ('uid=ann,ou=people,' + BASE, attrs(
+                objectClass=['inetOrgPerson'], uid=['ann'],
+                cn=['Ann Jones'])),
+        ])
+        self.conn = self.directory.connect()
+
+    def test_scopes(self):
+        """ base, one level and subtree searches """
+        search = self.conn.search_s
+        self.assertEqual(len(search(BASE, ldap.SCOPE_BASE)), 1)
+        self.assertEqual(len(search(BASE, ldap.SCOPE_ONELEVEL)), 1)
+        self.assertEqual(len(search(BASE, ldap.SCOPE_SUBTREE)), 4)
+        self.assertRaises(ldap.NO_SUCH_OBJECT, search,
+                          'ou=nobody,' + BASE, ldap.SCOPE_BASE)
+
+    def test_filters(self):
+        """ simple filters """
+        entry = {'cn': ('cn', [b'Bob  Smith']), 'uid': ('uid', [b'bob'])}
+        self.assertTrue(parseFilter('(cn=bob smith)')(entry))
+        self.assertTrue(parseFilter('(cn=B*th)')(entry))
+        self.assertTrue(parseFilter('(&(uid=bob)(!(cn=ann*)))')(entry))
+        self.assertTrue(parseFilter('(|(uid=ann)(uid=b\\6fb))')(entry))
+        self.assertFalse(parseFilter('(mail=*)')(entry))
+        self.assertRaises(ldap.FILTER_ERROR, parseFilter, '(uid=bob')
+
+    def test_attrlist(self):
+        """ operational attributes only when asked for """
+        dn = 'uid=bob,ou=people,' + BASE
+        found = self.conn.search_s(dn, ldap.SCOPE_BASE)[0][1]
+        self.assertTrue('cn' in found)
+        self.assertFalse('entryCSN' in found)
+        found = self.conn.search_s(dn, ldap.SCOPE_BASE, '(objectClass=*)',
+                                   ['1.1'])[0][1]
+        self.assertEqual(found, {})
+        found = self.conn.search_s(dn, ldap.SCOPE_BASE, '(objectClass=*)',
+                                   ['entryCSN'])[0][1]
+        self.assertEqual(list(found.keys()), ['entryCSN'])
+
+    def test_paging(self):
+        """ the simple paged results control """
+        control = SimplePagedResultsControl(True, size=3, cookie='')
+        msgid = self.conn.search_ext(BASE, ldap.SCOPE_SUBTREE,
+                                     serverctrls=[control])
+        _rtype, rdata, _msgid, ctrls = self.conn.result3(msgid)
+        self.assertEqual(len(rdata), 3)
+        control.cookie = ctrls[0].cookie
+        msgid = self.conn.search_ext(BASE, ldap.SCOPE_SUBTREE,
+                                     serverctrls=[control])
+        _rtype, rdata, _msgid, ctrls = self.conn.result3(msgid)
+        self.assertEqual(len(rdata), 1)
+        self.assertFalse(ctrls[0].cookie)
+
+    def test_writes(self):
+        """ add, modify and delete """
+        dn = 'uid=joe,ou=people,' + BASE
+        self.conn.add_s(dn, [('objectClass', [b'inetOrgPerson']),
+                             ('uid', [b'joe'])])
+        self.assertRaises(ldap.ALREADY_EXISTS, self.conn.add_s, dn,
+                          [('uid', [b'joe'])])
+        self.assertRaises(ldap.NO_SUCH_OBJECT, self.conn.add_s,
+                          'uid=x,ou=nowhere,' + BASE, [('uid', [b'x'])])
+        self.conn.modify_s(dn, [(ldap.MOD_ADD, 'mail', [b'joe@example.org']),
+                                (ldap.MOD_REPLACE, 'cn', [b'Joe'])])
+        found = self.conn.search_s(dn, ldap.SCOPE_BASE)[0][1]
+        self.assertEqual(found['mail'], [b'joe@example.org'])
+        self.assertTrue(self.conn.compare_s(dn, 'cn', b'joe'))
+        self.assertRaises(ldap.NOT_ALLOWED_ON_NONLEAF, self.conn.delete_s,
+                          'ou=people,' + BASE)
+        self.conn.delete_s(dn)
+        self.assertRaises(ldap.NO_SUCH_OBJECT, self.conn.search_s, dn,
+                          ldap.SCOPE_BASE)
+
+    def test_bind(self):
+        """ simple binds check userPassword """
+        dn = 'uid=bob,ou=people,' + BASE
+        self.conn.simple_bind_s(dn, 'secret')
+        self.assertEqual(self.conn.whoami_s(), 'dn:' + dn)
+        self.assertRaises(ldap.INVALID_CREDENTIALS, self.conn.simple_bind_s,
+                          dn, 'wrong')
+        self.assertEqual(self.directory.binds, 2)
+
+
+def test_suite():
+    """ Suite
+    """
+    return unittest.defaultTestLoader.loadTestsFromTestCase(DirectoryTests)
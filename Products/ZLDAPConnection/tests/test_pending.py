@@ -0,0 +1,104 @@
+""" Uncommitted adds and deletes tests
+"""
+import unittest
+
+import ldap
+import transaction
+from Products.ZLDAPConnection.Pending import PendingIndex
+from Products.ZLDAPConnection.tests.base import BASE, ConnectionTestCase
+
+PEOPLE = 'ou=people,' + BASE
+BOB = 'uid=bob,' + PEOPLE
+EVE = 'uid=eve,' + PEOPLE
+
+
+class Added(object):
+    """ an entry pending to be added """
+
+    def __init__(self, dn):
+        self.dn = dn
+        self._data = {}
+
+
+class PendingIndexTests(unittest.TestCase):
+    """ PendingIndex
+    """
+
+    def setUp(self):
+        self.pending = PendingIndex()
+
+    def test_added(self):
+        """ adds are found under any spelling of their DN, and listed
+        below their parent """
+        eve = Added(EVE)
+        self.pending.add(eve)
+        self.assertTrue(self.pending.getAdded(EVE.upper()) is eve)
+        self.assertEqual(self.pending.addedChildren(PEOPLE), [eve])
+        self.pending.discardAdd(EVE)
+        self.assertEqual(self.pending.getAdded(EVE), None)
+        self.assertEqual(self.pending.addedChildren(PEOPLE), [])
+        self.assertEqual(len(self.pending), 0)
+
+    def test_deleted(self):
+        """ deleting an entry deletes its descendants """
+        self.pending.delete(PEOPLE)
+        self.assertTrue(self.pending.isDeleted(PEOPLE))
+        self.assertTrue(self.pending.isDeleted(BOB.upper()))
+        self.assertFalse(self.pending.isDeleted(BASE))
+        self.assertTrue(self.pending.isChildDeleted(PEOPLE))
+        self.assertFalse(self.pending.isChildDeleted(BOB))
+        self.pending.undelete(PEOPLE)
+        self.assertFalse(self.pending.isDeleted(BOB))
+
+    def test_readded(self):
+        """ an entry added again below a deleted one is not deleted """
+        self.pending.delete(PEOPLE)
+        self.pending.add(Added(EVE))
+        self.assertFalse(self.pending.isDeleted(EVE))
+        self.assertTrue(self.pending.isDeleted(BOB))
+        self.assertEqual(self.pending.deletedDNs(), [PEOPLE])
+
+
+class OverlayTests(ConnectionTestCase):
+    """ a transaction sees its own uncommitted adds and deletes
+    """
+
+    def people(self):
+        """ the ou=people entry """
+        return self.conn.getEntry(PEOPLE, self.conn)
+
+    def test_added(self):
+        """ added entries are read and listed before the commit """
+        self.people().addSubentry('uid=eve', {
+            'objectClass': ['inetOrgPerson'], 'cn': ['Eve'], 'sn': ['Eve']})
+        self.assertTrue(self.conn.exists(EVE))
+        self.assertEqual(list(self.conn.getRawEntry(EVE)[1]['cn']), ['Eve'])
+        self.assertEqual(sorted(e[0] for e in
+                                self.conn.getRawSubEntries(PEOPLE)),
+                         ['uid=ann,' + PEOPLE, BOB, EVE])
+        transaction.abort()
+        self.assertFalse(self.conn.exists(EVE))
+
+    def test_deleted(self):
+        """ deleted entries and their descendants are gone before the
+        commit """
+        self.conn.getEntry(BASE, self.conn).deleteSubentry('ou=people')
+        self.assertFalse(self.conn.exists(PEOPLE))
+        self.assertFalse(self.conn.exists(BOB))
+        self.assertRaises(ldap.NO_SUCH_OBJECT, self.conn.getRawEntry, BOB)
+        self.assertRaises(ldap.NO_SUCH_OBJECT, self.conn.getRawSubEntries,
+                          PEOPLE)
+        self.assertEqual(self.conn.getRawSubEntries(BASE), [])
+        transaction.commit()
+        self.assertFalse(self.conn.exists(BOB))
+        self.assertEqual(len(self.directory), 1)
+
+
+def test_suite():
+    """ Suite
+    """
+    suite = unittest.TestSuite()
+    for case in (PendingIndexTests, OverlayTests):
+        suite.addTest(
+            unittest.defaultTestLoader.loadTestsFromTestCase(case))
+    return suite
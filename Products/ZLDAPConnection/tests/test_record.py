@@ -0,0 +1,64 @@
+""" Search result record tests
+"""
+import unittest
+
+import transaction
+from Products.ZLDAPConnection.Entry import AttrWrap
+from Products.ZLDAPConnection.tests.base import BASE, ConnectionTestCase
+
+PEOPLE = 'ou=people,' + BASE
+BOB = 'uid=bob,' + PEOPLE
+
+
+class RecordTests(ConnectionTestCase):
+    """ LDAPRecord
+    """
+
+    def records(self):
+        """ the records of the people, by id """
+        return dict([(r.getId(), r) for r in self.conn.getSubRecords(PEOPLE)])
+
+    def test_listed(self):
+        """ subentries are listed as records """
+        records = self.records()
+        self.assertEqual(sorted(records), ['uid=ann', 'uid=bob'])
+        bob = records['uid=bob']
+        self.assertEqual(bob.dn, BOB)
+        self.assertFalse(hasattr(bob, '__dict__'))
+
+    def test_attributes(self):
+        """ attributes are read without regard to case """
+        bob = self.records()['uid=bob']
+        self.assertTrue(isinstance(bob.get('CN'), AttrWrap))
+        self.assertEqual(bob['cn'], ('Bob Smith',))
+        self.assertEqual(str(bob.sn), 'Smith')
+        self.assertEqual(bob.get('mail'), None)
+        self.assertRaises(KeyError, bob.__getitem__, 'mail')
+        self.assertRaises(AttributeError, getattr, bob, 'mail')
+        self.assertRaises(AttributeError, getattr, bob, '_conn_')
+
+    def test_object(self):
+        """ getObject() gives the full entry, wrapped if asked to """
+        bob = self.records()['uid=bob'].getObject(self.conn)
+        self.assertEqual(bob.dn, BOB)
+        self.assertEqual(bob.get('sn'), ['Smith'])
+        self.assertTrue(bob.aq_parent is self.conn)
+        bob.set('sn', ['Smyth'])
+        transaction.commit()
+        self.assertEqual(list(self.conn.getRawEntry(BOB)[1]['sn']),
+                         ['Smyth'])
+
+    def test_search(self):
+        """ searchRecords """
+        found = self.conn.searchRecords(filterstr='(sn=Jones)')
+        self.assertEqual([r.dn for r in found], ['uid=ann,' + PEOPLE])
+        found = self.conn.searchRecords(PEOPLE, filterstr='(uid=*)',
+                                        attrlist=['sn'])
+        self.assertEqual(sorted(r.keys() for r in found),
+                         [['sn'], ['sn']])
+
+
+def test_suite():
+    """ Suite
+    """
+    return unittest.defaultTestLoader.loadTestsFromTestCase(RecordTests)
@@ -0,0 +1,165 @@
+""" Directory schema tests
+"""
+import unittest
+
+import ldap
+import transaction
+from Products.ZLDAPConnection import Schema as SchemaModule
+from Products.ZLDAPConnection.Schema import Schema, cachedSchema, isSecret
+from Products.ZLDAPConnection.tests.base import SUBSCHEMA, BASE
+from Products.ZLDAPConnection.tests.base import ConnectionTestCase
+
+
+class SchemaTests(unittest.TestCase):
+    """ Schema
+    """
+
+    def setUp(self):
+        self.schema = Schema(SUBSCHEMA)
+
+    def test_binary(self):
+        """ binary syntaxes, but for passwords """
+        self.assertTrue(self.schema.isBinary('jpegPhoto'))
+        self.assertTrue(self.schema.isBinary('userPKCS12'))
+        self.assertFalse(self.schema.isBinary('cn'))
+        self.assertFalse(self.schema.isBinary('userPassword'))
+        self.assertFalse(Schema().isBinary('userPassword'))
+
+    def test_text_attributes(self):
+        """ entries are read with the text user attributes """
+        text = self.schema.textAttributes()
+        self.assertTrue('cn' in text and 'userPassword' in text)
+        self.assertFalse('jpegPhoto' in text)
+        self.assertFalse('createTimestamp' in text)
+        self.assertEqual(Schema().textAttributes(), None)
+
+    def test_secret(self):
+        """ passwords and private keys are secrets """
+        self.assertTrue(isSecret('userPassword'))
+        self.assertTrue(isSecret('userPKCS12;binary'))
+        self.assertFalse(isSecret('jpegPhoto'))
+
+
+class CachedSchemaTests(unittest.TestCase):
+    """ cachedSchema
+    """
+
+    def setUp(self):
+        self.key = ('schema', id(self))
+        self.loads = []
+
+    def tearDown(self):
+        SchemaModule._schemas.pop(self.key, None)
+
+    def load(self, result):
+        """ a load function returning result """
+        def load():
+            self.loads.append(result)
+            return result
+        return load
+
+    def test_failed(self):
+        """ a schema that could not be read is read again later """
+        schema = cachedSchema(self.key, self.load(None), lambda: None)
+        self.assertTrue(schema.failed)
+        self.assertEqual(schema.textAttributes(), None)
+        cachedSchema(self.key, self.load(None), lambda: None)
+        self.assertEqual(len(self.loads), 1)
+        retry = SchemaModule.SCHEMA_RETRY_INTERVAL
+        SchemaModule.SCHEMA_RETRY_INTERVAL = -1
+        try:
+            schema = cachedSchema(self.key, self.load(Schema(SUBSCHEMA)),
+                                  lambda: None)
+        finally:
+            SchemaModule.SCHEMA_RETRY_INTERVAL = retry
+        self.assertFalse(schema.failed)
+        self.assertEqual(len(self.loads), 2)
+        self.assertTrue(cachedSchema(self.key, self.load(None),
+                                     lambda: None) is schema)
+
+
+class ConnectionSchemaTests(ConnectionTestCase):
+    """ reading the schema of the server
+    """
+
+    schema = SUBSCHEMA
+
+    def test_read(self):
+        """ the subschema named in the root DSE is read """
+        schema = self.conn.getSchema()
+        self.assertFalse(schema.failed)
+        self.assertTrue(schema.isSingleValued('displayName'))
+        self.assertTrue(self.conn.getSchema() is schema)
+
+    def test_text_attributes(self):
+        """ binary values are not read along with the entry """
+        dn = 'uid=eve,ou=people,' + BASE
+        self.directory.load([(dn, {
+            'objectClass': [b'inetOrgPerson'], 'uid': [b'eve'],
+            'cn': [b'Eve'], 'sn': [b'Eve'], 'jpegPhoto': [b'\xff\xd8\xff'],
+        })])
+        entry = self.conn.getRawEntry(dn)
+        self.assertEqual(entry[1].get('cn'), ['Eve'])
+        self.assertFalse('jpegPhoto' in entry[1])
+
+
+class ValidationTests(ConnectionTestCase):
+    """ changes are checked against the schema before being sent
+    """
+
+    schema = SUBSCHEMA
+
+    def add(self, **attrs):
+        """ add uid=eve below ou=people with attrs, and commit """
+        people = self.conn.getEntry('ou=people,' + BASE, self.conn)
+        people.addSubentry('uid=eve', dict(uid=['eve'], cn=['Eve'],
+                                           sn=['Eve'], **attrs))
+        transaction.commit()
+
+    def test_disallowed(self):
+        """ attributes none of the object classes allow are refused """
+        self.assertRaises(ldap.OBJECT_CLASS_VIOLATION, self.add,
+                          objectClass=['inetOrgPerson'], dc=['example'])
+        transaction.abort()
+        self.assertFalse(self.conn.hasEntry('uid=eve,ou=people,' + BASE))
+        bob = self.conn.getEntry('uid=bob,ou=people,' + BASE, self.conn)
+        bob.set('dc', ['example'])
+        self.assertRaises(ldap.OBJECT_CLASS_VIOLATION, transaction.commit)
+
+    def test_extensible(self):
+        """ extensibleObject entries may hold any attribute """
+        self.add(objectClass=['inetOrgPerson', 'extensibleObject'],
+                 dc=['example'])
+        self.assertTrue(self.conn.hasEntry('uid=eve,ou=people,' + BASE))
+
+    def test_missing(self):
+        """ required attributes must be there """
+        people = self.conn.getEntry('ou=people,' + BASE, self.conn)
+        people.addSubentry('uid=eve', {'objectClass': ['inetOrgPerson'],
+                                       'uid': ['eve']})
+        self.assertRaises(ldap.OBJECT_CLASS_VIOLATION, transaction.commit)
+
+
+class UnknownSchemaTests(ConnectionTestCase):
+    """ without a schema nothing is checked, and that is logged
+    """
+
+    def test_unchecked(self):
+        """ nothing is refused """
+        people = self.conn.getEntry('ou=people,' + BASE, self.conn)
+        people.addSubentry('uid=eve', {'objectClass': ['inetOrgPerson'],
+                                       'dc': ['example']})
+        transaction.commit()
+        self.assertTrue(self.conn.hasEntry('uid=eve,ou=people,' + BASE))
+        self.assertTrue(self.conn.getSchema().warned)
+
+
+def test_suite():
+    """ Suite
+    """
+    suite = unittest.TestSuite()
+    for case in (SchemaTests, CachedSchemaTests, ConnectionSchemaTests,
+                 ValidationTests, UnknownSchemaTests):
+        suite.addTest(
+            unittest.defaultTestLoader.loadTestsFromTestCase(case))
+    return suite
@@ -0,0 +1,162 @@
+""" Shared entry cache tests
+"""
+import threading
+import time
+import unittest
+
+import transaction
+from OFS.SimpleItem import SimpleItem
+from Products.ZLDAPConnection import SharedCache
+from Products.ZLDAPConnection.SharedCache import SharedEntryCache
+from Products.ZLDAPConnection.ZLDAP import ZLDAPConnection
+from Products.ZLDAPConnection.tests.base import BASE, ConnectionTestCase
+
+DN = 'cn=admins,dc=example,dc=org'
+BOB = 'uid=bob,ou=people,' + BASE
+
+
+class SharedEntryCacheTests(unittest.TestCase):
+    """ SharedEntryCache and its Refresher
+    """
+
+    def setUp(self):
+        self.cache = SharedEntryCache(ttl=60, refresh=0)
+        self.reads = []
+
+    def read(self, dn):
+        """ a slow read from the server """
+        self.reads.append(dn)
+        time.sleep(0.1)
+        return dn, {'cn': ['admins %d' % len(self.reads)]}
+
+    def test_coalescing(self):
+        """ threads wanting the same entry wait for one read """
+        results = []
+
+        def load():
+            results.append(self.cache.load(DN, self.read))
+        threads = [threading.Thread(target=load) for _i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.reads), 1)
+        self.assertEqual(results, [(DN, {'cn': ['admins 1']})] * 10)
+        results[0][1]['cn'] = []
+        self.assertEqual(self.cache.getEntry(DN), (DN, {'cn': ['admins 1']}))
+
+    def test_hung_read(self):
+        """ threads do not wait forever for a read that hangs """
+        release = threading.Event()
+
+        def hang(dn):
+            release.wait()
+            return dn, {'cn': ['late']}
+        leader = threading.Thread(target=self.cache.load, args=(DN, hang))
+        leader.start()
+        wait = SharedCache.SHARED_CACHE_WAIT
+        SharedCache.SHARED_CACHE_WAIT = 0.1
+        try:
+            time.sleep(0.05)
+            self.assertEqual(self.cache.load(DN, self.read),
+                             (DN, {'cn': ['admins 1']}))
+        finally:
+            SharedCache.SHARED_CACHE_WAIT = wait
+            release.set()
+            leader.join()
+
+    def test_invalidated_read(self):
+        """ a read racing with a write is not cached """
+
+        def read(dn):
+            self.cache.invalidate(dn)
+            return self.read(dn)
+        self.assertTrue(self.cache.load(DN, read))
+        self.assertEqual(self.cache.getEntry(DN), None)
+
+    def test_refresh(self):
+        """ old entries are served while they are read again """
+        self.cache.load(DN, self.read)
+        self.cache.startRefresher(lambda: None,
+                                  lambda conn, dn: self.read(dn))
+        try:
+            self.assertEqual(self.cache.getEntry(DN)[1]['cn'], ['admins 1'])
+            for _i in range(50):
+                if len(self.reads) > 1:
+                    break
+                time.sleep(0.05)
+            time.sleep(0.05)
+            self.assertEqual(self.cache.getEntry(DN)[1]['cn'][0][:6],
+                             'admins')
+            self.assertTrue(len(self.reads) > 1)
+        finally:
+            self.cache.stopRefresher()
+
+
+class ConnectionSharedCacheTests(ConnectionTestCase):
+    """ entries shared by the copies of a connection, as loaded by
+    different ZODB connections
+    """
+
+    def setUp(self):
+        ConnectionTestCase.setUp(self)
+        self.container = SimpleItem()
+        self.container.id = self.host
+        self.conn.setSharedCache(1)
+        self.other = ZLDAPConnection('ldap', 'LDAP', self.host, 389, BASE,
+                                     '', '', 1, 1)
+        self.other.setSharedCache(1)
+
+    def tearDown(self):
+        key = '/'.join(self.wrapped(self.conn).getPhysicalPath())
+        SharedCache.sharedCache(key).stopRefresher()
+        SharedCache._caches.pop(key, None)
+        self.other.manage_resetStatistics()
+        ConnectionTestCase.tearDown(self)
+
+    def wrapped(self, conn):
+        """ conn in its container """
+        return conn.__of__(self.container)
+
+    def searches(self, conn):
+        """ the base searches conn sent """
+        found = conn.getStatistics()['operations'].get('search.base')
+        return found and found['count'] or 0
+
+    def test_shared(self):
+        """ an entry read by one copy is not read again by the other """
+        conn, other = self.wrapped(self.conn), self.wrapped(self.other)
+        conn.getRawEntry(BOB)
+        other.getSchema()
+        before = self.searches(other)
+        self.assertEqual(list(other.getRawEntry(BOB)[1]['cn']),
+                         ['Bob Smith'])
+        self.assertEqual(self.searches(other), before)
+        self.assertEqual(other.getStatistics()['caches']['shared']['hits'],
+                         1)
+
+    def test_invalidated(self):
+        """ entries changed through one copy are read again by the
+        other """
+        conn, other = self.wrapped(self.conn), self.wrapped(self.other)
+        other.getRawEntry(BOB)
+        conn.getEntry(BOB, conn).set('cn', ['Robert Smith'])
+        transaction.commit()
+        self.assertEqual(list(other.getRawEntry(BOB)[1]['cn']),
+                         ['Robert Smith'])
+
+    def test_unwrapped(self):
+        """ without a path there is nothing to share under """
+        self.assertEqual(self.conn._sharedCache(), None)
+        self.conn.getRawEntry(BOB)
+        self.assertFalse('shared' in self.conn.getStatistics()['caches'])
+
+
+def test_suite():
+    """ Suite
+    """
+    suite = unittest.TestSuite()
+    for case in (SharedEntryCacheTests, ConnectionSharedCacheTests):
+        suite.addTest(
+            unittest.defaultTestLoader.loadTestsFromTestCase(case))
+    return suite
@@ -0,0 +1,226 @@
+""" Operation statistics tests
+"""
+import json
+import logging
+import unittest
+
+import ldap
+from zope.component import getGlobalSiteManager
+from zope.interface import implementer
+from Products.ZLDAPConnection import Stats
+from Products.ZLDAPConnection.interfaces import ILDAPOperationObserver
+from Products.ZLDAPConnection.Stats import LATENCY_BUCKETS, Statistics
+from Products.ZLDAPConnection.tests.base import BASE, Collector
+from Products.ZLDAPConnection.tests.base import ConnectionTestCase
+
+BOB = 'uid=bob,ou=people,' + BASE
+
+
+class StatisticsTests(unittest.TestCase):
+    """ Statistics
+    """
+
+    def test_record(self):
+        """ counts, errors, results and latency buckets """
+        stats = Statistics()
+        stats.record('search.base', 0.0005, 1)
+        stats.record('search.base', 0.003, 2)
+        stats.record('search.base', 60, error=True)
+        found = stats.snapshot()['operations']['search.base']
+        self.assertEqual(found['count'], 3)
+        self.assertEqual(found['errors'], 1)
+        self.assertEqual(found['results'], 3)
+        self.assertEqual(found['slowest_ms'], 60000)
+        latency = dict(found['latency'])
+        self.assertEqual(latency['<=1ms'], 1)
+        self.assertEqual(latency['<=5ms'], 1)
+        self.assertEqual(latency['>%sms' % LATENCY_BUCKETS[-1]], 1)
+
+    def test_caches(self):
+        """ hit rates """
+        stats = Statistics()
+        stats.hit('root')
+        stats.hit('root')
+        stats.miss('root')
+        self.assertEqual(stats.snapshot()['caches']['root'],
+                         {'hits': 2, 'misses': 1, 'hit_rate': 0.6667})
+        stats.reset()
+        self.assertEqual(stats.snapshot()['caches'], {})
+
+
+class ConnectionStatisticsTests(ConnectionTestCase):
+    """ what a connection counts
+    """
+
+    def setUp(self):
+        ConnectionTestCase.setUp(self)
+        # read the root DSE and schema first
+        self.conn.getSchema()
+        self.conn.manage_resetStatistics()
+
+    def operations(self):
+        """ the operation statistics of the connection """
+        return self.conn.getStatistics()['operations']
+
+    def test_counted(self):
+        """ every operation sent is counted by type """
+        self.conn.getRawEntry(BOB)
+        self.conn.getRawSubEntries('ou=people,' + BASE)
+        self.assertRaises(ldap.NO_SUCH_OBJECT, self.conn.getRawEntry,
+                          'uid=eve,ou=people,' + BASE)
+        found = self.operations()
+        self.assertEqual(found['search.base']['count'], 2)
+        self.assertEqual(found['search.base']['errors'], 1)
+        self.assertEqual(found['search.base']['results'], 1)
+        self.assertEqual(found['search.onelevel']['results'], 2)
+
+    def test_caches(self):
+        """ cache hits and misses are counted """
+        self.conn.getRoot()
+        self.conn.getRoot()
+        found = self.conn.getStatistics()['caches']['root']
+        self.assertEqual((found['hits'], found['misses']), (1, 1))
+
+    def test_json(self):
+        """ the statistics as JSON, and reset """
+        self.conn.getRawEntry(BOB)
+        found = json.loads(self.conn.statisticsJSON())
+        self.assertEqual(found['operations']['search.base']['count'], 1)
+        self.conn.manage_resetStatistics()
+        self.assertEqual(self.operations(), {})
+
+
+class SlowLogTests(ConnectionTestCase):
+    """ operations slower than the threshold
+    """
+
+    def setUp(self):
+        ConnectionTestCase.setUp(self)
+        self.conn.getSchema()
+        self.directory.latency = 0.02
+        self.collector = Collector()
+        logging.getLogger('Products.ZLDAPConnection').addHandler(
+            self.collector)
+
+    def tearDown(self):
+        logging.getLogger('Products.ZLDAPConnection').removeHandler(
+            self.collector)
+        ConnectionTestCase.tearDown(self)
+
+    def test_slow(self):
+        """ slow operations are logged and listed, with the URL of the
+        request they were made for """
+        self.conn.setSlowThreshold(0.01)
+        self.conn.REQUEST = {'URL': 'http://nohost/people'}
+        self.conn.getRawEntry(BOB)
+        slow = self.conn.getStatistics()['slow']
+        self.assertEqual(len(slow), 1)
+        self.assertEqual(slow[0]['op'], 'search.base')
+        self.assertEqual(slow[0]['dn'], BOB)
+        self.assertEqual(slow[0]['scope'], 'base')
+        self.assertEqual(slow[0]['results'], 1)
+        self.assertEqual(slow[0]['url'], 'http://nohost/people')
+        self.assertTrue(slow[0]['elapsed_ms'] >= 10)
+        self.assertEqual(len(self.collector.messages), 1)
+        self.assertTrue(self.collector.messages[0].startswith(
+            'Slow LDAP search.base on ' + BOB))
+
+    def test_fast(self):
+        """ operations faster than the threshold, or all of them with a
+        threshold of 0, are not """
+        self.conn.setSlowThreshold(10)
+        self.conn.getRawEntry(BOB)
+        self.conn.setSlowThreshold(0)
+        self.conn.getRawEntry('uid=ann,ou=people,' + BASE)
+        self.assertEqual(self.conn.getStatistics()['slow'], [])
+        self.assertEqual(self.collector.messages, [])
+
+    def test_kept(self):
+        """ only the last SLOW_LOG_SIZE, most recent first """
+        self.conn.setSlowThreshold(0.01)
+        size = Stats.SLOW_LOG_SIZE
+        Stats.SLOW_LOG_SIZE = 1
+        try:
+            self.conn.manage_resetStatistics()
+        finally:
+            Stats.SLOW_LOG_SIZE = size
+        self.conn.getRawEntry(BOB)
+        self.conn.getRawEntry('uid=ann,ou=people,' + BASE)
+        slow = self.conn.getStatistics()['slow']
+        self.assertEqual([s['dn'] for s in slow],
+                         ['uid=ann,ou=people,' + BASE])
+
+
+@implementer(ILDAPOperationObserver)
+class Observer(object):
+    """ remembers what it is told """
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.seen = []
+
+    def before(self, connection, operation):
+        if self.fail:
+            raise ValueError('before')
+        self.seen.append(('before', operation.op, operation.elapsed))
+        return len(self.seen)
+
+    def after(self, connection, operation, token):
+        self.seen.append(('after', operation.op, token,
+                          operation.elapsed is not None,
+                          operation.error.__class__.__name__))
+
+
+class ObserverTests(ConnectionTestCase):
+    """ ILDAPOperationObserver utilities
+    """
+
+    def setUp(self):
+        ConnectionTestCase.setUp(self)
+        self.conn.getSchema()
+        self.observer = Observer()
+        self.failing = Observer(fail=True)
+        sm = getGlobalSiteManager()
+        sm.registerUtility(self.observer, ILDAPOperationObserver, 'test')
+        sm.registerUtility(self.failing, ILDAPOperationObserver, 'failing')
+        self.collector = Collector()
+        logging.getLogger('Products.ZLDAPConnection').addHandler(
+            self.collector)
+
+    def tearDown(self):
+        logging.getLogger('Products.ZLDAPConnection').removeHandler(
+            self.collector)
+        sm = getGlobalSiteManager()
+        sm.unregisterUtility(self.observer, ILDAPOperationObserver, 'test')
+        sm.unregisterUtility(self.failing, ILDAPOperationObserver,
+                             'failing')
+        ConnectionTestCase.tearDown(self)
+
+    def test_observed(self):
+        """ observers are told before and after each operation, failing
+        observers are logged and ignored """
+        self.conn.getRawEntry(BOB)
+        self.assertEqual(self.observer.seen, [
+            ('before', 'search.base', None),
+            ('after', 'search.base', 1, True, 'NoneType')])
+        self.assertEqual(len(self.collector.messages), 1)
+        self.assertTrue(self.collector.messages[0].startswith(
+            'LDAP operation observer'))
+
+    def test_error(self):
+        """ failed operations are observed with their error """
+        self.assertRaises(ldap.NO_SUCH_OBJECT, self.conn.getRawEntry,
+                          'uid=eve,ou=people,' + BASE)
+        self.assertEqual(self.observer.seen[-1],
+                         ('after', 'search.base', 1, True, 'NO_SUCH_OBJECT'))
+
+
+def test_suite():
+    """ Suite
+    """
+    suite = unittest.TestSuite()
+    for case in (StatisticsTests, ConnectionStatisticsTests,
+                 SlowLogTests, ObserverTests):
+        suite.addTest(
+            unittest.defaultTestLoader.loadTestsFromTestCase(case))
+    return suite
@@ -0,0 +1,183 @@
+""" Mirror and snapshot tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from Products.ZLDAPConnection import Snapshot, Sync
+from Products.ZLDAPConnection.Snapshot import loadSnapshot, saveSnapshot
+from Products.ZLDAPConnection.Snapshot import snapshotPath
+from Products.ZLDAPConnection.Sync import Mirror
+
+BASE = 'ou=people,dc=example,dc=org'
+
+
+class MirrorTests(unittest.TestCase):
+    """ Mirror, fed as SyncConnection feeds it
+    """
+
+    def setUp(self):
+        self.changed = []
+        self.mirror = Mirror(BASE, self.changed.append)
+        self.mirror.startRefresh()
+        self.mirror.update('u0', BASE, {'ou': ['people']})
+        self.mirror.update('u1', 'uid=bob,' + BASE, {'uid': ['bob']})
+        self.mirror.update('u2', 'uid=ann,' + BASE, {'uid': ['ann']})
+
+    def test_ready(self):
+        """ nothing is answered before the refresh is done """
+        self.assertEqual(self.mirror.lookup(BASE), (False, None))
+        self.mirror.refreshDone()
+        self.assertEqual(self.mirror.lookup('UID=Bob, ' + BASE),
+                         (True, ('uid=bob,' + BASE, {'uid': ['bob']})))
+        self.assertEqual(self.mirror.lookup('uid=eve,' + BASE), (True, None))
+        known, children = self.mirror.children(BASE)
+        self.assertTrue(known)
+        self.assertEqual(sorted([dn for dn, _attrs in children]),
+                         ['uid=ann,' + BASE, 'uid=bob,' + BASE])
+        self.assertEqual(self.mirror.children('uid=eve,' + BASE),
+                         (True, None))
+        self.assertTrue(self.mirror.covers('uid=eve,' + BASE))
+        self.assertFalse(self.mirror.covers('dc=example,dc=org'))
+
+    def test_copies(self):
+        """ callers get copies of the attributes """
+        self.mirror.refreshDone()
+        self.mirror.lookup(BASE)[1][1].pop('ou')
+        self.assertEqual(self.mirror.lookup(BASE)[1][1], {'ou': ['people']})
+
+    def test_changes(self):
+        """ renames and deletes """
+        self.mirror.refreshDone()
+        del self.changed[:]
+        self.mirror.update('u1', 'uid=robert,' + BASE, {'uid': ['robert']})
+        self.assertEqual(self.mirror.lookup('uid=bob,' + BASE), (True, None))
+        self.assertEqual(self.changed, ['uid=robert,' + BASE,
+                                        'uid=bob,' + BASE])
+        self.mirror.delete(['u2'])
+        self.assertEqual(self.mirror.lookup('uid=ann,' + BASE), (True, None))
+        self.assertEqual([dn for dn, _attrs in self.mirror.children(BASE)[1]],
+                         ['uid=robert,' + BASE])
+
+    def test_rename_subtree(self):
+        """ entries below a renamed one move along """
+        self.mirror.update('u3', 'ou=Admins,' + BASE, {'ou': ['Admins']})
+        self.mirror.update('u4', 'cn=root,ou=Admins,' + BASE, {'cn': ['root']})
+        self.mirror.refreshDone()
+        del self.changed[:]
+        self.mirror.update('u3', 'ou=Staff,' + BASE, {'ou': ['Staff']})
+        self.assertEqual(self.mirror.lookup('cn=root,ou=Admins,' + BASE),
+                         (True, None))
+        self.assertEqual(self.mirror.lookup('cn=root,ou=staff,' + BASE),
+                         (True, ('cn=root,ou=Staff,' + BASE,
+                                 {'cn': ['root']})))
+        self.assertEqual(self.mirror.children('ou=staff,' + BASE)[1],
+                         [('cn=root,ou=Staff,' + BASE, {'cn': ['root']})])
+        self.assertEqual(self.mirror.children('ou=admins,' + BASE),
+                         (True, None))
+        self.assertTrue('cn=root,ou=admins,' + BASE in self.changed)
+        self.mirror.delete(['u4'])
+        self.assertEqual(self.mirror.children('ou=staff,' + BASE)[1], [])
+
+    def test_present(self):
+        """ entries not reported present in a refresh are deleted """
+        self.mirror.refreshDone()
+        self.mirror.startRefresh()
+        self.mirror.present(['u0'])
+        self.mirror.update('u2', 'uid=ann,' + BASE, {'uid': ['ann']})
+        self.mirror.dropAbsent()
+        self.assertEqual(self.mirror.lookup('uid=bob,' + BASE), (True, None))
+        self.assertEqual(len(self.mirror), 2)
+
+    def test_stale(self):
+        """ written entries are read from the server until they come
+        back """
+        self.mirror.refreshDone()
+        self.mirror.markStale('uid=bob,' + BASE)
+        self.assertEqual(self.mirror.lookup('uid=bob,' + BASE), (False, None))
+        self.assertEqual(self.mirror.children(BASE), (False, None))
+        self.mirror.update('u1', 'uid=bob,' + BASE, {'uid': ['bob']})
+        self.assertTrue(self.mirror.lookup('uid=bob,' + BASE)[0])
+        self.assertTrue(self.mirror.children(BASE)[0])
+
+    def test_stale_timeout(self):
+        """ writes the server never sends back are not waited for
+        forever """
+        self.mirror.refreshDone()
+        timeout = Sync.SYNC_STALE_TIMEOUT
+        Sync.SYNC_STALE_TIMEOUT = -1
+        try:
+            self.mirror.markStale('uid=bob,' + BASE)
+            self.assertTrue(self.mirror.lookup('uid=bob,' + BASE)[0])
+        finally:
+            Sync.SYNC_STALE_TIMEOUT = timeout
+
+    def test_missing_base(self):
+        """ the mirrored subtree itself can be missing """
+        mirror = Mirror('ou=nobody,dc=example,dc=org')
+        mirror.refreshDone()
+        self.assertEqual(mirror.lookup('ou=nobody,dc=example,dc=org'),
+                         (True, None))
+
+
+class SnapshotTests(unittest.TestCase):
+    """ saveSnapshot and loadSnapshot
+    """
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = snapshotPath(self.dir, '/conn', BASE)
+        self.mirror = Mirror(BASE)
+        self.mirror.update('u0', BASE, {'ou': ['people']})
+        self.mirror.update('u1', 'uid=bob,' + BASE,
+                           {'uid': ['bob'], 'jpegPhoto': [b'\xff\xd8']})
+        self.mirror.cookie = 'rid=001,csn=20261019000000.000000Z#000000'
+        self.mirror.refreshDone()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_roundtrip(self):
+        """ entries and cookie survive """
+        saveSnapshot(self.path, self.mirror, ['*'])
+        mirror = Mirror(BASE)
+        self.assertTrue(loadSnapshot(self.path, mirror, ['*']))
+        self.assertEqual(mirror.cookie, self.mirror.cookie)
+        self.assertEqual(mirror.lookup('uid=bob,' + BASE),
+                         self.mirror.lookup('uid=bob,' + BASE))
+        self.assertEqual(len(mirror.children(BASE)[1]), 1)
+        self.assertEqual(os.listdir(self.dir),
+                         [os.path.basename(self.path)])
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+    def test_mismatch(self):
+        """ snapshots of something else are not loaded """
+        saveSnapshot(self.path, self.mirror, ['*'])
+        self.assertFalse(loadSnapshot(self.path, Mirror(BASE), ['cn']))
+        self.assertFalse(loadSnapshot(self.path, Mirror('dc=org'), ['*']))
+        self.assertFalse(loadSnapshot(self.path + 'x', Mirror(BASE), ['*']))
+        maxage = Snapshot.SNAPSHOT_MAX_AGE
+        Snapshot.SNAPSHOT_MAX_AGE = -1
+        try:
+            self.assertFalse(loadSnapshot(self.path, Mirror(BASE), ['*']))
+        finally:
+            Snapshot.SNAPSHOT_MAX_AGE = maxage
+
+    def test_corrupt(self):
+        """ unreadable files are ignored """
+        with open(self.path, 'wb') as f:
+            f.write(b'not a database')
+        mirror = Mirror(BASE)
+        self.assertFalse(loadSnapshot(self.path, mirror, ['*']))
+        self.assertFalse(mirror.ready)
+
+
+def test_suite():
+    """ Suite
+    """
+    suite = unittest.TestSuite()
+    for case in (MirrorTests, SnapshotTests):
+        suite.addTest(
+            unittest.defaultTestLoader.loadTestsFromTestCase(case))
+    return suite
@@ -0,0 +1,170 @@
+""" Transactional connection tests
+"""
+import logging
+import unittest
+
+import ldap
+import transaction
+from ZODB.POSException import ConflictError
+from Products.ZLDAPConnection.tests.base import BASE, Collector
+from Products.ZLDAPConnection.tests.base import ConnectionTestCase
+
+BOB = 'uid=bob,ou=people,' + BASE
+ANN = 'uid=ann,ou=people,' + BASE
+EVE = 'uid=eve,ou=people,' + BASE
+
+
+class ConflictTests(ConnectionTestCase):
+    """ changes made by others meanwhile abort the transaction
+    """
+
+    def setUp(self):
+        ConnectionTestCase.setUp(self)
+        self.other = self.directory.connect()
+
+    def entry(self, dn):
+        """ the entry dn, read through the connection """
+        return self.conn.getEntry(dn, self.conn)
+
+    def test_changed(self):
+        """ nothing is written when an entry changed meanwhile """
+        ann = self.entry(ANN)
+        ann.set('cn', ['Ann Smith'])
+        bob = self.entry(BOB)
+        bob.set('cn', ['Robert Smith'])
+        self.other.modify_s(BOB, [(ldap.MOD_REPLACE, 'sn', [b'Smyth'])])
+        self.assertRaises(ConflictError, transaction.commit)
+        transaction.abort()
+        found = self.other.search_s(ANN, ldap.SCOPE_BASE)[0][1]
+        self.assertEqual(found['cn'], [b'Ann Jones'])
+        found = self.other.search_s(BOB, ldap.SCOPE_BASE)[0][1]
+        self.assertEqual(found['cn'], [b'Bob Smith'])
+
+    def test_deleted(self):
+        """ deleting an entry deleted meanwhile """
+        people = self.entry('ou=people,' + BASE)
+        people.deleteSubentry('uid=ann')
+        self.other.delete_s(ANN)
+        self.assertRaises(ConflictError, transaction.commit)
+
+    def test_added(self):
+        """ adding an entry added meanwhile """
+        people = self.entry('ou=people,' + BASE)
+        people.addSubentry('uid=eve', {'objectClass': ['inetOrgPerson'],
+                                       'cn': ['Eve'], 'sn': ['Eve']})
+        self.other.add_s(EVE, [('objectClass', [b'inetOrgPerson']),
+                               ('uid', [b'eve'])])
+        self.assertRaises(ConflictError, transaction.commit)
+        transaction.abort()
+        found = self.other.search_s(EVE, ldap.SCOPE_BASE)[0][1]
+        self.assertFalse('cn' in found)
+
+    def test_partial(self):
+        """ the DNs written before a write failed are logged """
+        bob = self.entry(BOB)
+        bob.set('cn', ['Robert Smith'])
+        people = self.entry('ou=people,' + BASE)
+        people.addSubentry('uid=eve', {'objectClass': ['inetOrgPerson'],
+                                       'cn': ['Eve'], 'sn': ['Eve']})
+
+        def refuse(dn, modlist):
+            raise ldap.UNWILLING_TO_PERFORM({'desc': 'unwilling'})
+        self.directory.add = refuse
+        collector = Collector()
+        logger = logging.getLogger('Products.ZLDAPConnection')
+        logger.addHandler(collector)
+        try:
+            self.assertRaises(ldap.UNWILLING_TO_PERFORM, transaction.commit)
+        finally:
+            logger.removeHandler(collector)
+        self.assertTrue('LDAP transaction failed after writing ' + BOB in
+                        collector.messages)
+
+    def test_commit(self):
+        """ changes made by nobody else go through """
+        bob = self.entry(BOB)
+        bob.set('cn', ['Robert Smith'])
+        self.entry('ou=people,' + BASE).deleteSubentry('uid=ann')
+        transaction.commit()
+        found = self.other.search_s(BOB, ldap.SCOPE_BASE)[0][1]
+        self.assertEqual(found['cn'], [b'Robert Smith'])
+        self.assertRaises(ldap.NO_SUCH_OBJECT, self.other.search_s, ANN,
+                          ldap.SCOPE_BASE)
+
+
+class CoalescingTests(ConnectionTestCase):
+    """ the changes made to one DN are sent as a single modify
+    """
+
+    def modifies(self):
+        """ the modify operations sent so far """
+        found = self.conn.getStatistics()['operations'].get('modify')
+        return found and found['count'] or 0
+
+    def read(self, dn):
+        """ the attributes of dn as the server has them """
+        return self.directory.connect().search_s(dn, ldap.SCOPE_BASE)[0][1]
+
+    def test_coalesced(self):
+        """ repeated changes, through any spelling of the DN """
+        bob = self.conn.getEntry(BOB, self.conn)
+        bob.set('cn', ['Robert Smith'])
+        bob.set('sn', ['Smyth'])
+        bob.remove('userPassword')
+        other = self.conn.getEntry(BOB.upper(), self.conn)
+        other.set('cn', ['Bobby Smyth'])
+        transaction.commit()
+        self.assertEqual(self.modifies(), 1)
+        found = self.read(BOB)
+        self.assertEqual(found['cn'], [b'Bobby Smyth'])
+        self.assertEqual(found['sn'], [b'Smyth'])
+        self.assertFalse('userPassword' in found)
+
+    def test_deleted(self):
+        """ changes to an entry deleted in the same transaction are not
+        sent """
+        self.conn.getEntry(ANN, self.conn).set('cn', ['Ann Smith'])
+        self.conn.getEntry('ou=people,' + BASE,
+                           self.conn).deleteSubentry('uid=ann')
+        transaction.commit()
+        self.assertEqual(self.modifies(), 0)
+        self.assertFalse(self.conn.exists(ANN))
+
+    def test_aborted(self):
+        """ nothing is sent after an abort """
+        self.conn.getEntry(BOB, self.conn).set('cn', ['Robert Smith'])
+        transaction.abort()
+        transaction.commit()
+        self.assertEqual(self.modifies(), 0)
+        self.assertEqual(self.read(BOB)['cn'], [b'Bob Smith'])
+
+
+class BatchTests(ConnectionTestCase):
+    """ batches of changes on non-transactional connections
+    """
+
+    transactional = 0
+
+    def test_batch(self):
+        """ one modify is sent when the batch is closed """
+        bob = self.conn.getEntry(BOB, self.conn)
+        with self.conn.batch():
+            bob.set('cn', ['Robert Smith'])
+            with self.conn.batch():
+                bob.set('sn', ['Smyth'])
+            self.assertEqual(self.conn.getStatistics()['operations'].get(
+                'modify'), None)
+        stats = self.conn.getStatistics()['operations']
+        self.assertEqual(stats['modify']['count'], 1)
+        found = self.directory.connect().search_s(BOB, ldap.SCOPE_BASE)
+        self.assertEqual(found[0][1]['sn'], [b'Smyth'])
+
+
+def test_suite():
+    """ Suite
+    """
+    suite = unittest.TestSuite()
+    for case in (ConflictTests, CoalescingTests, BatchTests):
+        suite.addTest(
+            unittest.defaultTestLoader.loadTestsFromTestCase(case))
+    return suite
@@ -0,0 +1,382 @@
+""" Benchmarks of the hot paths of Products.ZLDAPConnection
+
+Runs against the in-memory directory (the default, no network needed)
+or against an LDAP server, in a subtree it creates below --base and
+removes afterwards.  Results are written as JSON to benchmarks/results,
+one file per run named after the product version, and compared with an
+earlier result file when --compare is given.
+
+    python benchmarks/bench.py
+    python benchmarks/bench.py --latency 0.0005 --sizes 10,1000
+    python benchmarks/bench.py --backend ldap --host localhost --port 389 \\
+        --base dc=example,dc=org --bind-dn cn=admin,dc=example,dc=org \\
+        --password secret
+    python benchmarks/bench.py --compare benchmarks/results/1.4-....json
+"""
+from __future__ import print_function
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:             # Python 2
+    tracemalloc = None
+
+import ldap
+import transaction
+
+from Products.ZLDAPConnection.Backends import registerBackend
+from Products.ZLDAPConnection.MemoryBackend import Directory
+from Products.ZLDAPConnection.ZLDAP import ZLDAPConnection
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESULTS = os.path.join(HERE, 'results')
+VERSION = open(os.path.join(HERE, '..', 'Products', 'ZLDAPConnection',
+                            'version.txt')).read().strip()
+
+WINDOW = 64
+
+
+# Fixtures
+
+def ou(name, parent):
+    """ dn and add modlist of an organizationalUnit """
+    return 'ou=%s,%s' % (name, parent), [
+        ('objectClass', [b'organizationalUnit']),
+        ('ou', [name.encode('utf-8')])]
+
+
+def role(name, parent):
+    """ dn and add modlist of an organizationalRole """
+    return 'cn=%s,%s' % (name, parent), [
+        ('objectClass', [b'organizationalRole']),
+        ('cn', [name.encode('utf-8')])]
+
+
+def addAll(c, entries):
+    """ add the (dn, modlist) entries, parents first, keeping WINDOW adds
+    in flight """
+    inflight = []
+    for dn, modlist in entries:
+        inflight.append(c.add_ext(dn, modlist))
+        if len(inflight) >= WINDOW:
+            c.result3(inflight.pop(0))
+    for msgid in inflight:
+        c.result3(msgid)
+
+
+def deleteTree(c, dn):
+    """ delete dn and everything below it """
+    try:
+        found = c.search_s(dn, ldap.SCOPE_SUBTREE, '(objectClass=*)',
+                           ['1.1'])
+    except ldap.NO_SUCH_OBJECT:
+        return
+    # deepest first
+    for child in sorted([d for d, _a in found], key=len, reverse=True):
+        c.delete_s(child)
+
+
+def chain(parent, depth):
+    """ the entries of a chain of depth nested units below parent, and the
+    ids to traverse to the last one """
+    entries, ids = [], []
+    for level in range(depth):
+        dn, modlist = ou('level%d' % level, parent)
+        entries.append((dn, modlist))
+        ids.append('ou=level%d' % level)
+        parent = dn
+    return entries, ids
+
+
+def tree(parent, fanout, depth):
+    """ the entries of a tree of depth levels of fanout children """
+    entries = []
+    level = [parent]
+    for _i in range(depth):
+        below = []
+        for dn in level:
+            for n in range(fanout):
+                child, modlist = ou('n%d' % n, dn)
+                entries.append((child, modlist))
+                below.append(child)
+        level = below
+    return entries
+
+
+# Measuring
+
+def operations(conn):
+    """ the number of operations conn sent so far """
+    stats = conn.getStatistics()['operations']
+    return sum([op['count'] for op in stats.values()])
+
+
+def measure(name, conn, func, ops, repeat, setup=None, **params):
+    """ Run func() repeat times (calling setup() before each run, not
+    timed), each run doing ops operations, and return the result: best and
+    median time, operations per second, round trips to the server per run,
+    and with tracemalloc, allocations and peak memory of the last run """
+    times = []
+    trips = 0
+    allocations = peak = None
+    for i in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        last = i == repeat - 1
+        if last and tracemalloc is not None:
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+        start_ops = operations(conn)
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+        trips = operations(conn) - start_ops
+        if last and tracemalloc is not None:
+            after = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            allocations = sum([max(s.count_diff, 0) for s in
+                               after.compare_to(before, 'lineno')])
+    times.sort()
+    best = times[0]
+    result = {
+        'name': name,
+        'params': params,
+        'ops': ops,
+        'repeat': repeat,
+        'best': best,
+        'median': times[len(times) // 2],
+        'ops_per_sec': best and ops / best or None,
+        'round_trips': trips,
+        'allocations': allocations,
+        'peak_memory': peak,
+    }
+    print('%-28s %-24s %12.1f ops/s %8d trips %12s bytes peak' % (
+        name, ' '.join(['%s=%s' % kv for kv in sorted(params.items())]),
+        result['ops_per_sec'] or 0, trips, peak))
+    return result
+
+
+# Benchmarks
+
+class Bench(object):
+    """ the benchmarks, run against a connection factory """
+
+    def __init__(self, args, connect, raw):
+        self.args = args
+        self.connect = connect          # transactional -> ZLDAPConnection
+        self.raw = raw                  # an LDAPObject for the fixtures
+        self.top = 'ou=zldapbench,%s' % args.base
+        self.results = []
+
+    def run(self):
+        """ run everything """
+        args = self.args
+        deleteTree(self.raw, self.top)
+        addAll(self.raw, [ou('zldapbench', args.base)])
+        try:
+            self.reads()
+            self.listing()
+            self.traversal()
+            self.commit()
+            self.recursiveDelete()
+        finally:
+            deleteTree(self.raw, self.top)
+        return self.results
+
+    def reads(self):
+        """ getEntry and hasEntry on one entry """
+        conn = self.connect(False)
+        dn, modlist = role('reader', self.top)
+        addAll(self.raw, [(dn, modlist)])
+        count = self.args.count
+
+        def getEntry():
+            for _i in range(count):
+                conn.getEntry(dn)
+
+        def hasEntry():
+            for _i in range(count):
+                conn.hasEntry(dn)
+
+        self.results.append(measure('getEntry', conn, getEntry, count,
+                                    self.args.repeat))
+        self.results.append(measure('hasEntry', conn, hasEntry, count,
+                                    self.args.repeat))
+
+    def listing(self):
+        """ getSubEntries on containers of each size """
+        conn = self.connect(False)
+        for size in self.args.sizes:
+            parent, modlist = ou('list%d' % size, self.top)
+            addAll(self.raw, [(parent, modlist)] +
+                   [role('child%d' % n, parent) for n in range(size)])
+            self.results.append(measure(
+                'getSubEntries', conn, lambda: conn.getSubEntries(parent),
+                size, self.args.repeat, children=size))
+
+    def traversal(self):
+        """ URL traversal from the (cached) root entry down chains of each
+        depth """
+        conn = self.connect(False)
+        for depth in self.args.depths:
+            parent, modlist = ou('chain%d' % depth, self.top)
+            entries, ids = chain(parent, depth)
+            addAll(self.raw, [(parent, modlist)] + entries)
+            ids = ['ou=zldapbench', 'ou=chain%d' % depth] + ids
+
+            def traverse():
+                for _i in range(self.args.count):
+                    ob = conn.getRoot()
+                    for entry_id in ids:
+                        ob = ob.__bobo_traverse__(None, entry_id)
+
+            self.results.append(measure(
+                'traversal', conn, traverse, self.args.count,
+                self.args.repeat, depth=depth))
+
+    def commit(self):
+        """ commit transactions modifying N entries """
+        conn = self.connect(True)
+        for size in self.args.commits:
+            parent, modlist = ou('commit%d' % size, self.top)
+            addAll(self.raw, [(parent, modlist)] +
+                   [role('child%d' % n, parent) for n in range(size)])
+            serial = [0]
+
+            def modify():
+                serial[0] += 1
+                transaction.begin()
+                for entry in conn.getSubEntries(parent):
+                    entry.setattrs(description=['run %d' % serial[0]])
+                transaction.commit()
+
+            self.results.append(measure(
+                'commit', conn, modify, size, self.args.repeat,
+                entries=size))
+
+    def recursiveDelete(self):
+        """ delete a tree through deleteSubentry() and commit """
+        conn = self.connect(True)
+        fanout, depth = self.args.tree
+        parent, modlist = ou('delete', self.top)
+        addAll(self.raw, [(parent, modlist)])
+        subtree = 'ou=doomed,%s' % parent
+        entries = [ou('doomed', parent)] + tree(subtree, fanout, depth)
+
+        def setup():
+            deleteTree(self.raw, subtree)
+            addAll(self.raw, entries)
+
+        def delete():
+            transaction.begin()
+            conn.getEntry(parent, conn).deleteSubentry('ou=doomed')
+            transaction.commit()
+
+        self.results.append(measure(
+            'recursiveDelete', conn, delete, len(entries), self.args.repeat,
+            setup=setup, fanout=fanout, depth=depth))
+
+
+# Running
+
+def parseArgs(argv):
+    """ the command line arguments """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backend', choices=('memory', 'ldap'),
+                        default='memory')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=389)
+    parser.add_argument('--base', default='dc=example,dc=org')
+    parser.add_argument('--bind-dn', default='')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds per round trip (memory backend)')
+    parser.add_argument('--sizes', default='10,1000,100000',
+                        help='children listed by getSubEntries')
+    parser.add_argument('--depths', default='1,5,20',
+                        help='traversal depths')
+    parser.add_argument('--commits', default='1,10,100',
+                        help='entries modified per commit')
+    parser.add_argument('--tree', default='5,3',
+                        help='fanout,depth of the deleted tree')
+    parser.add_argument('--count', type=int, default=1000,
+                        help='calls per run of getEntry, hasEntry and '
+                        'traversal')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default=RESULTS)
+    parser.add_argument('--compare', help='an earlier result file')
+    args = parser.parse_args(argv)
+    for name in ('sizes', 'depths', 'commits', 'tree'):
+        setattr(args, name, [int(v) for v in getattr(args, name).split(',')])
+    return args
+
+
+def compare(results, path):
+    """ print the change in ops/sec since the results in path """
+    with open(path) as f:
+        earlier = json.load(f)
+
+    def key(result):
+        return result['name'], tuple(sorted(result['params'].items()))
+    before = dict([(key(r), r) for r in earlier['results']])
+    print('\nCompared with %s (%s):' % (path, earlier['version']))
+    for result in results:
+        old = before.get(key(result))
+        if old and old['ops_per_sec'] and result['ops_per_sec']:
+            change = result['ops_per_sec'] / old['ops_per_sec'] - 1
+            print('%-28s %-24s %+8.1f%%' % (
+                result['name'], ' '.join(['%s=%s' % kv for kv in
+                                          sorted(result['params'].items())]),
+                change * 100))
+
+
+def main(argv=None):
+    """ run the benchmarks and store the results """
+    args = parseArgs(argv)
+    if args.backend == 'memory':
+        host, port = 'zldapbench', 389
+        directory = Directory(suffixes=(args.base,), latency=args.latency)
+        directory.load([(args.base, {'objectClass': [b'domain']})])
+        registerBackend(host, port, directory.connect)
+        raw = directory.connect()
+    else:
+        host, port = args.host, args.port
+        raw = ldap.initialize('ldap://%s:%s' % (host, port))
+        raw.simple_bind_s(args.bind_dn, args.password)
+
+    def connect(transactional):
+        return ZLDAPConnection('bench', 'Benchmark', host, port, args.base,
+                               args.bind_dn, args.password, 1, transactional)
+
+    results = Bench(args, connect, raw).run()
+    if args.compare:
+        compare(results, args.compare)
+
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    path = os.path.join(args.output, '%s-%s-%s.json' % (
+        VERSION, args.backend, time.strftime('%Y%m%d-%H%M%S')))
+    with open(path, 'w') as f:
+        json.dump({
+            'version': VERSION,
+            'backend': args.backend,
+            'latency': args.latency,
+            'python': platform.python_version(),
+            'python-ldap': getattr(ldap, '__version__', None),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results,
+        }, f, indent=1, sort_keys=True)
+    print('\nResults written to %s' % path)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
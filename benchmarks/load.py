@@ -0,0 +1,236 @@
+""" Concurrent load on Products.ZLDAPConnection
+
+Drives connections from many threads at once, the way Zope worker threads
+do: every thread has its own copy of the connection object (as it would
+have from its own ZODB connection), hence its own LDAP connection.  Each
+thread runs requests for --duration seconds; a request is a read
+(getEntry, hasEntry or getSubEntries) or, for --writes of them, a
+transaction modifying an entry.  Reported are the throughput, the p50,
+p90 and p99 request latency, how many connections and binds the server
+saw, and the first traceback of every type of error raised.
+
+    python benchmarks/load.py --threads 16 --writes 0.05 --latency 0.001
+    python benchmarks/load.py --backend ldap --base dc=example,dc=org \\
+        --bind-dn cn=admin,dc=example,dc=org --password secret
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import traceback
+
+import ldap
+import transaction
+from ZODB.POSException import ConflictError
+
+from Products.ZLDAPConnection.Backends import registerBackend
+from Products.ZLDAPConnection.MemoryBackend import Directory
+from Products.ZLDAPConnection.ZLDAP import ZLDAPConnection
+
+from bench import addAll, deleteTree, ou, role
+
+
+def percentile(values, fraction):
+    """ the value below which fraction of the (sorted) values are """
+    if not values:
+        return None
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class Worker(threading.Thread):
+    """ a worker thread running requests against its own connection """
+
+    def __init__(self, load, seed):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.load = load
+        self.random = random.Random(seed)
+        self.latencies = []
+        self.reads = self.writes = self.conflicts = self.errors = 0
+        # exception class name -> the traceback of its first occurrence
+        self.tracebacks = {}
+
+    def run(self):
+        load = self.load
+        conn = load.connect()
+        load.ready.wait()
+        while not load.done.is_set():
+            start = time.time()
+            try:
+                if self.random.random() < load.args.writes:
+                    self.write(conn)
+                else:
+                    self.read(conn)
+            except ConflictError:
+                transaction.abort()
+                self.conflicts += 1
+            except Exception as exc:
+                self.tracebacks.setdefault(exc.__class__.__name__,
+                                           traceback.format_exc())
+                transaction.abort()
+                self.errors += 1
+            self.latencies.append(time.time() - start)
+        load.connections.append(conn)
+
+    def read(self, conn):
+        """ one read request """
+        dn = self.random.choice(self.load.entries)
+        choice = self.random.random()
+        if choice < 0.6:
+            conn.getEntry(dn).get('cn')
+        elif choice < 0.9:
+            conn.hasEntry(dn)
+        else:
+            conn.getSubEntries(self.load.container)
+        self.reads += 1
+
+    def write(self, conn):
+        """ one transaction modifying an entry """
+        dn = self.random.choice(self.load.entries)
+        transaction.begin()
+        conn.getEntry(dn, conn).setattrs(
+            description=['%s %s' % (self.name, time.time())])
+        transaction.commit()
+        self.writes += 1
+
+
+class Load(object):
+    """ the load test """
+
+    def __init__(self, args, connect, raw, directory=None):
+        self.args = args
+        self.connect = connect
+        self.raw = raw
+        self.directory = directory
+        self.container = 'ou=zldapload,%s' % args.base
+        self.entries = ['cn=entry%d,%s' % (n, self.container)
+                        for n in range(args.entries)]
+        self.ready = threading.Event()
+        self.done = threading.Event()
+        self.connections = []
+
+    def run(self):
+        """ run the threads for the duration and return the report """
+        args = self.args
+        deleteTree(self.raw, self.container)
+        addAll(self.raw, [ou('zldapload', args.base)] +
+               [role('entry%d' % n, self.container)
+                for n in range(args.entries)])
+        try:
+            workers = [Worker(self, n) for n in range(args.threads)]
+            for worker in workers:
+                worker.start()
+            start = time.time()
+            self.ready.set()
+            time.sleep(args.duration)
+            self.done.set()
+            for worker in workers:
+                worker.join()
+            elapsed = time.time() - start
+        finally:
+            deleteTree(self.raw, self.container)
+        return self.report(workers, elapsed)
+
+    def report(self, workers, elapsed):
+        """ the results, as a dictionary """
+        latencies = sorted([t for w in workers for t in w.latencies])
+        requests = len(latencies)
+        tracebacks = {}
+        for w in workers:
+            for name, tb in w.tracebacks.items():
+                tracebacks.setdefault(name, tb)
+        operations = {}
+        for conn in self.connections:
+            for op, stats in conn.getStatistics()['operations'].items():
+                operations[op] = operations.get(op, 0) + stats['count']
+        report = {
+            'threads': self.args.threads,
+            'writes': self.args.writes,
+            'latency': self.args.latency,
+            'duration': elapsed,
+            'requests': requests,
+            'throughput': requests / elapsed,
+            'reads': sum([w.reads for w in workers]),
+            'commits': sum([w.writes for w in workers]),
+            'conflicts': sum([w.conflicts for w in workers]),
+            'errors': sum([w.errors for w in workers]),
+            'error_tracebacks': tracebacks,
+            'p50_ms': requests and percentile(latencies, 0.5) * 1000,
+            'p90_ms': requests and percentile(latencies, 0.9) * 1000,
+            'p99_ms': requests and percentile(latencies, 0.99) * 1000,
+            'connections': operations.get('reconnect', 0),
+            'binds': operations.get('bind', 0),
+            'operations': operations,
+        }
+        if self.directory is not None:
+            # as seen by the server, including the fixtures' connection
+            report['server_connections'] = self.directory.connections
+            report['server_binds'] = self.directory.binds
+        return report
+
+
+def parseArgs(argv):
+    """ the command line arguments """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backend', choices=('memory', 'ldap'),
+                        default='memory')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=389)
+    parser.add_argument('--base', default='dc=example,dc=org')
+    parser.add_argument('--bind-dn', default='')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--latency', type=float, default=0.0005,
+                        help='seconds per round trip (memory backend)')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='seconds')
+    parser.add_argument('--writes', type=float, default=0.1,
+                        help='fraction of requests that write')
+    parser.add_argument('--entries', type=int, default=1000)
+    parser.add_argument('--transactional', type=int, default=1)
+    parser.add_argument('--json', action='store_true',
+                        help='print the report as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """ run the load test and print the report """
+    args = parseArgs(argv)
+    directory = None
+    if args.backend == 'memory':
+        host, port = 'zldapload', 389
+        directory = Directory(suffixes=(args.base,), latency=args.latency)
+        directory.load([(args.base, {'objectClass': [b'domain']})])
+        registerBackend(host, port, directory.connect)
+        raw = directory.connect()
+    else:
+        host, port = args.host, args.port
+        raw = ldap.initialize('ldap://%s:%s' % (host, port))
+        raw.simple_bind_s(args.bind_dn, args.password)
+
+    def connect():
+        return ZLDAPConnection('load', 'Load', host, port, args.base,
+                               args.bind_dn, args.password, 1,
+                               args.transactional)
+
+    report = Load(args, connect, raw, directory).run()
+    if args.json:
+        print(json.dumps(report, indent=1, sort_keys=True))
+        return
+    print('%(requests)d requests in %(duration).1fs from %(threads)d '
+          'threads: %(throughput).1f/s' % report)
+    print('latency p50 %(p50_ms).2fms, p90 %(p90_ms).2fms, '
+          'p99 %(p99_ms).2fms' % report)
+    print('%(reads)d reads, %(commits)d commits, %(conflicts)d conflicts, '
+          '%(errors)d errors' % report)
+    print('%(connections)d connections opened, %(binds)d binds' % report)
+    for name, tb in sorted(report['error_tracebacks'].items()):
+        print('\nfirst %s:\n%s' % (name, tb.rstrip()))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
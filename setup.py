@@ -32,6 +32,8 @@ setup(name=NAME,
       install_requires=[
           'setuptools',
           'python-ldap',
+          'zope.component',
+          'zope.interface',
       ],
       extras_require={
           'test': [